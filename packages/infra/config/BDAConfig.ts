@@ -26,10 +26,52 @@ export const standardOutputConfiguration = {
     }
 }
 
+// BDA job admission: maxConcurrentBatches x maxInFlightPerBatch should stay
+// within the account's concurrent data automation job quota
+export const bdaSchedulerConfig = {
+    // Each priority class has its own upload queue drained by at most this many concurrent
+    // batches (2 is the event source minimum); their sum x maxInFlightPerBatch bounds
+    // concurrent BDA jobs. Mirrored by QUEUE_CONCURRENCY in bda_scheduler.py.
+    maxConcurrentBatches: { urgent: 3, standard: 2, bulk: 2 },
+    maxInFlightPerBatch: 3,
+    // How often orphaned jobs in the BDA job ledger are swept and finished
+    ledgerSweepMinutes: 15,
+}
+
+// Regions BDA jobs are spread over, least loaded and healthiest first. A region
+// other than the project's needs its own projectArn; profile defaults to the
+// geography's cross-region profile (e.g. us.data-automation-v1)
+export const bdaRoutingConfig = {
+    routes: [
+        { region: 'us-east-1' },
+        // { region: 'us-west-2', projectArn: 'arn:aws:bedrock:us-west-2:<account>:data-automation-project/<id>' },
+    ],
+}
+
 export const sampleBlueprints = {
     'Invoice': 'arn:aws:bedrock:us-east-1:aws:blueprint/bedrock-data-automation-public-invoice',
 }
 
+// Blueprints attached to the BDA project; only these are pinned for a document or
+// remembered for a vendor
+export const projectBlueprints = [sampleBlueprints['Invoice']]
+
+// Blueprint pinned per pre-classified document class (invoice, utility_bill, w2,
+// bank_statement), one of projectBlueprints; classes left out run against every
+// blueprint in the project
+export const documentBlueprints = {
+    invoice: { blueprintArn: projectBlueprints[0] },
+}
+
+// Local extraction of known vendors' digital invoices with templates learned from
+// BDA results; below minConfidence the invoice goes to BDA and the template is relearned.
+// Fields are matched through invoice_fields.FIELD_ALIASES, so templates follow whichever
+// invoice blueprint documentBlueprints pins and extract into that blueprint's keys.
+export const vendorTemplateConfig = {
+    enabled: true,
+    minConfidence: 0.9,
+}
+
 export const customBlueprint = {
     'ComprehensiveInvoice': `{
         "$schema": "http://json-schema.org/draft-07/schema#",
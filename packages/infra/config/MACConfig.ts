@@ -26,16 +26,26 @@ export const MACCollaborationInstruction = {
     'VendorIdentificationAgent': "Use this collaborator for vendor identification, data consolidation, and SAP form generation. This agent maps vendors from invoice data, creates production-ready CSV files, and generates SAP data input forms. Use this agent when you need to identify vendors, consolidate invoice data, or generate structured output for SAP systems."
 }
 
+// Incremental Parquet compaction of stored BDA results (bda-analytics/)
+export const analyticsConfig = {
+    compactionIntervalMinutes: 60,
+}
+
 export const InvoiceProcessingActionGroup: CfnAgent.FunctionSchemaProperty = {
     "functions": [
         {
             "name": "verify_invoice_documents",
-            "description": "Retrieves the extracted JSON information from uploaded invoice documents. Takes the document name as input parameter and returns a JSON object representing the extracted structured data from the invoice document.\n - document_class: Document type classification (invoice, receipt, etc.)\n - confidence: Classification confidence score\n - inference_result: Extracted invoice information including vendor, amounts, dates, line items\nReturns detailed document extraction and validation results for invoice processing documents with all required fields as specified in the agent instructions.",
+            "description": "Retrieves the extracted JSON information from uploaded invoice documents. Takes the document name(s) as input parameter and returns, for each document, a status and the extracted structured data from the invoice document.\n - document_class: Document type classification (invoice, receipt, etc.)\n - confidence: Classification confidence score\n - inference_result: Extracted invoice information including vendor, amounts, dates, line items\n - validation: Arithmetic consistency checks (line items vs total, tax reconciliation) with an anomaly score\nReturns detailed document extraction and validation results for invoice processing documents with all required fields as specified in the agent instructions.",
             "parameters": {
                 "document": {
                     "description": "Comma-separated list of invoice documents to be verified and processed.",
                     "type": "string",
                     "required": true
+                },
+                "refresh": {
+                    "description": "Set to true to fetch the full extraction again for documents already summarized earlier in this session",
+                    "type": "string",
+                    "required": false
                 }
             }
         },
@@ -44,7 +54,7 @@ export const InvoiceProcessingActionGroup: CfnAgent.FunctionSchemaProperty = {
             "description": "Record the extracted invoice details in JSON format. The function stores comprehensive invoice information including vendor details, payment terms, and line items.\nExpected JSON format:\n{\n   \"invoice_details\": {\n       \"vendor\": \"vendor name\",\n       \"invoice_date\": \"YYYY-MM-DD\",\n       \"payment_terms\": \"payment terms description\",\n       \"due_date\": \"YYYY-MM-DD\",\n       \"currency\": \"currency code\",\n       \"invoice_total_amount\": \"numeric value\",\n       \"special_remarks\": \"any special remarks from vendor\"\n   },\n   \"vendor_banking_details\": {\n       \"bank_account\": \"vendor's bank account number\",\n       \"bank_code\": \"bank code\",\n       \"swift_code\": \"SWIFT code\"\n   },\n   \"line_items\": [\n       {\n           \"description\": \"item description\",\n           \"amount\": \"item amount\"\n       }\n   ],\n   \"utility_details\": {\n       \"meter_number\": \"meter number if applicable\",\n       \"delta_readings\": \"delta of readings for water bills\"\n   }\n}",
             "parameters": {
                 "invoice_data": {
-                    "description": "JSON string containing the complete invoice details including vendor information, payment terms, line items, and banking details",
+                    "description": "JSON string containing the complete invoice details including vendor information, payment terms, line items, and banking details. To record several invoices at once, pass a JSON list of such objects, each with its own invoice_id field",
                     "type": "string",
                     "required": true
                 },
@@ -52,6 +62,11 @@ export const InvoiceProcessingActionGroup: CfnAgent.FunctionSchemaProperty = {
                     "description": "The invoice ID for tracking and reference",
                     "type": "string",
                     "required": true
+                },
+                "allow_duplicate": {
+                    "description": "Set to true to record the invoice even when it matches a previously recorded invoice (same supplier and invoice number, or similar amount and date)",
+                    "type": "string",
+                    "required": false
                 }
             }
         },
@@ -60,7 +75,7 @@ export const InvoiceProcessingActionGroup: CfnAgent.FunctionSchemaProperty = {
             "description": "Retrieves the list of known vendors from the system database for vendor identification and mapping purposes. This function helps identify and match vendors from invoice data against existing vendor records.",
             "parameters": {
                 "search_criteria": {
-                    "description": "Optional search criteria to filter vendors (e.g., vendor name, category, or other identifying information)",
+                    "description": "Optional search criteria to filter vendors (e.g., vendor name, category, or other identifying information). A vendor name as printed on the invoice is fuzzy-matched against the supplier master, returning supplier codes with a similarity score and confidence",
                     "type": "string",
                     "required": false
                 }
@@ -81,6 +96,84 @@ export const InvoiceProcessingActionGroup: CfnAgent.FunctionSchemaProperty = {
                     "required": false
                 }
             }
+        },
+        {
+            "name": "verify_bank_details",
+            "description": "Checks an invoice's bank account, bank code and SWIFT code against the supplier master and flags when they belong to a different supplier than the invoice vendor or are not on file for that vendor. Use this before recording an invoice instead of judging bank details yourself.",
+            "parameters": {
+                "document": {
+                    "description": "Invoice document name whose extracted vendor and bank details should be checked",
+                    "type": "string",
+                    "required": false
+                },
+                "vendor": {
+                    "description": "Vendor name on the invoice; overrides the extracted vendor",
+                    "type": "string",
+                    "required": false
+                },
+                "bank_account": {
+                    "description": "Bank account number; overrides the extracted account",
+                    "type": "string",
+                    "required": false
+                },
+                "bank_code": {
+                    "description": "Bank code; overrides the extracted bank code",
+                    "type": "string",
+                    "required": false
+                },
+                "swift_code": {
+                    "description": "SWIFT/BIC code; overrides the extracted SWIFT code",
+                    "type": "string",
+                    "required": false
+                }
+            }
+        },
+        {
+            "name": "get_stored_result",
+            "description": "Reads part of a stored document result when an earlier response was truncated. Pass the full_result_key or result_key from that response and the dotted path of the part you need, for example inference_result.line_items or documents.invoice1.data.inference_result.",
+            "parameters": {
+                "result_key": {
+                    "description": "S3 key given as full_result_key or result_key in an earlier response",
+                    "type": "string",
+                    "required": true
+                },
+                "path": {
+                    "description": "Dotted path into the stored JSON; list items by index, e.g. inference_result.line_items.0. Empty for the whole result",
+                    "type": "string",
+                    "required": false
+                }
+            }
+        },
+        {
+            "name": "query_invoices",
+            "description": "Answers aggregate questions across all processed invoices, such as the total owed to a vendor in a period or spend per month. Returns a summary (invoice count and total amount per currency) plus either grouped totals or the most recent matching invoices; amounts in different currencies are never added together. Compute relative periods such as 'this quarter' into explicit dates first.",
+            "parameters": {
+                "vendor": {
+                    "description": "Vendor name or part of it to filter on",
+                    "type": "string",
+                    "required": false
+                },
+                "date_from": {
+                    "description": "Earliest invoice date to include, in YYYY-MM-DD format",
+                    "type": "string",
+                    "required": false
+                },
+                "date_to": {
+                    "description": "Latest invoice date to include, in YYYY-MM-DD format",
+                    "type": "string",
+                    "required": false
+                },
+                "currency": {
+                    "description": "ISO currency code such as USD or HKD to restrict the invoices and totals to",
+                    "type": "string",
+                    "required": false
+                },
+                "group_by": {
+                    "description": "How to aggregate: none (list invoices), vendor, month, currency or vendor_month; groups are always split by currency",
+                    "type": "string",
+                    "required": false
+                }
+            }
         }
     ]
 }
@@ -1,5 +1,9 @@
 import * as iam from "aws-cdk-lib/aws-iam";
 import * as s3 from "aws-cdk-lib/aws-s3";
+import * as lambda from "aws-cdk-lib/aws-lambda";
+import * as path from "path";
+import { Construct } from "constructs";
+import { lambdaRuntime } from "../config/AppConfig";
 
 /** set the HTTPS only policy  */
 export function setSecureTransport(bucket: s3.Bucket) {
@@ -18,3 +22,22 @@ export function setSecureTransport(bucket: s3.Bucket) {
         })
     );
 }
+
+/**
+ * Layer with only the Python modules of lambda/python/layers/common (key layout, result
+ * streaming, metrics, invoice field aliases), for functions that share them without needing
+ * the resolver layer's dependencies; each function keeps what the modules import in its own
+ * requirements.txt
+ */
+export function commonModulesLayer(scope: Construct, id: string) {
+    return new lambda.LayerVersion(scope, id, {
+        code: lambda.Code.fromAsset(path.join(__dirname, "..", "lambda", "python", "layers", "common"), {
+            bundling: {
+                image: lambdaRuntime.bundlingImage,
+                command: ["bash", "-c", "mkdir -p /asset-output/python && cp /asset-input/*.py /asset-output/python/"],
+            },
+        }),
+        description: "Python modules shared by the document processing functions",
+        compatibleRuntimes: [lambdaRuntime],
+    });
+}
@@ -0,0 +1,285 @@
+import os
+import json
+import math
+import time
+import random
+import threading
+
+import boto3
+from botocore.config import Config
+from botocore.exceptions import ClientError, EndpointConnectionError, ConnectTimeoutError
+
+from metrics import emit_metrics
+
+ACCOUNT_ID = os.environ.get('ACCOUNT_ID', None)
+DATA_PROJECT_ARN = os.environ.get('DATA_PROJECT_ARN', None)
+# Regions jobs may be submitted to, e.g. [{"region": "us-east-1"}, {"region": "us-west-2", "projectArn": "..."}].
+# A route without a projectArn uses DATA_PROJECT_ARN when that project lives in the same region.
+ROUTES = json.loads(os.environ.get('BDA_ROUTES', '') or '[{"region": "us-east-1"}]')
+# Cross-region inference profile per geography, unless a route names its own
+GEO_PROFILES = {'us': 'us.data-automation-v1', 'eu': 'eu.data-automation-v1', 'ap': 'apac.data-automation-v1'}
+# Prior for a job's duration until a region has completed some; also the floor of the estimate
+DEFAULT_JOB_SECONDS = float(os.environ.get('BDA_DEFAULT_JOB_SECONDS', '30'))
+# Weight of the latest observation in the per-region moving averages
+EWMA_ALPHA = 0.2
+# Error rates fade with this half-life so a region that recovered is tried again
+ERROR_HALF_LIFE_SECONDS = float(os.environ.get('BDA_ERROR_HALF_LIFE_SECONDS', '120'))
+# A region that throttled or was unreachable is only used as a last resort for this long
+COOLDOWN_SECONDS = float(os.environ.get('BDA_REGION_COOLDOWN_SECONDS', '30'))
+MIN_SUCCESS_RATE = 0.05
+# Submission errors after which no job was started, so trying another region cannot duplicate work
+FAILOVER_CODES = {
+    'throttlingexception', 'throttling', 'toomanyrequestsexception', 'servicequotaexceededexception',
+    'serviceunavailableexception', 'internalserverexception',
+}
+
+
+def is_failover_error(error):
+    if isinstance(error, (EndpointConnectionError, ConnectTimeoutError)):
+        return True
+    if isinstance(error, ClientError):
+        return error.response.get('Error', {}).get('Code', '').lower() in FAILOVER_CODES
+    return False
+
+
+def arn_region(arn):
+    parts = (arn or '').split(':')
+    return parts[3] if len(parts) > 3 else None
+
+
+def profile_arn(region, profile=None):
+    profile = profile or GEO_PROFILES.get(region.split('-')[0], GEO_PROFILES['us'])
+    return f"arn:aws:bedrock:{region}:{str(ACCOUNT_ID)}:data-automation-profile/{profile}"
+
+
+def create_client(region):
+    # One quick retry in-region; anything more is better spent failing over
+    config = Config(region_name=region, retries=dict(max_attempts=2, mode='standard'))
+    return boto3.client("bedrock-data-automation-runtime", config=config)
+
+
+class RegionRoute:
+    """
+    One region's runtime client plus what this container has seen of it: jobs in
+    flight, a moving average of job duration and a decaying submission error rate
+    """
+
+    def __init__(self, region, client, profile_arn, project_arn=None, clock=time.monotonic):
+        self.region = region
+        self.client = client
+        self.profile_arn = profile_arn
+        self.project_arn = project_arn
+        self.clock = clock
+        self.in_flight = 0
+        self.job_seconds = DEFAULT_JOB_SECONDS
+        self._error_rate = 0.0
+        self._error_updated = clock()
+        self.cooldown_until = 0.0
+
+    def error_rate(self):
+        elapsed = self.clock() - self._error_updated
+        return self._error_rate * 0.5 ** (elapsed / ERROR_HALF_LIFE_SECONDS)
+
+    def record_outcome(self, failed):
+        self._error_rate = (1 - EWMA_ALPHA) * self.error_rate() + EWMA_ALPHA * (1.0 if failed else 0.0)
+        self._error_updated = self.clock()
+
+    def record_duration(self, seconds):
+        self.job_seconds = max((1 - EWMA_ALPHA) * self.job_seconds + EWMA_ALPHA * seconds, 1.0)
+
+    def cooling(self):
+        return self.clock() < self.cooldown_until
+
+    def expected_seconds(self):
+        """
+        Expected time until a new job here completes successfully
+        """
+        return (self.in_flight + 1) * self.job_seconds / max(1.0 - self.error_rate(), MIN_SUCCESS_RATE)
+
+
+class BDARouter:
+    """
+    Spreads BDA submissions over the configured regions. Each job goes to the
+    region with the lowest expected completion time given its in-flight load,
+    recent job durations and error rate; a submission that is throttled or
+    cannot reach its region fails over to the next one. Status polls go to the
+    region in the invocation ARN, so jobs recorded by another invocation resolve too.
+    """
+
+    def __init__(self, routes, client_factory=create_client, clock=time.monotonic, emit=True):
+        self.routes = {route.region: route for route in routes}
+        self.client_factory = client_factory
+        self.clock = clock
+        self.emit = emit
+        self.lock = threading.Lock()
+        self.started = {}
+
+    def _metric(self, metrics, region, units=None):
+        if self.emit:
+            emit_metrics(metrics, units=units, dimensions={'Region': region})
+
+    def candidates(self):
+        """
+        Routes in the order they would be tried; cooling routes last
+        """
+        with self.lock:
+            return sorted(self.routes.values(), key=lambda route: (route.cooling(), route.expected_seconds()))
+
+    def route_for(self, invocation_arn):
+        region = arn_region(invocation_arn)
+        with self.lock:
+            if region not in self.routes:
+                # Submitted under an earlier routing configuration
+                self.routes[region] = RegionRoute(region, self.client_factory(region), profile_arn(region), clock=self.clock)
+            return self.routes[region]
+
+    def submit(self, payload, data_project_arn=None):
+        """
+        Start a BDA job in the best available region and return its invocation ARN
+        """
+        last_error = None
+        for route in self.candidates():
+            project_arn = route.project_arn or data_project_arn
+            if arn_region(project_arn) != route.region:
+                continue
+            request = {
+                **payload,
+                "dataAutomationConfiguration": {
+                    **payload.get("dataAutomationConfiguration", {}),
+                    "dataAutomationProjectArn": project_arn,
+                },
+                "dataAutomationProfileArn": route.profile_arn,
+            }
+            if any(arn_region(blueprint['blueprintArn']) != route.region for blueprint in payload.get("blueprints", [])):
+                # Blueprints are regional; elsewhere the job falls back to the project's own matching
+                request.pop("blueprints")
+            try:
+                response = route.client.invoke_data_automation_async(**request)
+            except Exception as e:
+                if not is_failover_error(e):
+                    raise
+                print(f"BDA submission to {route.region} failed: {str(e)}")
+                with self.lock:
+                    route.record_outcome(failed=True)
+                    route.cooldown_until = self.clock() + COOLDOWN_SECONDS
+                self._metric({'BDASubmitErrors': 1}, route.region)
+                last_error = e
+                continue
+            with self.lock:
+                route.record_outcome(failed=False)
+                route.in_flight += 1
+                self.started[response['invocationArn']] = self.clock()
+            self._metric({'BDASubmissions': 1, 'BDAFailovers': int(last_error is not None)}, route.region)
+            return response['invocationArn']
+        if last_error is None:
+            raise ValueError('No BDA route has a data automation project in its region')
+        raise last_error
+
+    def get_status(self, invocation_arn):
+        """
+        get_data_automation_status against the job's region; terminal statuses update that region's averages
+        """
+        route = self.route_for(invocation_arn)
+        response = route.client.get_data_automation_status(invocationArn=invocation_arn)
+        if response['status'] in ('Success', 'ServiceError', 'ClientError'):
+            with self.lock:
+                started = self.started.pop(invocation_arn, None)
+                if started is not None:
+                    route.in_flight -= 1
+                    if response['status'] == 'Success':
+                        route.record_duration(self.clock() - started)
+                    # Client errors are the document's fault, not the region's
+                    route.record_outcome(failed=response['status'] == 'ServiceError')
+            if started is not None and response['status'] == 'Success':
+                self._metric({'BDAJobTime': round(self.clock() - started, 1)}, route.region, units={'BDAJobTime': 'Seconds'})
+        return response
+
+
+def create_router(routes=None, data_project_arn=DATA_PROJECT_ARN, client_factory=create_client, **kwargs):
+    """
+    Build a router from BDA_ROUTES-style route dicts
+    """
+    built = []
+    for route in routes if routes is not None else ROUTES:
+        region = route['region']
+        project_arn = route.get('projectArn')
+        if not project_arn and arn_region(data_project_arn) in (region, None):
+            project_arn = data_project_arn
+        built.append(RegionRoute(region, client_factory(region), profile_arn(region, route.get('profile')),
+                                 project_arn, clock=kwargs.get('clock', time.monotonic)))
+    return BDARouter(built, client_factory=client_factory, **kwargs)
+
+
+class StubRegionalClient:
+    """
+    Stand-in for one region's runtime client on a virtual clock; throttled(now)
+    decides whether a submission is rejected and service_time(now) how long a job runs
+    """
+
+    def __init__(self, region, clock, service_time, throttled=lambda now: False):
+        self.region = region
+        self.clock = clock
+        self.service_time = service_time
+        self.throttled = throttled
+        self.jobs = {}
+
+    def invoke_data_automation_async(self, **payload):
+        if self.throttled(self.clock()):
+            raise ClientError({'Error': {'Code': 'ThrottlingException', 'Message': 'Rate exceeded'}},
+                              'InvokeDataAutomationAsync')
+        arn = f"arn:aws:bedrock:{self.region}:000000000000:data-automation-invocation/{len(self.jobs)}"
+        self.jobs[arn] = self.clock() + self.service_time(self.clock())
+        return {'invocationArn': arn}
+
+    def get_data_automation_status(self, invocationArn):
+        return {'status': 'Success' if self.clock() >= self.jobs[invocationArn] else 'InProgress'}
+
+
+def simulate(regions, arrivals, poll_interval=5.0):
+    """
+    Submit a job at each arrival time through a router over stubbed regions
+    ({region: (service_time, throttled)}) and report per-region placement,
+    failed submissions and completion-time percentiles
+    """
+    now = [0.0]
+    clock = lambda: now[0]
+    clients = {region: StubRegionalClient(region, clock, *behaviour) for region, behaviour in regions.items()}
+    router = create_router([{'region': region, 'projectArn': f"arn:aws:bedrock:{region}:0:data-automation-project/p"}
+                            for region in regions], client_factory=clients.get, clock=clock, emit=False)
+    placed = {region: 0 for region in regions}
+    rejected = 0
+    durations = []
+    running = {}
+    for arrival in sorted(arrivals):
+        while running and now[0] + poll_interval <= arrival:
+            now[0] += poll_interval
+            for arn in [arn for arn in running if router.get_status(arn)['status'] == 'Success']:
+                durations.append(now[0] - running.pop(arn))
+        now[0] = max(now[0], arrival)
+        try:
+            arn = router.submit({'inputConfiguration': {}, 'outputConfiguration': {}})
+        except ClientError:
+            rejected += 1
+            continue
+        placed[arn_region(arn)] += 1
+        running[arn] = now[0]
+    while running:
+        now[0] += poll_interval
+        for arn in [arn for arn in running if router.get_status(arn)['status'] == 'Success']:
+            durations.append(now[0] - running.pop(arn))
+    durations.sort()
+    report = {'placed': placed, 'rejected': rejected}
+    for p in (50, 90, 99):
+        report[f"p{p}"] = round(durations[max(0, math.ceil(p / 100.0 * len(durations)) - 1)], 1) if durations else None
+    return report
+
+
+if __name__ == '__main__':
+    # us-east-1 throttles every submission between t=600s and t=1200s and slows down afterwards;
+    # us-west-2 is steadily a little slower than a healthy us-east-1
+    random.seed(7)
+    east = (lambda now: random.uniform(20, 40) * (3 if 1200 <= now < 1800 else 1), lambda now: 600 <= now < 1200)
+    west = (lambda now: random.uniform(30, 50), lambda now: False)
+    workload = [random.uniform(0, 2400) for _ in range(400)]
+    print('single region', json.dumps(simulate({'us-east-1': east}, workload)))
+    print('routed      ', json.dumps(simulate({'us-east-1': east, 'us-west-2': west}, workload)))
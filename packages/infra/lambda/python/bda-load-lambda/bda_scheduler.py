@@ -0,0 +1,266 @@
+import os
+import json
+import math
+import random
+import time
+from collections import deque, defaultdict
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+PRIORITY_CLASSES = ('urgent', 'standard', 'bulk')
+# Share of dispatch slots each class gets while all are backlogged; weighted
+# rather than strict so bulk uploads still progress under steady urgent load
+PRIORITY_WEIGHTS = {'urgent': 8, 'standard': 3, 'bulk': 1}
+# Jobs in flight across one invocation; with the event sources' maximum
+# concurrency this keeps total BDA jobs under the account quota
+MAX_IN_FLIGHT = int(os.environ.get('BDA_MAX_IN_FLIGHT', '3'))
+# Each priority class has its own upload queue drained by at most this many concurrent
+# invocations, so urgent uploads never wait behind a bulk backlog (mirrors BDAConfig)
+QUEUE_CONCURRENCY = {'urgent': 3, 'standard': 2, 'bulk': 2}
+BATCH_SIZE = 10
+# Optional per-tenant weights, e.g. {"finance": 2}; unknown tenants weigh 1
+TENANT_WEIGHTS = json.loads(os.environ.get('TENANT_WEIGHTS', '{}') or '{}')
+DOCUMENTS_PREFIX = "datasets/documents/"
+
+
+def classify_upload(key):
+    """
+    Derive (tenant, priority) from an upload key such as
+    datasets/documents/<tenant>/[urgent|bulk/]<file>; flat uploads use the default tenant
+    """
+    relative = key[len(DOCUMENTS_PREFIX):] if key.startswith(DOCUMENTS_PREFIX) else key
+    folders = relative.split('/')[:-1]
+    tenant = folders[0] if folders and folders[0] not in PRIORITY_CLASSES else 'default'
+    priority = next((folder for folder in folders if folder in PRIORITY_CLASSES), 'standard')
+    return tenant, priority
+
+
+class Job:
+    __slots__ = ('tenant', 'priority', 'payload', 'enqueued_at', 'started_at', 'finished_at')
+
+    def __init__(self, tenant, priority, payload=None, enqueued_at=None):
+        self.tenant = tenant
+        self.priority = priority if priority in PRIORITY_WEIGHTS else 'standard'
+        self.payload = payload
+        # Set when the job waited in a queue before reaching the scheduler
+        self.enqueued_at = enqueued_at
+        self.started_at = self.finished_at = None
+
+    @property
+    def queue_wait(self):
+        return self.started_at - self.enqueued_at
+
+
+class _StrideQueues:
+    """
+    Stride scheduling over named queues: the non-empty queue with the lowest
+    pass value is served next and its pass advances by 1 / weight.
+    """
+
+    def __init__(self, weight_fn, tie_break=None):
+        self.weight_fn = weight_fn
+        self.tie_break = tie_break or (lambda name: name)
+        self.queues = {}
+        self.passes = {}
+        self.virtual_time = 0.0
+
+    def push(self, name, item):
+        queue = self.queues.get(name)
+        if not queue:
+            # A queue that was idle joins at the current virtual time, not with banked credit
+            self.passes[name] = max(self.passes.get(name, 0.0), self.virtual_time)
+            queue = self.queues.setdefault(name, deque())
+        queue.append(item)
+
+    def pop(self):
+        active = [name for name, queue in self.queues.items() if queue]
+        if not active:
+            return None, None
+        name = min(active, key=lambda n: (self.passes[n], self.tie_break(n)))
+        self.virtual_time = self.passes[name]
+        self.passes[name] += 1.0 / self.weight_fn(name)
+        return name, self.queues[name].popleft()
+
+    def __len__(self):
+        return sum(len(queue) for queue in self.queues.values())
+
+
+def wait_percentiles(jobs, percentiles=(50, 90, 99)):
+    """
+    Queue-wait percentiles of finished jobs overall and per priority class and tenant
+    """
+    groups = defaultdict(list)
+    for job in jobs:
+        groups['all'].append(job.queue_wait)
+        groups[f"priority:{job.priority}"].append(job.queue_wait)
+        groups[f"tenant:{job.tenant}"].append(job.queue_wait)
+    report = {}
+    for group, waits in groups.items():
+        waits.sort()
+        report[group] = {'count': len(waits)}
+        for p in percentiles:
+            # Nearest-rank percentile
+            index = max(0, math.ceil(p / 100.0 * len(waits)) - 1)
+            report[group][f"p{p}"] = round(waits[index], 3)
+    return report
+
+
+class FairShareScheduler:
+    """
+    Per-priority-class, per-tenant queues with weighted fair dequeue and a
+    global in-flight cap. Classes share slots by PRIORITY_WEIGHTS; within a
+    class tenants share by their weights, so one tenant's bulk upload cannot
+    starve another tenant's single invoice.
+
+    A scheduler lives for one invocation and orders only the batch it was given;
+    separation between priority classes comes from their separate upload queues.
+    """
+
+    def __init__(self, max_in_flight=MAX_IN_FLIGHT, tenant_weights=None, clock=time.monotonic):
+        self.max_in_flight = max_in_flight
+        self.tenant_weights = TENANT_WEIGHTS if tenant_weights is None else tenant_weights
+        self.clock = clock
+        self.in_flight = 0
+        self.completed = []
+        self._classes = _StrideQueues(lambda name: PRIORITY_WEIGHTS[name], PRIORITY_CLASSES.index)
+        self._tenants = {name: _StrideQueues(lambda tenant: self.tenant_weights.get(tenant, 1))
+                         for name in PRIORITY_CLASSES}
+
+    def submit(self, job):
+        if job.enqueued_at is None:
+            job.enqueued_at = self.clock()
+        tenants = self._tenants[job.priority]
+        tenants.push(job.tenant, job)
+        if len(tenants) == 1:
+            self._classes.push(job.priority, job.priority)
+
+    def pending(self):
+        return sum(len(tenants) for tenants in self._tenants.values())
+
+    def dispatch(self):
+        """
+        Pop jobs in fair order until the in-flight cap is reached
+        """
+        ready = []
+        while self.in_flight < self.max_in_flight:
+            priority, _ = self._classes.pop()
+            if priority is None:
+                break
+            _, job = self._tenants[priority].pop()
+            if len(self._tenants[priority]):
+                self._classes.push(priority, priority)
+            job.started_at = self.clock()
+            self.in_flight += 1
+            ready.append(job)
+        return ready
+
+    def complete(self, job):
+        job.finished_at = self.clock()
+        self.in_flight -= 1
+        self.completed.append(job)
+
+    def wait_percentiles(self, percentiles=(50, 90, 99)):
+        return wait_percentiles(self.completed, percentiles)
+
+
+def run_jobs(scheduler, jobs, worker):
+    """
+    Submit all jobs and run them through worker(job) in scheduler order, at most max_in_flight at a time
+    """
+    for job in jobs:
+        scheduler.submit(job)
+    results = {}
+    running = {}
+    with ThreadPoolExecutor(max_workers=scheduler.max_in_flight) as executor:
+        while scheduler.pending() or running:
+            for job in scheduler.dispatch():
+                running[executor.submit(worker, job)] = job
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                job = running.pop(future)
+                scheduler.complete(job)
+                try:
+                    results[id(job)] = future.result()
+                except Exception as e:
+                    print(f"Job for {job.tenant}/{job.priority} failed: {str(e)}")
+                    results[id(job)] = None
+    return [results[id(job)] for job in jobs]
+
+
+class SimulatedBDA:
+    """
+    Stand-in for the bedrock-data-automation-runtime client on a virtual clock
+    """
+
+    def __init__(self, clock, service_time=lambda payload: random.uniform(20, 60)):
+        self.clock = clock
+        self.service_time = service_time
+        self.jobs = {}
+
+    def invoke_data_automation_async(self, **payload):
+        arn = f"arn:sim:{len(self.jobs)}"
+        self.jobs[arn] = self.clock() + self.service_time(payload)
+        return {'invocationArn': arn}
+
+    def get_data_automation_status(self, invocationArn):
+        return {'status': 'Success' if self.clock() >= self.jobs[invocationArn] else 'InProgress'}
+
+
+def simulate(arrivals, max_in_flight=MAX_IN_FLIGHT, tenant_weights=None, service_time=None, poll_interval=5.0,
+             queue_concurrency=None, batch_size=BATCH_SIZE):
+    """
+    Replay (arrival_time, tenant, priority) uploads against SimulatedBDA on a virtual
+    clock the way they are deployed: one queue per priority class, each drained by up to
+    queue_concurrency[priority] concurrent invocations that take batch_size uploads and
+    run them through their own FairShareScheduler. Returns queue-wait percentiles
+    measured from arrival, so time spent in the queue counts.
+    """
+    queue_concurrency = queue_concurrency or QUEUE_CONCURRENCY
+    now = [0.0]
+    clock = lambda: now[0]
+    bda = SimulatedBDA(clock, service_time) if service_time else SimulatedBDA(clock)
+    queues = {priority: deque() for priority in PRIORITY_CLASSES}
+    batches = {priority: [] for priority in PRIORITY_CLASSES}
+    pending_arrivals = sorted(arrivals)
+    finished = []
+    position = 0
+
+    def busy():
+        return any(queues.values()) or any(batches.values())
+
+    while position < len(pending_arrivals) or busy():
+        while position < len(pending_arrivals) and pending_arrivals[position][0] <= now[0]:
+            arrival, tenant, priority = pending_arrivals[position]
+            job = Job(tenant, priority, enqueued_at=arrival)
+            queues[job.priority].append(job)
+            position += 1
+        for priority, queue in queues.items():
+            while queue and len(batches[priority]) < queue_concurrency[priority]:
+                scheduler = FairShareScheduler(max_in_flight, tenant_weights, clock)
+                for _ in range(min(batch_size, len(queue))):
+                    scheduler.submit(queue.popleft())
+                batches[priority].append((scheduler, {}))
+        for priority, active in batches.items():
+            for scheduler, running in active:
+                for job in scheduler.dispatch():
+                    running[bda.invoke_data_automation_async(tenant=job.tenant)['invocationArn']] = job
+                for arn in [arn for arn in running if bda.get_data_automation_status(arn)['status'] == 'Success']:
+                    scheduler.complete(running.pop(arn))
+            finished.extend(job for scheduler, running in active if not running and not scheduler.pending()
+                            for job in scheduler.completed)
+            batches[priority] = [(scheduler, running) for scheduler, running in active
+                                 if running or scheduler.pending()]
+        if busy():
+            next_arrival = pending_arrivals[position][0] if position < len(pending_arrivals) else math.inf
+            now[0] = min(now[0] + poll_interval, next_arrival)
+        elif position < len(pending_arrivals):
+            now[0] = pending_arrivals[position][0]
+    return wait_percentiles(finished)
+
+
+if __name__ == '__main__':
+    # One department bulk-uploads 300 documents; urgent single invoices arrive meanwhile
+    random.seed(7)
+    workload = [(0.0, 'finance-ops', 'bulk') for _ in range(300)]
+    workload += [(random.uniform(0, 1800), 'procurement', 'standard') for _ in range(40)]
+    workload += [(random.uniform(60, 1800), 'treasury', 'urgent') for _ in range(10)]
+    print(json.dumps(simulate(workload), indent=2))
@@ -0,0 +1,136 @@
+import os
+import re
+import json
+import hashlib
+
+from botocore.exceptions import ClientError
+
+from document_classifier import is_generic_header
+from invoice_fields import FIELD_ALIASES, fold_key
+
+# Blueprint pinned for each document class, e.g. {"invoice": {"blueprintArn": "...", "stage": "LIVE"}};
+# classes without an entry run against every blueprint in the project
+DOCUMENT_BLUEPRINTS = json.loads(os.environ.get('DOCUMENT_BLUEPRINTS', '{}') or '{}')
+# Blueprints attached to the project; vendor history naming any other blueprint (e.g. one the
+# project used before) is ignored. Empty accepts every blueprint.
+PROJECT_BLUEPRINTS = set(json.loads(os.environ.get('PROJECT_BLUEPRINTS', '[]') or '[]'))
+# Pre-classifier score needed before its class is trusted to pin a blueprint
+MIN_HINT_SCORE = float(os.environ.get('MIN_HINT_SCORE', '6'))
+# BDA's own match confidence needed before a vendor's blueprint is remembered
+MIN_HISTORY_CONFIDENCE = float(os.environ.get('MIN_HISTORY_CONFIDENCE', '0.8'))
+HISTORY_PREFIX = "bda-blueprint-history"
+# Upload folder names that state the document class, e.g. datasets/documents/<tenant>/invoices/<file>
+FOLDER_CLASSES = {
+    'invoice': 'invoice', 'invoices': 'invoice',
+    'utility-bill': 'utility_bill', 'utility-bills': 'utility_bill', 'utility_bill': 'utility_bill',
+    'w2': 'w2', 'w-2': 'w2', 'w2s': 'w2',
+    'bank-statement': 'bank_statement', 'bank-statements': 'bank_statement', 'bank_statement': 'bank_statement',
+}
+
+
+def vendor_key(header):
+    """
+    Normalize a letterhead line so the same vendor maps to the same history entry;
+    None for lines many issuers share, which would mix vendors in one entry
+    """
+    if is_generic_header(header):
+        return None
+    normalized = re.sub(r'[^a-z0-9]+', ' ', (header or '').lower()).strip()
+    return normalized or None
+
+
+def extracted_vendor(inference_result):
+    """
+    The vendor name BDA extracted, under whichever of the invoice field aliases the matched blueprint uses
+    """
+    folded = {fold_key(field): value for field, value in (inference_result or {}).items()}
+    for alias in FIELD_ALIASES['vendor']:
+        if isinstance(folded.get(alias), str) and folded[alias].strip():
+            return folded[alias]
+    return None
+
+
+def names_vendor(vendor, vendor_name):
+    """
+    True when every word of the extracted vendor name appears in the letterhead key
+    """
+    words = re.sub(r'[^a-z0-9]+', ' ', (vendor_name or '').lower()).split()
+    return bool(words) and set(words) <= set(vendor.split())
+
+
+def history_key(vendor):
+    return f"{HISTORY_PREFIX}/{hashlib.sha1(vendor.encode('utf-8')).hexdigest()[:24]}.json"
+
+
+def in_project(blueprint_arn):
+    return not PROJECT_BLUEPRINTS or blueprint_arn in PROJECT_BLUEPRINTS
+
+
+def _blueprint(target, source):
+    hint = {'blueprintArn': target['blueprintArn'], 'source': source}
+    if target.get('stage'):
+        hint['stage'] = target['stage']
+    return hint
+
+
+def load_vendor_blueprint(s3, bucket, vendor):
+    try:
+        return json.loads(s3.get_object(Bucket=bucket, Key=history_key(vendor))['Body'].read())
+    except ClientError as e:
+        if e.response['Error']['Code'] in ('NoSuchKey', '404'):
+            return None
+        raise
+
+
+def remember_vendor_blueprint(s3, bucket, vendor, matched_blueprint, vendor_name=None):
+    """
+    Record the blueprint BDA matched for a vendor's document when the match was confident
+    and the letterhead is the vendor BDA extracted, not a title or a customer's name
+    """
+    if not vendor or not matched_blueprint or not matched_blueprint.get('arn'):
+        return False
+    if not in_project(matched_blueprint['arn']):
+        return False
+    if not names_vendor(vendor, vendor_name):
+        return False
+    if (matched_blueprint.get('confidence') or 0) < MIN_HISTORY_CONFIDENCE:
+        return False
+    entry = {'vendor': vendor, 'blueprintArn': matched_blueprint['arn'], 'name': matched_blueprint.get('name')}
+    s3.put_object(Bucket=bucket, Key=history_key(vendor), Body=json.dumps(entry), ContentType='application/json')
+    return True
+
+
+def resolve_blueprint_hint(s3, bucket, key, classification=None):
+    """
+    Pick the blueprint to pin for an upload, or None to let BDA match among the
+    project's blueprints. Sources in order of trust: the blueprint BDA matched for
+    this vendor before, a class-named upload folder, then the pre-classifier's class.
+    """
+    classification = classification or {}
+    vendor = vendor_key(classification.get('header'))
+    if vendor:
+        remembered = load_vendor_blueprint(s3, bucket, vendor)
+        if remembered and in_project(remembered.get('blueprintArn')):
+            return _blueprint(remembered, 'vendor')
+
+    for folder in key.lower().split('/')[:-1]:
+        target = DOCUMENT_BLUEPRINTS.get(FOLDER_CLASSES.get(folder))
+        if target:
+            return _blueprint(target, 'prefix')
+
+    target = DOCUMENT_BLUEPRINTS.get(classification.get('class'))
+    if target and classification.get('score', 0) >= MIN_HINT_SCORE:
+        return _blueprint(target, 'classifier')
+    return None
+
+
+def submission_blueprints(hint):
+    """
+    The blueprints parameter of invoke_data_automation_async for a hint
+    """
+    if not hint:
+        return None
+    blueprint = {'blueprintArn': hint['blueprintArn']}
+    if hint.get('stage'):
+        blueprint['stage'] = hint['stage']
+    return [blueprint]
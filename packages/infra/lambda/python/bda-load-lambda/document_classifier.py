@@ -0,0 +1,149 @@
+import io
+import os
+import re
+
+from pypdf import PdfReader
+
+# Text from the first pages is enough to tell the classes apart and keeps classification to milliseconds
+CLASSIFY_MAX_PAGES = int(os.environ.get('CLASSIFY_MAX_PAGES', '3'))
+# Below this score a document is left to BDA's own blueprint matching
+MIN_CLASS_SCORE = float(os.environ.get('MIN_CLASS_SCORE', '3'))
+# Lines searched for the issuer's name at the top of the first page
+LETTERHEAD_MAX_LINES = 5
+# Formats BDA's document blueprints accept; anything else is junk without further checks
+DOCUMENT_EXTENSIONS = ('.pdf', '.png', '.jpg', '.jpeg', '.tif', '.tiff')
+
+INVOICE = 'invoice'
+UTILITY_BILL = 'utility_bill'
+W2 = 'w2'
+BANK_STATEMENT = 'bank_statement'
+JUNK = 'junk'
+UNKNOWN = 'unknown'
+
+# (pattern, weight) per class, matched against the text layer
+TEXT_SIGNALS = {
+    INVOICE: (
+        (r'\b(tax\s+)?invoice\b', 3), (r'\binvoice\s*(no\.?|number|#|date)', 3), (r'\bbill\s+to\b', 2),
+        (r'\bpurchase\s+order\b|\bp\.?o\.?\s*(no\.?|number|#)', 2), (r'\b(sub\s*total|amount\s+due|balance\s+due)\b', 2),
+        (r'\b(qty|quantity|unit\s+price)\b', 1), (r'\bpayment\s+terms\b|\bnet\s+\d{2}\b', 1), (r'\bremit\s+to\b', 1),
+    ),
+    UTILITY_BILL: (
+        (r'\b(electric(ity)?|gas|water|sewer)\s+(service|usage|charges?)\b', 3), (r'\bkwh\b|\btherms?\b', 3),
+        (r'\bmeter\s+(number|reading|read)\b', 3), (r'\bservice\s+(address|period)\b', 2),
+        (r'\b(previous|current)\s+reading\b', 2), (r'\butility\b', 1), (r'\baccount\s+number\b', 1),
+    ),
+    W2: (
+        (r'\bform\s+w-?2\b|\bw-?2\s+wage\b', 4), (r'\bwage\s+and\s+tax\s+statement\b', 4),
+        (r'\bemployer\s+identification\s+number\b|\b(ein)\b', 2), (r'\bsocial\s+security\s+(wages|tax)\b', 2),
+        (r'\bmedicare\s+(wages|tax)\b', 2), (r'\bfederal\s+income\s+tax\s+withheld\b', 2), (r'\bemployee.s\s+name\b', 1),
+    ),
+    BANK_STATEMENT: (
+        (r'\b(bank|account)\s+statement\b', 4), (r'\b(opening|beginning|closing|ending)\s+balance\b', 3),
+        (r'\bstatement\s+period\b', 2), (r'\b(deposits?|withdrawals?)\b', 1), (r'\brouting\s+number\b', 2),
+        (r'\b(checking|savings)\s+account\b', 2), (r'\bavailable\s+balance\b', 1),
+    ),
+}
+# (pattern, weight) per class, matched against the file name with separators turned into spaces
+NAME_SIGNALS = {
+    INVOICE: ((r'\binv(oice)?\b', 3), (r'\bbill\b', 1), (r'\bpo\b', 1)),
+    UTILITY_BILL: ((r'\butility\b|\belectric|\bpower\b|\bwater\b|\bgas\b', 3),),
+    W2: ((r'\bw ?2\b', 4),),
+    BANK_STATEMENT: ((r'\bbank\b|\bstatement\b', 3),),
+}
+# Page counts each class usually has; outside the range a class loses a point
+PAGE_RANGES = {INVOICE: (1, 20), UTILITY_BILL: (1, 6), W2: (1, 4), BANK_STATEMENT: (1, 40)}
+
+# Lines at the top of a page that say nothing about who issued it
+_GENERIC_HEADER = re.compile(
+    r'(page\s*\d+\s*((of|/)\s*\d+)?|((customer|office|accounts?)\s+)?(original|copy|duplicate|triplicate)(\s+copy)?'
+    r'|(tax\s+)?(invoice|receipt|statement|quotation|debit\s+note|credit\s+note)|draft|confidential)\W*',
+    re.IGNORECASE
+)
+
+_TEXT_SIGNALS = {name: [(re.compile(p, re.IGNORECASE), w) for p, w in signals] for name, signals in TEXT_SIGNALS.items()}
+_NAME_SIGNALS = {name: [(re.compile(p, re.IGNORECASE), w) for p, w in signals] for name, signals in NAME_SIGNALS.items()}
+
+
+def pdf_features(pdf_bytes, max_pages=CLASSIFY_MAX_PAGES):
+    """
+    Page count and the text layer of the first pages; (None, '') when the PDF cannot be read
+    """
+    try:
+        reader = PdfReader(io.BytesIO(pdf_bytes))
+        pages = len(reader.pages)
+        text = '\n'.join(page.extract_text() or '' for page in reader.pages[:max_pages])
+    except Exception as e:
+        print(f"Could not read PDF for classification: {str(e)}")
+        return None, ''
+    return pages, text
+
+
+def is_generic_header(line):
+    """
+    True for top-of-page lines shared by many issuers: page numbers, copy marks, document titles, numbers
+    """
+    text = (line or '').strip()
+    letters = len(re.findall(r'[A-Za-z]', text))
+    return letters < 3 or letters < len(re.findall(r'\d', text)) or bool(_GENERIC_HEADER.fullmatch(text))
+
+
+def letterhead(text):
+    """
+    First line of the text layer that names someone rather than the document type, usually the issuer
+    """
+    for line in text.splitlines()[:LETTERHEAD_MAX_LINES]:
+        line = line.strip()
+        if is_generic_header(line) or not re.search(r'[A-Za-z]{2}', line):
+            continue
+        if any(pattern.search(line) for signals in _TEXT_SIGNALS.values() for pattern, _ in signals):
+            continue
+        return line[:80]
+    return None
+
+
+def score_classes(name, text, pages):
+    """
+    Weighted signal score per class from the text layer, file name and page count
+    """
+    stem = re.sub(r'[-_.]+', ' ', os.path.splitext(os.path.basename(name))[0])
+    scores = {}
+    for label in TEXT_SIGNALS:
+        score = sum(weight for pattern, weight in _TEXT_SIGNALS[label] if pattern.search(text))
+        score += sum(weight for pattern, weight in _NAME_SIGNALS[label] if pattern.search(stem))
+        low, high = PAGE_RANGES[label]
+        if pages is not None and not low <= pages <= high:
+            score -= 1
+        scores[label] = score
+    return scores
+
+
+def classify_document(name, pdf_bytes=None):
+    """
+    Classify an upload before it is sent to BDA.
+
+    Returns {'class', 'score', 'pages', 'text_chars', 'header', 'scores'}; class is one of the
+    document classes, 'junk' only for uploads BDA cannot process (unsupported file types,
+    empty PDFs), or 'unknown' when the signals are too weak to tell.
+    """
+    if not name.lower().endswith(DOCUMENT_EXTENSIONS):
+        return {'class': JUNK, 'reason': 'unsupported file type', 'score': 0, 'pages': None, 'text_chars': 0}
+
+    pages, text = pdf_features(pdf_bytes) if pdf_bytes is not None else (None, '')
+    if pdf_bytes is not None and pages is None:
+        # BDA may still read what pypdf cannot
+        return {'class': UNKNOWN, 'reason': 'unreadable PDF', 'score': 0, 'pages': None, 'text_chars': 0}
+    if pages == 0:
+        return {'class': JUNK, 'reason': 'empty PDF', 'score': 0, 'pages': 0, 'text_chars': 0}
+
+    text_chars = len(text.strip())
+    scores = score_classes(name, text, pages)
+    label, score = max(scores.items(), key=lambda item: item[1])
+    result = {'class': label, 'score': score, 'pages': pages, 'text_chars': text_chars,
+              'header': letterhead(text), 'scores': scores}
+    ranked = sorted(scores.values(), reverse=True)
+    if score < MIN_CLASS_SCORE or ranked[0] == ranked[1]:
+        # Missing English keywords is not evidence against a financial document: non-English
+        # invoices, debit notes and scans all land here and are left to BDA
+        result['class'] = UNKNOWN
+        result['reason'] = 'no document signals' if score <= 0 else 'weak document signals'
+    return result
@@ -0,0 +1,66 @@
+import io
+import os
+import re
+
+from pypdf import PdfReader, PdfWriter
+
+# PDFs above this many pages are split before submission to BDA
+SPLIT_THRESHOLD_PAGES = int(os.environ.get('SPLIT_THRESHOLD_PAGES', '20'))
+# Upper bound on pages per segment, whichever split mode is used
+SEGMENT_MAX_PAGES = int(os.environ.get('SEGMENT_MAX_PAGES', '10'))
+# "pages" cuts fixed page ranges; "invoices" also cuts where a new invoice starts
+SPLIT_MODE = os.environ.get('SPLIT_MODE', 'invoices')
+SEGMENT_PREFIX = "bda-segments"
+
+# Text-layer markers that usually only appear on the first page of an invoice
+INVOICE_START = re.compile(r'(\binvoice\s*(no\.?|number|#)|\btax\s+invoice\b|\bpage\s+1\s+of\b)', re.IGNORECASE)
+
+
+def page_count(pdf_bytes):
+    return len(PdfReader(io.BytesIO(pdf_bytes)).pages)
+
+
+def plan_segments(reader, mode=SPLIT_MODE, max_pages=SEGMENT_MAX_PAGES):
+    """
+    Return ordered (start, end) page ranges, end exclusive, covering every page
+    """
+    total = len(reader.pages)
+    starts = {0}
+    if mode == 'invoices':
+        for number, page in enumerate(reader.pages):
+            if number and INVOICE_START.search(page.extract_text() or ''):
+                starts.add(number)
+
+    ranges = []
+    boundaries = sorted(starts) + [total]
+    for start, end in zip(boundaries, boundaries[1:]):
+        # Long invoices are still cut so no single segment dominates wall-clock time
+        for chunk_start in range(start, end, max_pages):
+            ranges.append((chunk_start, min(chunk_start + max_pages, end)))
+    return ranges
+
+
+def split_pdf(pdf_bytes, mode=SPLIT_MODE, max_pages=SEGMENT_MAX_PAGES):
+    """
+    Split a PDF into segments, returning [((start, end), segment_bytes)] in page order
+    """
+    reader = PdfReader(io.BytesIO(pdf_bytes))
+    segments = []
+    for start, end in plan_segments(reader, mode, max_pages):
+        writer = PdfWriter()
+        for number in range(start, end):
+            writer.add_page(reader.pages[number])
+        buffer = io.BytesIO()
+        writer.write(buffer)
+        segments.append(((start, end), buffer.getvalue()))
+    return segments
+
+
+def segment_key(source_key, source_id, index, page_range):
+    """
+    S3 key for a segment; kept outside the datasets/ prefix so it does not retrigger ingestion.
+    source_id names the upload version (its job ledger id), so uploads that share a file
+    name, or a re-upload while the first version is still running, never overwrite segments.
+    """
+    stem = source_key.split('/')[-1].rsplit('.', 1)[0]
+    return f"{SEGMENT_PREFIX}/{source_id}/{stem}/part-{index:04d}-p{page_range[0] + 1}-{page_range[1]}.pdf"
@@ -1,32 +1,52 @@
 import os
+import re
 import boto3
-import cfnresponse
 import logging
 import json
 import time
-from botocore.config import Config
+from concurrent.futures import ThreadPoolExecutor
+
+from document_splitter import SPLIT_THRESHOLD_PAGES, page_count, split_pdf, segment_key
+from document_classifier import INVOICE, JUNK, UNKNOWN, classify_document
+from bda_scheduler import FairShareScheduler, Job, classify_upload, run_jobs
+from bda_router import create_router
+from blueprint_hints import extracted_vendor, resolve_blueprint_hint, remember_vendor_blueprint, submission_blueprints, vendor_key
+from metrics import emit_metrics
+import vendor_templates
+import key_layout
+from result_stream import RESULT_FIELDS, read_s3_fields
+import job_ledger
 
 TARGET_BUCKET_NAME = os.environ.get('TARGET_BUCKET_NAME', None)
 # Use the environment variable for the project ARN
 DATA_PROJECT_ARN = os.environ.get('DATA_PROJECT_ARN', None)
-ACCOUNT_ID = os.environ.get('ACCOUNT_ID', None)
-
-config = Config(
-    retries = dict(
-        max_attempts = 3,
-        mode = 'standard' 
-    )
-)
+# Cap on concurrent BDA jobs for the segments of one large document
+MAX_PARALLEL_SEGMENTS = int(os.environ.get('MAX_PARALLEL_SEGMENTS', '8'))
+# Uploads smaller than this are never split
+SPLIT_MIN_BYTES = int(os.environ.get('SPLIT_MIN_BYTES', str(1024 * 1024)))
+# "skip" drops uploads BDA cannot process (unsupported file types, empty PDFs), "observe" only
+# records the class, "off" disables the pre-classifier
+PRECLASSIFY_MODE = os.environ.get('PRECLASSIFY_MODE', 'observe')
+# Known vendors' digital invoices are extracted locally with learned templates unless this is "off"
+VENDOR_TEMPLATES = os.environ.get('VENDOR_TEMPLATES', 'on')
+# Upload queue ARN per priority class; the standard queue receives every upload
+UPLOAD_QUEUES = json.loads(os.environ.get('UPLOAD_QUEUES', '{}') or '{}')
+# The sweep leaves entries touched more recently than this to the invocation driving them
+SWEEP_MIN_AGE_SECONDS = int(os.environ.get('SWEEP_MIN_AGE_SECONDS', '900'))
+BDA_TERMINAL_STATUSES = ['Success', 'ServiceError', 'ClientError']
 
 s3 = boto3.client("s3")
-bda = boto3.client("bedrock-data-automation-runtime", config=config)
+# Spreads BDA jobs over the regions in BDA_ROUTES and fails over when one throttles
+bda_router = create_router()
 
 
-def invoke_insight_generation_async(
+def submit_insight_generation(
         input_s3_uri,
         output_s3_uri,
-        data_project_arn, blueprints = None):
-
+        data_project_arn, blueprints = None, client_token = None):
+    """
+    Start a BDA job in the least loaded healthy region and return its invocation ARN
+    """
     payload = {
         "inputConfiguration": {
             "s3Uri": input_s3_uri
@@ -34,67 +54,155 @@ def invoke_insight_generation_async(
         "outputConfiguration": {
             "s3Uri": output_s3_uri
         },
-        "dataAutomationConfiguration": {
-            "dataAutomationProjectArn": data_project_arn,
-        },
-        "dataAutomationProfileArn": f"arn:aws:bedrock:us-east-1:{str(ACCOUNT_ID)}:data-automation-profile/us.data-automation-v1",
         "notificationConfiguration": {
         "eventBridgeConfiguration": {"eventBridgeEnabled": True},
         }
     }
+    if blueprints:
+        # Pinned blueprints skip BDA's matching across every blueprint in the project
+        payload["blueprints"] = blueprints
+    if client_token:
+        payload["clientToken"] = client_token
     print(payload)
 
-    response = bda.invoke_data_automation_async(**payload)
-    invocation_arn = response['invocationArn']
-    while bda.get_data_automation_status(invocationArn=invocation_arn)['status'] != 'Success': 
-        print('Project status: %s', bda.get_data_automation_status(invocationArn=invocation_arn)['status'])
-        if bda.get_data_automation_status(invocationArn=invocation_arn)['status'] in ['ServiceError', 'ClientError']:
+    invocation_arn = bda_router.submit(payload, data_project_arn)
+    print(invocation_arn)
+    return invocation_arn
+
+
+def wait_for_insight_generation(invocation_arn, wait = True):
+    """
+    Poll a BDA job until it finishes; with wait=False check its status once
+    """
+    while True:
+        status_response = bda_router.get_status(invocation_arn)
+        status = status_response['status']
+        print('Project status: %s', status)
+        if status in ['ServiceError', 'ClientError']:
                 print(f"Job failed with status: {status}")
-                print(f"Error type: {response.get('errorType')}")
-                print(f"Error message: {response.get('errorMessage')}")
-                return False
+                print(f"Error type: {status_response.get('errorType')}")
+                print(f"Error message: {status_response.get('errorMessage')}")
+        if status in BDA_TERMINAL_STATUSES or not wait:
+            return status_response
         # Intentional 5-second delay between API calls to prevent rate limiting
         # nosemgrep: arbitrary-sleep
         time.sleep(5)
-        pass
 
-    print(response)
-    return response
+
+def invoke_insight_generation_async(
+        input_s3_uri,
+        output_s3_uri,
+        data_project_arn, blueprints = None):
+
+    invocation_arn = submit_insight_generation(input_s3_uri, output_s3_uri, data_project_arn, blueprints)
+    status_response = wait_for_insight_generation(invocation_arn)
+    if status_response['status'] != 'Success':
+        return False
+    return {'invocationArn': invocation_arn}
+
+
+def run_tracked_job(entry, wait = True):
+    """
+    Advance a ledger entry from its last recorded stage until the raw BDA output is ready.
+
+    Each stage is written to the ledger before the next begins, so a retry after a
+    timeout polls the recorded invocation instead of starting a new BDA job.
+    """
+    while not (entry['state'] in (job_ledger.RAW_READY, job_ledger.PROCESSED) or job_ledger.is_finished(entry)):
+        if entry['state'] == job_ledger.FAILED:
+            # A pinned blueprint may be the reason; the retry lets BDA match among all of them
+            entry = job_ledger.transition(s3, TARGET_BUCKET_NAME, entry, job_ledger.SUBMITTED, blueprint_hint=None)
+        if entry['state'] == job_ledger.SUBMITTED:
+            # Same token until the attempt is recorded, so BDA returns the existing job after a crash here
+            invocation_arn = submit_insight_generation(
+                entry['input_s3_uri'], entry['output_s3_uri'], DATA_PROJECT_ARN,
+                blueprints=submission_blueprints(entry.get('blueprint_hint')),
+                client_token=job_ledger.client_token(entry)
+            )
+            entry = job_ledger.transition(s3, TARGET_BUCKET_NAME, entry, job_ledger.RUNNING,
+                                          invocation_arn=invocation_arn, attempts=entry['attempts'] + 1,
+                                          submitted_at=time.time())
+
+        status_response = wait_for_insight_generation(entry['invocation_arn'], wait)
+        if status_response['status'] == 'Success':
+            if wait and entry.get('submitted_at'):
+                report_job_time(entry)
+            entry = job_ledger.transition(s3, TARGET_BUCKET_NAME, entry, job_ledger.RAW_READY)
+        elif status_response['status'] in BDA_TERMINAL_STATUSES:
+            entry = job_ledger.transition(
+                s3, TARGET_BUCKET_NAME, entry, job_ledger.FAILED,
+                error=f"{status_response['status']}: {status_response.get('errorMessage')}"
+            )
+        if not wait:
+            break
+    return entry
+
+
+def report_job_time(entry):
+    """
+    BDA time of a finished job, split by whether a blueprint was pinned
+    """
+    hint = entry.get('blueprint_hint')
+    emit_metrics(
+        {'BDAJobTime': round(time.time() - entry['submitted_at'], 1)},
+        units={'BDAJobTime': 'Seconds'},
+        dimensions={'BlueprintTargeting': 'hinted' if hint else 'unhinted'},
+        properties={'hint_source': hint.get('source') if hint else None, 'ledger_key': entry['ledger_key']}
+    )
+
+
+def collect_custom_outputs(bucket_name, prefix):
+    """
+    Read the custom_output results under a BDA output prefix in document order
+    """
+    results = []
+    paginator = s3.get_paginator('list_objects_v2')
+    for page in paginator.paginate(Bucket=bucket_name, Prefix=f"{prefix}/"):
+        for obj in page.get('Contents', []):
+            if 'custom_output' in obj['Key'] and obj['Key'].endswith('result.json'):
+                # custom_output/<n>/result.json; listing order is lexicographic, so sort on n
+                match = re.search(r'custom_output/(\d+)/', obj['Key'])
+                results.append((int(match.group(1)) if match else 0, obj['Key']))
+
+    aggregated_results = []
+    for _, key in sorted(results):
+        # Streamed so explainability_info in large multi-page results is never held in memory
+        json_content = read_s3_fields(s3, bucket_name, key)
+        aggregated_results.append({field: json_content.get(field) for field in RESULT_FIELDS})
+    return aggregated_results
+
+
+def learn_vendor_blueprint(bucket_name, pre_classification, result):
+    """
+    Remember the blueprint BDA matched for this letterhead so the vendor's next document is pinned to it
+    """
+    try:
+        remember_vendor_blueprint(s3, bucket_name, vendor_key(pre_classification.get('header')),
+                                  result.get('matched_blueprint'), extracted_vendor(result.get('inference_result')))
+    except Exception as e:
+        print(f"Could not record vendor blueprint: {str(e)}")
 
 
-def process_bda_output(output_s3_uri_raw, targetkey):
+def process_bda_output(output_s3_uri_raw, targetkey, pre_classification = None):
     # Parse the S3 URI
     bucket_name = output_s3_uri_raw.split('//')[1].split('/')[0]
     prefix = '/'.join(output_s3_uri_raw.split('//')[1].split('/')[1:])
     print(output_s3_uri_raw, targetkey)
     print(bucket_name, prefix)
-    aggregated_results = []
 
     try:
-        # List all objects in the custom_output directory
-        response = s3.list_objects_v2(Bucket=bucket_name, Prefix=f"{prefix}/")
-
-        for obj in response.get('Contents', []):
-            if 'custom_output' in obj['Key'] and obj['Key'].endswith('result.json'):
-                # Read the content of each result.json file
-                file_content = s3.get_object(Bucket=bucket_name, Key=obj['Key'])['Body'].read().decode('utf-8')
-                json_content = json.loads(file_content)
-
-                # Extract required fields
-                extracted_data = {
-                    "matched_blueprint": json_content.get("matched_blueprint"),
-                    "document_class": json_content.get("document_class"),
-                    "inference_result": json_content.get("inference_result")
-                }
-
-                aggregated_results.append(extracted_data)
+        aggregated_results = collect_custom_outputs(bucket_name, prefix)
 
         if not aggregated_results:
             print("No results found to process")
             return None
 
         # Take the first result and convert it to JSON string
-        final_result = json.dumps(aggregated_results[0], indent=2)
+        first_result = aggregated_results[0]
+        if pre_classification:
+            first_result = {**first_result, "pre_classification": pre_classification}
+            learn_vendor_blueprint(bucket_name, pre_classification, first_result)
+        final_result = json.dumps(first_result, indent=2)
 
         # Write the final result to S3
         s3.put_object(
@@ -112,29 +220,382 @@ def process_bda_output(output_s3_uri_raw, targetkey):
         return None
 
 
-def lambda_handler(event, context):
-    print(f"Received event: {event}")
+def process_large_document(entry, pdf_bytes = None, wait = True):
+    """
+    Split a large PDF, run the segments through BDA in parallel and write one ordered result.
 
-    # Generate a unique ID using UUID4
-    bucket = event['detail']['bucket']['name']
-    key = event['detail']['object']['key']
+    Segments are recorded on the document's ledger entry and tracked by their own part
+    entries, so a resumed run skips the split and only waits on unfinished segments.
+    """
+    output_bucket = entry['output_s3_uri'].split('//')[1].split('/')[0]
+
+    if 'segments' not in entry:
+        segments = split_pdf(pdf_bytes)
+        print(f"Split {entry['source_key']} into {len(segments)} segments")
+
+        def upload_segment(indexed_segment):
+            index, (page_range, segment_bytes) = indexed_segment
+            input_key = segment_key(entry['source_key'], job_ledger.entry_id(entry), index, page_range)
+            s3.put_object(Bucket=entry['source_bucket'], Key=input_key, Body=segment_bytes, ContentType='application/pdf')
+            return {
+                'part': index,
+                'pages': [page_range[0] + 1, page_range[1]],
+                'input_s3_uri': f"s3://{entry['source_bucket']}/{input_key}",
+                'output_s3_uri': f"{entry['output_s3_uri']}/segment-{index:04d}"
+            }
+
+        with ThreadPoolExecutor(max_workers=MAX_PARALLEL_SEGMENTS) as executor:
+            parts = list(executor.map(upload_segment, enumerate(segments)))
+        entry = job_ledger.transition(s3, TARGET_BUCKET_NAME, entry, job_ledger.RUNNING, segments=parts)
+
+    def run_segment(part):
+        part_entry = job_ledger.open_entry(
+            s3, TARGET_BUCKET_NAME,
+            job_ledger.ledger_key(entry['source_bucket'], entry['source_key'], entry['source_etag'], part['part']),
+            blueprint_hint=entry.get('blueprint_hint'),
+            **part
+        )
+        return run_tracked_job(part_entry, wait)
+
+    with ThreadPoolExecutor(max_workers=MAX_PARALLEL_SEGMENTS) as executor:
+        part_entries = list(executor.map(run_segment, entry['segments']))
+
+    if not all(part['state'] == job_ledger.RAW_READY or job_ledger.is_finished(part) for part in part_entries):
+        print(f"{entry['source_key']}: segments still running")
+        return entry
+
+    documents = []
+    failed_ranges = []
+    for part in part_entries:
+        if part['state'] != job_ledger.RAW_READY:
+            failed_ranges.append(part['pages'])
+            continue
+        prefix = '/'.join(part['output_s3_uri'].split('//')[1].split('/')[1:])
+        for result in collect_custom_outputs(output_bucket, prefix):
+            documents.append({"pages": part['pages'], **result})
+
+    if not documents:
+        print(f"No results produced for any segment of {entry['source_key']}")
+        # Every segment has used its attempts, so the document itself is final
+        return job_ledger.transition(s3, TARGET_BUCKET_NAME, entry, job_ledger.FAILED,
+                                     attempts=job_ledger.MAX_ATTEMPTS, error='No segment produced results')
+
+    # The first document stays at the top level so existing readers keep working
+    final_result = {**documents[0], "documents": documents, "failed_pages": failed_ranges}
+    if entry.get('document_class'):
+        final_result["pre_classification"] = entry['document_class']
+        learn_vendor_blueprint(output_bucket, entry['document_class'], documents[0])
+    s3.put_object(
+        Bucket=output_bucket,
+        Key=entry['target_key'],
+        Body=json.dumps(final_result, indent=2),
+        ContentType='application/json'
+    )
+    print(f"Aggregated {len(documents)} segment results written to s3://{output_bucket}/{entry['target_key']}")
+    return job_ledger.transition(s3, TARGET_BUCKET_NAME, entry, job_ledger.PROCESSED,
+                                 result_uri=f"s3://{output_bucket}/{entry['target_key']}")
+
+
+def resume_document(entry, pdf_bytes = None, wait = True):
+    """
+    Drive a document's ledger entry towards processed from wherever it stopped
+    """
+    if 'segments' in entry or pdf_bytes:
+        return process_large_document(entry, pdf_bytes, wait)
+
+    entry = run_tracked_job(entry, wait)
+    if entry['state'] == job_ledger.RAW_READY:
+        response_processed = process_bda_output(entry['output_s3_uri'], entry['target_key'], entry.get('document_class'))
+        if response_processed:
+            entry = job_ledger.transition(s3, TARGET_BUCKET_NAME, entry, job_ledger.PROCESSED,
+                                          result_uri=response_processed)
+            learn_vendor_template(entry)
+        else:
+            entry = job_ledger.transition(s3, TARGET_BUCKET_NAME, entry, job_ledger.FAILED,
+                                          error='No results found in BDA output')
+    return entry
 
-    targetkey_raw = key.replace("datasets/documents", "bda-result-raw")
-    targetkey_processed = f"{key.replace("datasets/documents", "bda-result").split('.')[0].replace("_","-")}-result.json"
+
+def template_candidate(entry):
+    classification = entry.get('document_class') or {}
+    return (VENDOR_TEMPLATES != 'off' and classification.get('class') in (INVOICE, UNKNOWN)
+            and classification.get('header') and (classification.get('pages') or 0) <= vendor_templates.FAST_PATH_MAX_PAGES)
+
+
+def try_vendor_template(entry, pdf_bytes):
+    """
+    Extract a known vendor's digital invoice locally with its learned template instead of
+    running BDA. Unconfident extractions leave the entry to BDA and mark it for re-learning.
+    """
+    started = time.time()
+    template = vendor_templates.find_template(s3, TARGET_BUCKET_NAME, entry['document_class']['header'])
+    lines = vendor_templates.pdf_lines(pdf_bytes) if template else None
+    if not lines:
+        return entry
+
+    inference_result, confidence = vendor_templates.apply_template(template, lines)
+    hit = confidence >= vendor_templates.FAST_PATH_MIN_CONFIDENCE
+    elapsed_ms = round((time.time() - started) * 1000, 1)
+    print(f"Vendor template {template['supplier_id']} confidence {confidence} in {elapsed_ms} ms")
+    emit_metrics(
+        {'VendorTemplateHits': int(hit), 'VendorTemplateFallbacks': int(not hit), 'VendorTemplateTime': elapsed_ms},
+        units={'VendorTemplateTime': 'Milliseconds'},
+        properties={'supplier_id': template['supplier_id'], 'confidence': confidence}
+    )
+    if not hit:
+        return job_ledger.transition(s3, TARGET_BUCKET_NAME, entry, entry['state'],
+                                     template_fallback=template['supplier_id'])
+
+    output_bucket = entry['output_s3_uri'].split('//')[1].split('/')[0]
+    final_result = {**vendor_templates.template_result(template, inference_result, confidence),
+                    "pre_classification": entry['document_class']}
+    s3.put_object(
+        Bucket=output_bucket,
+        Key=entry['target_key'],
+        Body=json.dumps(final_result, indent=2),
+        ContentType='application/json'
+    )
+    return job_ledger.transition(s3, TARGET_BUCKET_NAME, entry, job_ledger.PROCESSED, extracted_by='vendor_template',
+                                 result_uri=f"s3://{output_bucket}/{entry['target_key']}")
+
+
+def learn_vendor_template(entry):
+    """
+    Learn or refresh the vendor's template from a BDA-processed digital invoice, when none
+    exists yet or the current one just fell back; never fails the document
+    """
+    if not template_candidate(entry):
+        return
+    try:
+        header = entry['document_class']['header']
+        if vendor_templates.find_template(s3, TARGET_BUCKET_NAME, header) and not entry.get('template_fallback'):
+            return
+        source_bucket, source_key = entry['input_s3_uri'].split('//')[1].split('/', 1)
+        lines = vendor_templates.pdf_lines(s3.get_object(Bucket=source_bucket, Key=source_key)['Body'].read())
+        output_bucket, target_key = entry['result_uri'].split('//')[1].split('/', 1)
+        result = read_s3_fields(s3, output_bucket, target_key)
+        vendor_templates.learn_template(s3, TARGET_BUCKET_NAME, header, lines, result, source=entry['ledger_key'])
+    except Exception as e:
+        print(f"Could not learn vendor template: {str(e)}")
+
+
+def load_source_pdf(bucket, key):
+    """
+    Download an uploaded PDF for classification and splitting; other formats are not read
+    """
+    if not key.lower().endswith('.pdf'):
+        return None
+    return s3.get_object(Bucket=bucket, Key=key)['Body'].read()
+
+
+def load_splittable_pdf(key, pdf_bytes, pages = None):
+    """
+    Return the PDF bytes when the document has enough pages to be worth splitting
+    """
+    if pages is None:
+        try:
+            pages = page_count(pdf_bytes)
+        except Exception as e:
+            print(f"Could not read page count for {key}, submitting whole file: {str(e)}")
+            return None
+    print(f"{key} has {pages} pages")
+    return pdf_bytes if pages > SPLIT_THRESHOLD_PAGES else None
+
+
+def skip_document(entry, classification):
+    """
+    Record an upload the pre-classifier rejected. The result file tells the user why it
+    was not processed; the ledger alone is not visible to them.
+    """
+    reason = classification.get('reason', 'not a supported document')
+    output_bucket = entry['output_s3_uri'].split('//')[1].split('/')[0]
+    skipped_result = {
+        "status": "SKIPPED",
+        "reason": reason,
+        "document_class": {"type": "Skipped"},
+        "pre_classification": classification
+    }
+    s3.put_object(
+        Bucket=output_bucket,
+        Key=entry['target_key'],
+        Body=json.dumps(skipped_result, indent=2),
+        ContentType='application/json'
+    )
+    return job_ledger.transition(s3, TARGET_BUCKET_NAME, entry, job_ledger.SKIPPED, document_class=classification,
+                                 error=f"Skipped: {reason}",
+                                 result_uri=f"s3://{output_bucket}/{entry['target_key']}")
+
+
+def plan_document(entry, key, pdf_bytes):
+    """
+    Pre-classify an upload and pick the blueprint to pin for it, recording both on the
+    ledger entry; junk is moved to the skipped state when PRECLASSIFY_MODE is "skip"
+    and a skipped result is written where the processed one would go
+    """
+    classification = None
+    if PRECLASSIFY_MODE != 'off':
+        started = time.time()
+        classification = classify_document(key, pdf_bytes)
+        elapsed_ms = round((time.time() - started) * 1000, 1)
+        print(f"{key} pre-classified as {classification['class']} in {elapsed_ms} ms: {classification}")
+
+        skip = PRECLASSIFY_MODE == 'skip' and classification['class'] == JUNK
+        emit_metrics(
+            {'PreclassifyTime': elapsed_ms, 'DocumentsSkipped': int(skip)},
+            units={'PreclassifyTime': 'Milliseconds'},
+            dimensions={'DocumentClass': classification['class']}
+        )
+        if skip:
+            return skip_document(entry, classification)
+
+    hint = resolve_blueprint_hint(s3, TARGET_BUCKET_NAME, key, classification)
+    print(f"{key} blueprint hint: {hint}")
+    return job_ledger.transition(s3, TARGET_BUCKET_NAME, entry, entry['state'],
+                                 document_class=classification, blueprint_hint=hint)
+
+
+def process_document(bucket, key):
+    """
+    Run one uploaded object through BDA and store its processed result.
+
+    Work is tracked in the job ledger under the object's key and ETag, so a replayed
+    event for the same object version resumes or returns the finished result.
+    """
+    # Results go under hash-sharded prefixes so sustained uploads do not all write to one prefix
+    document_name = key_layout.document_name(key)
+    targetkey_processed = key_layout.result_key(document_name)
 
     input_s3_uri = f"s3://{bucket}/{key}"
-    output_s3_uri_raw = f"s3://{TARGET_BUCKET_NAME}/{targetkey_raw.split('.')[0]}"
+    output_s3_uri_raw = f"s3://{TARGET_BUCKET_NAME}/{key_layout.raw_result_prefix(document_name)}"
 
     print(f"input_s3_uri: {input_s3_uri}")
     print(f"output_s3_uri: {output_s3_uri_raw}")
 
-    # invoke insight generation
-    response = invoke_insight_generation_async(input_s3_uri, output_s3_uri_raw, DATA_PROJECT_ARN)
-    response_processed = process_bda_output(output_s3_uri_raw, targetkey_processed)
+    head = s3.head_object(Bucket=bucket, Key=key)
+    entry = job_ledger.open_entry(
+        s3, TARGET_BUCKET_NAME, job_ledger.ledger_key(bucket, key, head['ETag']),
+        source_bucket=bucket,
+        source_key=key,
+        source_etag=head['ETag'],
+        input_s3_uri=input_s3_uri,
+        output_s3_uri=output_s3_uri_raw,
+        target_key=targetkey_processed
+    )
+    print(f"Ledger entry {entry['ledger_key']} is {entry['state']}")
+
+    pdf_bytes = None
+    if entry['state'] == job_ledger.SUBMITTED and entry['attempts'] == 0 and 'segments' not in entry:
+        plan = 'blueprint_hint' not in entry
+        splittable = head['ContentLength'] >= SPLIT_MIN_BYTES
+        source_bytes = load_source_pdf(bucket, key) if (plan and PRECLASSIFY_MODE != 'off') or splittable else None
+        if plan:
+            entry = plan_document(entry, key, source_bytes)
+        if splittable and source_bytes and entry['state'] == job_ledger.SUBMITTED:
+            pdf_bytes = load_splittable_pdf(key, source_bytes, (entry.get('document_class') or {}).get('pages'))
+        if source_bytes and not pdf_bytes and entry['state'] == job_ledger.SUBMITTED and template_candidate(entry):
+            entry = try_vendor_template(entry, source_bytes)
+    if not job_ledger.is_finished(entry):
+        entry = resume_document(entry, pdf_bytes)
 
+    response_processed = entry.get('result_uri') if entry['state'] == job_ledger.PROCESSED else None
     if response_processed:
         print(f"Processed output available at: {response_processed}")
+    elif entry['state'] == job_ledger.SKIPPED:
+        print(f"Not sent to BDA: {entry.get('error')}")
     else:
-        print("Failed to process BDA output")
-        
-    return response
\ No newline at end of file
+        print(f"Failed to process BDA output: {entry.get('error')}")
+
+    return entry, response_processed
+
+
+def sweep_ledger(min_age_seconds = SWEEP_MIN_AGE_SECONDS, mark_open=False):
+    """
+    Finish orphaned jobs: advance every stale, unfinished ledger entry by one
+    non-blocking step, processing any whose BDA output has become ready.
+    mark_open first reads the whole ledger to mark entries written before open markers.
+    """
+    if mark_open:
+        print(f"Marked {job_ledger.mark_open_entries(s3, TARGET_BUCKET_NAME)} unfinished ledger entries open")
+    entries = job_ledger.list_unfinished(s3, TARGET_BUCKET_NAME, min_age_seconds)
+    print(f"Sweeping {len(entries)} unfinished ledger entries")
+
+    def advance(entry):
+        try:
+            return resume_document(entry, wait=False)['state']
+        except job_ledger.LedgerConflict:
+            # Another invocation is driving this entry
+            return 'skipped'
+        except Exception as e:
+            print(f"Sweep failed for {entry['ledger_key']}: {str(e)}")
+            return 'error'
+
+    with ThreadPoolExecutor(max_workers=MAX_PARALLEL_SEGMENTS) as executor:
+        states = list(executor.map(advance, entries))
+
+    summary = {state: states.count(state) for state in set(states)}
+    emit_metrics(
+        {'LedgerEntriesSwept': len(entries), 'LedgerEntriesRecovered': summary.get(job_ledger.PROCESSED, 0)},
+        properties={'sweep': summary}
+    )
+    return {'swept': len(entries), 'states': summary}
+
+
+def process_upload_batch(event):
+    """
+    Drain an SQS batch of upload events through the fair-share scheduler. Each
+    priority class has its own queue, so a batch holds one class and is ordered
+    fairly across its tenants.
+
+    Failed documents are reported back as batch item failures so only they
+    return to the queue for retry.
+    """
+    queue_priorities = {arn: priority for priority, arn in UPLOAD_QUEUES.items()}
+    jobs = []
+    for record in event['Records']:
+        detail = json.loads(record['body'])['detail']
+        bucket, key = detail['bucket']['name'], detail['object']['key']
+        tenant, priority = classify_upload(key)
+        queue_priority = queue_priorities.get(record.get('eventSourceARN'))
+        if queue_priority and queue_priority != priority:
+            # Also delivered to the queue of its own priority class, which processes it
+            print(f"Leaving {key} to the {priority} upload queue")
+            continue
+        # Queue wait counts from when the upload event was queued, not when this batch arrived
+        sent_at = int(record.get('attributes', {}).get('SentTimestamp', 0)) / 1000 or None
+        jobs.append(Job(tenant, priority, payload=(bucket, key, record['messageId']), enqueued_at=sent_at))
+    if not jobs:
+        return {'batchItemFailures': []}
+
+    scheduler = FairShareScheduler(clock=time.time)
+    results = run_jobs(scheduler, jobs, lambda job: process_document(*job.payload[:2]))
+
+    waits = scheduler.wait_percentiles()['all']
+    emit_metrics(
+        {'QueueWaitP50': waits['p50'], 'QueueWaitP90': waits['p90'], 'QueueWaitP99': waits['p99'],
+         'DocumentsProcessed': sum(1 for result in results if result and result[1]),
+         'DocumentsSkipped': sum(1 for result in results if result and result[0]['state'] == job_ledger.SKIPPED)},
+        units={'QueueWaitP50': 'Seconds', 'QueueWaitP90': 'Seconds', 'QueueWaitP99': 'Seconds'},
+        properties={'queue_wait': scheduler.wait_percentiles()}
+    )
+    return {
+        'batchItemFailures': [
+            {'itemIdentifier': job.payload[2]}
+            for job, result in zip(jobs, results)
+            if not result or not (result[1] or result[0]['state'] == job_ledger.SKIPPED)
+        ]
+    }
+
+
+def lambda_handler(event, context):
+    print(f"Received event: {event}")
+
+    if 'Records' in event:
+        return process_upload_batch(event)
+
+    if event.get('sweep'):
+        return sweep_ledger(int(event.get('min_age_seconds', SWEEP_MIN_AGE_SECONDS)), bool(event.get('mark_open')))
+
+    bucket = event['detail']['bucket']['name']
+    key = event['detail']['object']['key']
+    entry, _ = process_document(bucket, key)
+    return {k: v for k, v in entry.items() if k != '_version'}
\ No newline at end of file
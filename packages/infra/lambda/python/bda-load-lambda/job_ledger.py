@@ -0,0 +1,190 @@
+import json
+import hashlib
+from datetime import datetime, timezone
+from concurrent.futures import ThreadPoolExecutor
+
+from botocore.exceptions import ClientError
+
+LEDGER_PREFIX = "bda-ledger"
+# One empty marker per top-level entry that has not reached a final state, so the sweep
+# lists open work only instead of every entry ever written
+OPEN_PREFIX = "bda-ledger-open"
+# Job lifecycle; each stage is recorded before the next one starts so a retry
+# or sweep resumes from the last completed stage instead of re-running BDA
+SUBMITTED = 'submitted'      # claimed, BDA not yet invoked (or invoke not recorded)
+RUNNING = 'running'          # invocationArn recorded, BDA job in progress
+RAW_READY = 'raw-ready'      # BDA finished, raw output under output_s3_uri
+PROCESSED = 'processed'      # processed result written to target_key
+FAILED = 'failed'
+SKIPPED = 'skipped'          # pre-classified as junk, never sent to BDA
+MAX_ATTEMPTS = 3
+LIST_WORKERS = 16
+
+
+class LedgerConflict(Exception):
+    """
+    Another invocation updated the entry since it was read
+    """
+
+
+def _now():
+    return datetime.now(timezone.utc).isoformat()
+
+
+def ledger_key(source_bucket, source_key, etag, part=None):
+    """
+    One entry per input object version; segments of a split document get their own part entries
+    """
+    digest = hashlib.sha1(f"{source_bucket}/{source_key}".encode('utf-8')).hexdigest()[:20]
+    version = etag.strip('"')
+    suffix = f"-part-{part:04d}" if part is not None else ''
+    return f"{LEDGER_PREFIX}/{digest}-{version}{suffix}.json"
+
+
+def entry_id(entry):
+    """
+    The entry's key without prefix and extension; unique per input object version
+    """
+    return entry['ledger_key'].split('/')[-1].rsplit('.', 1)[0]
+
+
+def open_marker_key(ledger_key):
+    return f"{OPEN_PREFIX}/{ledger_key.split('/')[-1]}"
+
+
+def _is_part(ledger_key):
+    return '-part-' in ledger_key
+
+
+def _mark_open(s3, bucket, ledger_key):
+    if not _is_part(ledger_key):
+        s3.put_object(Bucket=bucket, Key=open_marker_key(ledger_key), Body=b'')
+
+
+def _mark_closed(s3, bucket, ledger_key):
+    if not _is_part(ledger_key):
+        s3.delete_object(Bucket=bucket, Key=open_marker_key(ledger_key))
+
+
+def client_token(entry):
+    """
+    Idempotency token for invoke_data_automation_async: stable per entry and attempt,
+    so re-submitting after a crash between invoke and record does not start a second job
+    """
+    return hashlib.sha256(f"{entry['ledger_key']}#{entry['attempts']}".encode('utf-8')).hexdigest()[:64]
+
+
+def _put(s3, bucket, entry, conditions):
+    body = {k: v for k, v in entry.items() if k != '_version'}
+    try:
+        response = s3.put_object(
+            Bucket=bucket,
+            Key=entry['ledger_key'],
+            Body=json.dumps(body),
+            ContentType='application/json',
+            **conditions
+        )
+    except ClientError as e:
+        if e.response['Error']['Code'] in ('PreconditionFailed', 'ConditionalRequestConflict'):
+            raise LedgerConflict(entry['ledger_key'])
+        raise
+    entry['_version'] = response['ETag']
+    return entry
+
+
+def load_entry(s3, bucket, key):
+    try:
+        response = s3.get_object(Bucket=bucket, Key=key)
+    except ClientError as e:
+        if e.response['Error']['Code'] == 'NoSuchKey':
+            return None
+        raise
+    entry = json.loads(response['Body'].read())
+    entry['_version'] = response['ETag']
+    return entry
+
+
+def open_entry(s3, bucket, key, **fields):
+    """
+    Return the existing entry for key, or atomically create it in the submitted state
+    """
+    entry = load_entry(s3, bucket, key)
+    if entry is not None:
+        return entry
+    entry = {
+        'ledger_key': key,
+        'state': SUBMITTED,
+        'attempts': 0,
+        'created_at': _now(),
+        'updated_at': _now(),
+        **fields
+    }
+    # Marked open before the entry exists, so a crash in between cannot hide it from the sweep
+    _mark_open(s3, bucket, key)
+    try:
+        return _put(s3, bucket, entry, {'IfNoneMatch': '*'})
+    except LedgerConflict:
+        return load_entry(s3, bucket, key)
+
+
+def transition(s3, bucket, entry, state, **fields):
+    """
+    Move an entry to a new state with a compare-and-swap on the ledger object
+    """
+    updated = {**entry, **fields, 'state': state, 'updated_at': _now()}
+    if is_finished(entry) and not is_finished(updated):
+        _mark_open(s3, bucket, entry['ledger_key'])
+    updated = _put(s3, bucket, updated, {'IfMatch': entry['_version']})
+    if is_finished(updated) and not is_finished(entry):
+        _mark_closed(s3, bucket, entry['ledger_key'])
+    return updated
+
+
+def is_finished(entry):
+    return entry['state'] in (PROCESSED, SKIPPED) or (entry['state'] == FAILED and entry['attempts'] >= MAX_ATTEMPTS)
+
+
+def _load_all(s3, bucket, keys):
+    with ThreadPoolExecutor(max_workers=LIST_WORKERS) as executor:
+        return list(executor.map(lambda key: load_entry(s3, bucket, key), keys))
+
+
+def list_unfinished(s3, bucket, min_age_seconds=0):
+    """
+    Load every open top-level entry that has not been touched for min_age_seconds,
+    so jobs still being driven are left alone. Markers of entries that finished
+    without removing them, or whose entry was never written, are cleaned up.
+    """
+    markers = []
+    paginator = s3.get_paginator('list_objects_v2')
+    for page in paginator.paginate(Bucket=bucket, Prefix=f"{OPEN_PREFIX}/"):
+        markers.extend(page.get('Contents', []))
+    keys = [f"{LEDGER_PREFIX}/{marker['Key'].split('/')[-1]}" for marker in markers]
+    entries = _load_all(s3, bucket, keys)
+
+    now = datetime.now(timezone.utc)
+    unfinished = []
+    for marker, key, entry in zip(markers, keys, entries):
+        if entry is None:
+            if marker.get('LastModified') and (now - marker['LastModified']).total_seconds() >= min_age_seconds:
+                _mark_closed(s3, bucket, key)
+        elif is_finished(entry):
+            _mark_closed(s3, bucket, key)
+        elif (now - datetime.fromisoformat(entry['updated_at'])).total_seconds() >= min_age_seconds:
+            unfinished.append(entry)
+    return unfinished
+
+
+def mark_open_entries(s3, bucket):
+    """
+    Write the open marker of every unfinished top-level entry by reading the whole ledger;
+    for entries created before open markers existed. Returns how many were marked.
+    """
+    keys = []
+    paginator = s3.get_paginator('list_objects_v2')
+    for page in paginator.paginate(Bucket=bucket, Prefix=f"{LEDGER_PREFIX}/"):
+        keys.extend(obj['Key'] for obj in page.get('Contents', []) if not _is_part(obj['Key']))
+    unfinished = [entry for entry in _load_all(s3, bucket, keys) if entry and not is_finished(entry)]
+    for entry in unfinished:
+        _mark_open(s3, bucket, entry['ledger_key'])
+    return len(unfinished)
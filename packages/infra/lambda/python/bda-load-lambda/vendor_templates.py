@@ -0,0 +1,510 @@
+import io
+import os
+import re
+import csv
+import json
+import time
+import hashlib
+from datetime import datetime, timezone
+
+from botocore.exceptions import ClientError
+from pypdf import PdfReader
+
+from document_classifier import is_generic_header
+from invoice_fields import FIELD_ALIASES, LINE_AMOUNT_KEYS, LINE_ITEM_KEYS, fold_key
+
+TEMPLATE_PREFIX = "vendor-templates"
+SUPPLIER_LIST_KEY = "SupplierList.csv"
+# Only short digital documents are worth a template; longer ones go to BDA
+FAST_PATH_MAX_PAGES = int(os.environ.get('FAST_PATH_MAX_PAGES', '5'))
+# Below this a template extraction is discarded and the document goes to BDA
+FAST_PATH_MIN_CONFIDENCE = float(os.environ.get('FAST_PATH_MIN_CONFIDENCE', '0.9'))
+# Templates, letterhead pointers and the supplier master are cached per container for this long
+CACHE_SECONDS = int(os.environ.get('VENDOR_TEMPLATE_CACHE_SECONDS', '300'))
+# Templates of an older format are ignored and relearned
+TEMPLATE_FORMAT = 3
+
+# Canonical invoice fields (invoice_fields.FIELD_ALIASES) a template can learn, and how their values look.
+# Templates record the key the attached blueprint used for each one and extract into the same keys.
+FIELD_KINDS = {
+    'invoice_number': 'code', 'currency': 'code', 'invoice_date': 'date', 'due_date': 'date',
+    'payment_terms': 'text', 'subtotal': 'amount', 'tax_amount': 'amount', 'tax_rate': 'amount',
+    'discount': 'amount', 'shipping': 'amount', 'total': 'amount',
+}
+REQUIRED_FIELDS = ('invoice_number', 'total')
+# Fields that are the same on every invoice from a supplier and are copied when not printed with a label.
+# The vendor is never one of them: it is read from the document, which must name the supplier.
+CONSTANT_FIELDS = ('currency',)
+LINE_COLUMNS = ('quantity', 'unit_price', 'amount')
+LINE_ALIASES = {
+    'description': ('description', 'itemdescription', 'item'),
+    'quantity': ('quantity', 'qty'),
+    'unit_price': ('unitprice', 'price', 'rate'),
+    'amount': LINE_AMOUNT_KEYS,
+}
+VALUE_PATTERNS = {
+    'amount': r'\(?-?[$€£¥]?\s?\d[\d,]*(?:\.\d+)?\)?%?',
+    'date': r'\d{1,4}[/.-]\d{1,2}[/.-]\d{2,4}|\d{1,2}\s+[A-Za-z]{3,9}\.?\s+\d{4}|[A-Za-z]{3,9}\.?\s+\d{1,2},?\s+\d{4}',
+    'code': r'[A-Za-z0-9][A-Za-z0-9/_.#-]*',
+    'text': r'\S(?:.*\S)?',
+}
+DATE_FORMATS = (
+    '%Y-%m-%d', '%m/%d/%Y', '%Y/%m/%d', '%d-%m-%Y', '%d.%m.%Y',
+    '%d %b %Y', '%d %B %Y', '%b %d, %Y', '%B %d, %Y', '%b %d %Y', '%B %d %Y', '%m/%d/%y',
+)
+AMOUNT_TOLERANCE = 0.011
+
+_AMOUNT_STRIP = re.compile(r'[^0-9.\-]')
+_NAME_NOISE = re.compile(r'[^a-z0-9]+')
+_NAME_SUFFIXES = {'limited', 'ltd', 'co', 'company', 'inc', 'corp', 'corporation', 'llc', 'plc', 'the'}
+_compiled = {}
+_cache = {}
+
+
+def blueprint_field(mapping, aliases):
+    """
+    (key, value) of the first alias the blueprint output has a value for, with the key spelled
+    as the blueprint spells it; (None, None) when there is none
+    """
+    keys = {fold_key(key): key for key in mapping} if isinstance(mapping, dict) else {}
+    for alias in aliases:
+        key = keys.get(alias)
+        if key is not None and mapping[key] not in (None, '', 'N/A'):
+            return key, mapping[key]
+    return None, None
+
+
+def _regex(pattern):
+    if pattern not in _compiled:
+        _compiled[pattern] = re.compile(pattern, re.IGNORECASE)
+    return _compiled[pattern]
+
+
+def parse_amount(value):
+    if value is None or isinstance(value, bool):
+        return None
+    if isinstance(value, (int, float)):
+        return float(value)
+    text = str(value).strip()
+    negative = text.startswith('(') and text.endswith(')')
+    text = _AMOUNT_STRIP.sub('', text)
+    try:
+        amount = float(text)
+    except ValueError:
+        return None
+    return -amount if negative else amount
+
+
+def parse_date(value):
+    text = str(value or '').strip()
+    if ' ' in text:
+        # "Jan. 5, 2024"; dots between digits (05.01.2024) are separators and kept
+        text = re.sub(r'\s+', ' ', text.replace('.', ''))
+    for fmt in DATE_FORMATS:
+        try:
+            return datetime.strptime(text, fmt).date().isoformat()
+        except ValueError:
+            continue
+    return None
+
+
+def normalize_name(name):
+    tokens = _NAME_NOISE.sub(' ', str(name or '').lower()).split()
+    return ' '.join(token for token in tokens if token not in _NAME_SUFFIXES)
+
+
+def same_value(kind, found, expected):
+    if kind == 'amount':
+        found, expected = parse_amount(found), parse_amount(expected)
+        return found is not None and expected is not None and abs(found - expected) < AMOUNT_TOLERANCE
+    if kind == 'date':
+        found = parse_date(found)
+        return found is not None and found == parse_date(expected)
+    return str(found).strip().casefold() == str(expected).strip().casefold()
+
+
+def pdf_lines(pdf_bytes, max_pages=FAST_PATH_MAX_PAGES):
+    """
+    Non-empty text-layer lines of a short PDF; None when it is too long, unreadable or has no text layer
+    """
+    try:
+        reader = PdfReader(io.BytesIO(pdf_bytes))
+        if not 0 < len(reader.pages) <= max_pages:
+            return None
+        text = '\n'.join(page.extract_text() or '' for page in reader.pages)
+    except Exception as e:
+        print(f"Could not read PDF text layer: {str(e)}")
+        return None
+    lines = [re.sub(r'[ \t]+', ' ', line).strip() for line in text.splitlines()]
+    return [line for line in lines if line] or None
+
+
+# Storage: one template per supplier id, plus a pointer from each letterhead to its supplier
+
+def _safe(value):
+    return re.sub(r'[^A-Za-z0-9_-]', '_', str(value))
+
+
+def template_key(supplier_id):
+    return f"{TEMPLATE_PREFIX}/suppliers/{_safe(supplier_id)}.json"
+
+
+def letterhead_key(letterhead):
+    return f"{TEMPLATE_PREFIX}/letterheads/{hashlib.sha1(letterhead.encode('utf-8')).hexdigest()[:24]}.json"
+
+
+def normalize_letterhead(header):
+    return re.sub(r'[^a-z0-9]+', ' ', (header or '').lower()).strip() or None
+
+
+def _cached(key, load):
+    entry = _cache.get(key)
+    if entry and time.time() - entry[0] < CACHE_SECONDS:
+        return entry[1]
+    value = load()
+    _cache[key] = (time.time(), value)
+    return value
+
+
+def _load_json(s3, bucket, key):
+    try:
+        return json.loads(s3.get_object(Bucket=bucket, Key=key)['Body'].read())
+    except ClientError as e:
+        if e.response['Error']['Code'] in ('NoSuchKey', '404'):
+            return None
+        raise
+
+
+def _put_json(s3, bucket, key, value):
+    s3.put_object(Bucket=bucket, Key=key, Body=json.dumps(value), ContentType='application/json')
+    _cache[key] = (time.time(), value)
+
+
+def find_template(s3, bucket, header):
+    """
+    The learned template of the supplier whose letterhead heads the document, or None
+    """
+    letterhead = normalize_letterhead(header)
+    if not letterhead or is_generic_header(header):
+        return None
+    pointer = _cached(letterhead_key(letterhead), lambda: _load_json(s3, bucket, letterhead_key(letterhead)))
+    if not pointer:
+        return None
+    key = template_key(pointer['supplier_id'])
+    template = _cached(key, lambda: _load_json(s3, bucket, key))
+    return template if template and template.get('format') == TEMPLATE_FORMAT else None
+
+
+def load_suppliers(s3, bucket):
+    """
+    {normalized name or alias: supplier id} from the supplier master
+    """
+    def load():
+        try:
+            content = s3.get_object(Bucket=bucket, Key=SUPPLIER_LIST_KEY)['Body'].read().decode('utf-8-sig')
+        except ClientError as e:
+            if e.response['Error']['Code'] in ('NoSuchKey', '404'):
+                return {}
+            raise
+        rows = list(csv.reader(io.StringIO(content)))
+        headers = [header.strip().lower() for header in rows[0]] if rows else []
+        alias_column = next((i for i, header in enumerate(headers) if header in ('alias', 'aliases')), None)
+        names = {}
+        for values in rows[1:]:
+            values = values + [''] * (3 - len(values))
+            code = values[0].strip()
+            candidates = [f"{values[1].strip()} {values[2].strip()}", values[1]]
+            if alias_column is not None and alias_column < len(values):
+                candidates += values[alias_column].split(';')
+            for candidate in candidates:
+                if code and normalize_name(candidate):
+                    names.setdefault(normalize_name(candidate), code)
+        return names
+    return _cached(SUPPLIER_LIST_KEY, load)
+
+
+# Extraction
+
+def _extract_field(lines, rule):
+    pattern = VALUE_PATTERNS[rule['kind']]
+    if rule.get('next_line'):
+        for number, line in enumerate(lines[:-1]):
+            if line.casefold() == rule['anchor'].casefold():
+                matches = list(_regex(pattern).finditer(lines[number + 1]))
+                return matches[rule['position']].group(0) if rule['position'] < len(matches) else None
+        return None
+    regex = _regex(rf"{re.escape(rule['anchor'])}\s*[:#]?\s*({pattern})")
+    for line in lines:
+        match = regex.search(line)
+        if match:
+            return match.group(1).strip()
+    return None
+
+
+def _row_regex(columns):
+    numbers = ''.join(rf"\s+({VALUE_PATTERNS['amount']})" for _ in columns)
+    return _regex(rf"^(.+?){numbers}$")
+
+
+def _extract_line_items(lines, rule):
+    start = next((number for number, line in enumerate(lines) if line.casefold() == rule['header'].casefold()), None)
+    if start is None:
+        return []
+    regex = _row_regex(rule['columns'])
+    items = []
+    for line in lines[start + 1:]:
+        if rule.get('end') and line.casefold().startswith(rule['end'].casefold()):
+            break
+        match = regex.match(line)
+        if not match:
+            continue
+        item = {'description': match.group(1).strip()}
+        for column, value in zip(rule['columns'], match.groups()[1:]):
+            if column in LINE_COLUMNS:
+                item[column] = parse_amount(value)
+        items.append(item)
+    return items
+
+
+def _confidence(template, values, items, found):
+    """
+    Share of the template's fields found, halved when the amounts do not add up
+    """
+    if any(values.get(field) is None for field in REQUIRED_FIELDS):
+        return 0.0
+    expected = len(template['fields']) + (1 if template.get('line_items') else 0)
+    coverage = found / expected if expected else 0.0
+
+    amounts = {field: parse_amount(values.get(field)) for field in FIELD_KINDS if FIELD_KINDS[field] == 'amount'}
+    checks = []
+    if items:
+        lines_total = sum(item.get('amount') or 0 for item in items)
+        against = amounts['subtotal'] if amounts['subtotal'] is not None else amounts['total']
+        checks.append(abs(lines_total - against) <= AMOUNT_TOLERANCE * len(items))
+    if amounts['subtotal'] is not None:
+        computed = (amounts['subtotal'] + (amounts['tax_amount'] or 0) + (amounts['shipping'] or 0)
+                    - abs(amounts['discount'] or 0))
+        checks.append(abs(computed - amounts['total']) <= AMOUNT_TOLERANCE)
+    if not checks:
+        return round(coverage * 0.95, 3)
+    return round(coverage if all(checks) else coverage * 0.5, 3)
+
+
+def vendor_tokens(name):
+    """
+    Words of a supplier name without legal-form suffixes, which invoices often abbreviate
+    """
+    return [token for token in re.findall(r'[A-Za-z0-9]+', str(name or '')) if token.lower() not in _NAME_SUFFIXES]
+
+
+def find_vendor(lines, tokens):
+    """
+    The supplier name as printed in the document, suffix included, or None when it is not there
+    """
+    if not tokens:
+        return None
+    suffixes = '|'.join(sorted(_NAME_SUFFIXES - {'the'}))
+    regex = _regex(r'(?<![A-Za-z0-9])' + r'[^A-Za-z0-9\n]{1,3}'.join(re.escape(token) for token in tokens)
+                   + rf'(?:[ ,.]+(?:{suffixes})\b\.?)*(?![A-Za-z0-9])')
+    for line in lines:
+        match = regex.search(line)
+        if match:
+            return match.group(0).strip()
+    return None
+
+
+def apply_template(template, lines):
+    """
+    Extract an inference_result in the keys of the blueprint the template was learned from;
+    returns (inference_result, confidence). A document that does not name the template's
+    supplier is not extracted at all.
+    """
+    vendor = find_vendor(lines, template.get('vendor_tokens'))
+    if not vendor:
+        return {}, 0.0
+    values, found = {}, 0
+    for field, rule in template['fields'].items():
+        raw = _extract_field(lines, rule)
+        if raw is None:
+            continue
+        found += 1
+        values[field] = parse_amount(raw) if rule['kind'] == 'amount' else raw
+    items = _extract_line_items(lines, template['line_items']) if template.get('line_items') else []
+    if items:
+        found += 1
+
+    inference_result = {**template.get('constants', {}), template['vendor_key']: vendor}
+    for field, value in values.items():
+        inference_result[template['fields'][field]['key']] = value
+    if items:
+        keys = template['line_items']['keys']
+        inference_result[template['line_items']['key']] = [
+            {keys[column]: value for column, value in item.items() if column in keys} for item in items
+        ]
+    return inference_result, _confidence(template, values, items, found)
+
+
+def template_result(template, inference_result, confidence):
+    """
+    A processed result shaped like a BDA custom output, so readers cannot tell the paths apart
+    """
+    return {
+        'matched_blueprint': {'name': f"vendor-template:{template['supplier_id']}", 'confidence': confidence},
+        'document_class': {'type': template.get('document_class')},
+        'inference_result': inference_result,
+    }
+
+
+# Learning
+
+def _label(text):
+    """
+    Trailing words of a line segment that contain no digits, i.e. the field label before a value
+    """
+    words = []
+    for word in reversed(text.split()):
+        if re.search(r'\d', word):
+            break
+        words.append(word)
+    label = ' '.join(reversed(words))
+    return label if re.search(r'[A-Za-z]{2}', label) else None
+
+
+def _leading_label(text):
+    words = []
+    for word in text.split():
+        if re.search(r'\d', word):
+            break
+        words.append(word)
+    label = ' '.join(words)
+    return label if re.search(r'[A-Za-z]{2}', label) else None
+
+
+def _spans(line, kind, expected):
+    if kind in ('amount', 'date'):
+        return [match.span() for match in _regex(VALUE_PATTERNS[kind]).finditer(line)
+                if same_value(kind, match.group(0), expected)]
+    text = str(expected).strip()
+    start = line.casefold().find(text.casefold()) if text else -1
+    return [(start, start + len(text))] if start >= 0 else []
+
+
+def _learn_field(lines, field, expected):
+    kind = FIELD_KINDS[field]
+    for number, line in enumerate(lines):
+        for start, end in _spans(line, kind, expected):
+            label = _label(line[:start])
+            if label:
+                return {'anchor': label, 'kind': kind}
+            if number and not line[:start].strip() and kind != 'text' and _label(lines[number - 1]) == lines[number - 1]:
+                # Labels on one line, values below in the same order
+                starts = [match.start() for match in _regex(VALUE_PATTERNS[kind]).finditer(line)]
+                if start in starts:
+                    return {'anchor': lines[number - 1], 'kind': kind, 'next_line': True, 'position': starts.index(start)}
+    return None
+
+
+def _line_item(item):
+    """
+    An extracted line item as {canonical column: value}, plus {canonical column: blueprint key}
+    """
+    values, keys = {}, {}
+    for column, aliases in LINE_ALIASES.items():
+        key, value = blueprint_field(item, aliases)
+        if key is not None:
+            values[column], keys[column] = value, key
+    return values, keys
+
+
+def _learn_line_items(lines, items_key, items):
+    if not items_key or not isinstance(items, list) or not items:
+        return None
+    items = [_line_item(item) for item in items]
+    keys = items[0][1]
+    items = [values for values, _ in items]
+    rows = []
+    for item in items:
+        description = str(item.get('description') or '').strip()
+        total = item.get('amount')
+        if not description or total is None:
+            return None
+        number = next((number for number, line in enumerate(lines)
+                       if line.casefold().startswith(description[:20].casefold()) and _spans(line, 'amount', total)), None)
+        if number is None:
+            return None
+        rows.append(number)
+    if not rows or rows[0] == 0:
+        return None
+
+    # Map the numbers at the end of the first row onto the item's columns, in print order
+    first = lines[rows[0]]
+    tail = first[len(str(items[0]['description']).strip()):]
+    columns = []
+    for match in _regex(VALUE_PATTERNS['amount']).finditer(tail):
+        column = next((name for name in LINE_COLUMNS if name not in columns and items[0].get(name) is not None
+                       and same_value('amount', match.group(0), items[0][name])), 'other')
+        columns.append(column)
+    if 'amount' not in columns:
+        return None
+    after = lines[rows[-1] + 1] if rows[-1] + 1 < len(lines) else ''
+    return {'header': lines[rows[0] - 1], 'columns': columns, 'end': _leading_label(after),
+            'key': items_key, 'keys': keys}
+
+
+def learn_template(s3, bucket, header, lines, result, source=None):
+    """
+    Learn a supplier template from a digital invoice and the blueprint result BDA
+    produced for it. The template is kept only if applying it to the same text
+    reproduces BDA's values; returns it, or None when nothing reliable was learned.
+    """
+    letterhead = normalize_letterhead(header)
+    inference_result = (result or {}).get('inference_result') or {}
+    vendor_key, vendor_name = blueprint_field(inference_result, FIELD_ALIASES['vendor'])
+    supplier_id = load_suppliers(s3, bucket).get(normalize_name(vendor_name))
+    if not letterhead or is_generic_header(header) or not supplier_id or not lines:
+        return None
+    # The supplier's own name is what later documents are checked against before the template applies
+    tokens = vendor_tokens(vendor_name)
+    if not find_vendor(lines, tokens):
+        print(f"Template for supplier {supplier_id} not learned: vendor name not in the text layer")
+        return None
+
+    fields, expected, constants = {}, {}, {}
+    for field in FIELD_KINDS:
+        key, value = blueprint_field(inference_result, FIELD_ALIASES[field])
+        if key is None:
+            continue
+        rule = _learn_field(lines, field, value)
+        if rule:
+            fields[field], expected[field] = {**rule, 'key': key}, value
+        elif field in CONSTANT_FIELDS:
+            constants[key] = value
+    items_key, items = blueprint_field(inference_result, LINE_ITEM_KEYS)
+    template = {
+        'format': TEMPLATE_FORMAT,
+        'supplier_id': supplier_id,
+        'letterhead': letterhead,
+        'document_class': ((result or {}).get('document_class') or {}).get('type'),
+        'vendor_key': vendor_key,
+        'vendor_tokens': tokens,
+        'fields': fields,
+        'line_items': _learn_line_items(lines, items_key, items),
+        'constants': constants,
+        'learned_from': source,
+        'learned_at': datetime.now(timezone.utc).isoformat(),
+    }
+
+    # Drop rules that do not reproduce BDA's value, then require a confident result
+    extracted, _ = apply_template(template, lines)
+    for field, rule in list(fields.items()):
+        if not same_value(rule['kind'], extracted.get(rule['key'], ''), expected[field]):
+            del fields[field]
+    extracted, confidence = apply_template(template, lines)
+    if confidence < FAST_PATH_MIN_CONFIDENCE:
+        print(f"Template for supplier {supplier_id} not kept: confidence {confidence}")
+        return None
+
+    _put_json(s3, bucket, template_key(supplier_id), template)
+    _put_json(s3, bucket, letterhead_key(letterhead), {'supplier_id': supplier_id})
+    print(f"Learned template for supplier {supplier_id} with fields {sorted(fields)}")
+    return template
@@ -0,0 +1,124 @@
+import re
+import time
+
+# Supplier master columns that may carry bank details; several values are separated by ";"
+ACCOUNT_COLUMNS = ('bank account', 'bank account number', 'account number', 'iban')
+BANK_CODE_COLUMNS = ('bank code', 'bank key', 'routing number')
+SWIFT_COLUMNS = ('swift', 'swift code', 'swift/bic', 'bic')
+# Vendor name similarity needed before the claimed vendor is treated as identified
+VENDOR_MATCH_MIN = 0.8
+
+_NON_ALNUM = re.compile(r'[^0-9A-Z]')
+
+
+def normalize_account(value):
+    """
+    Upper-case alphanumerics only, so "012-345 678" and "012345678" compare equal
+    """
+    return _NON_ALNUM.sub('', str(value or '').upper())
+
+
+def normalize_swift(value):
+    """
+    SWIFT/BIC reduced to its 8-character institution code; "XXX" and no branch are the same office
+    """
+    swift = normalize_account(value)
+    return swift[:8] if len(swift) in (8, 11) else swift
+
+
+def _values(cell):
+    return [value.strip() for value in str(cell or '').split(';') if value.strip()]
+
+
+def bank_fields(headers, values):
+    """
+    Pull bank details out of one supplier master row by header name
+    """
+    def column(names):
+        return [value for i, header in enumerate(headers) if header in names and i < len(values)
+                for value in _values(values[i])]
+    return {
+        'bank_accounts': column(ACCOUNT_COLUMNS),
+        'bank_codes': column(BANK_CODE_COLUMNS),
+        'swift_codes': column(SWIFT_COLUMNS),
+    }
+
+
+def build_bank_index(suppliers):
+    """
+    Exact-match index from normalized account (with and without bank code) and SWIFT to supplier positions
+    """
+    accounts = {}
+    swifts = {}
+    for position, supplier in enumerate(suppliers):
+        codes = [normalize_account(code) for code in supplier.get('bank_codes', [])]
+        for account in supplier.get('bank_accounts', []):
+            account = normalize_account(account)
+            if not account:
+                continue
+            for key in [account] + [f"{code}:{account}" for code in codes if code]:
+                owners = accounts.setdefault(key, [])
+                if position not in owners:
+                    owners.append(position)
+        for swift in supplier.get('swift_codes', []):
+            owners = swifts.setdefault(normalize_swift(swift), [])
+            if position not in owners:
+                owners.append(position)
+    return {'accounts': accounts, 'swift': swifts}
+
+
+def _describe(suppliers, positions):
+    return [{'vendor_id': suppliers[p]['code'], 'vendor_name': suppliers[p]['name']} for p in positions]
+
+
+def verify_bank_details(bank_index, suppliers, vendor_matches, bank_account=None, bank_code=None, swift_code=None):
+    """
+    Check extracted bank details against the supplier master.
+
+    vendor_matches are (position, similarity) pairs for the vendor named on the
+    invoice. Returns status VERIFIED, MISMATCH (account or SWIFT belongs to
+    someone else), UNVERIFIED_ACCOUNT (vendor has other accounts on file) or
+    NO_MASTER_DATA, with the issues found.
+    """
+    start = time.perf_counter()
+    account = normalize_account(bank_account)
+    code = normalize_account(bank_code)
+    swift = normalize_swift(swift_code)
+    claimed = {position for position, similarity in vendor_matches if similarity >= VENDOR_MATCH_MIN}
+
+    owners = []
+    if account:
+        owners = bank_index['accounts'].get(f"{code}:{account}") if code else None
+        owners = owners or bank_index['accounts'].get(account, [])
+    swift_owners = bank_index['swift'].get(swift, []) if swift else []
+
+    issues = []
+    swift_on_file = {normalize_swift(s) for p in claimed for s in suppliers[p].get('swift_codes', [])}
+    swift_mismatch = bool(swift and swift_on_file and swift not in swift_on_file)
+    accounts_on_file = any(suppliers[p].get('bank_accounts') for p in claimed)
+
+    if owners and not claimed.intersection(owners):
+        status = 'MISMATCH'
+        issues.append('Bank account belongs to a different supplier than the invoice vendor')
+    elif swift_mismatch:
+        status = 'MISMATCH'
+    elif owners or (swift and swift in swift_on_file and not account):
+        status = 'VERIFIED'
+    elif account and accounts_on_file:
+        status = 'UNVERIFIED_ACCOUNT'
+        issues.append('Bank account is not on file for this vendor')
+    else:
+        status = 'NO_MASTER_DATA'
+    if swift_mismatch:
+        issues.append('SWIFT code differs from the one on file for this vendor')
+    if not claimed:
+        issues.append('Invoice vendor could not be identified in the supplier master')
+
+    return {
+        'status': status,
+        'issues': issues,
+        'account_owners': _describe(suppliers, owners),
+        'swift_owners': _describe(suppliers, swift_owners),
+        'claimed_vendor': _describe(suppliers, sorted(claimed)),
+        'lookup_us': round((time.perf_counter() - start) * 1e6, 1),
+    }
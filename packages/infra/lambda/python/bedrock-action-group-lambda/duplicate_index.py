@@ -0,0 +1,357 @@
+import os
+import glob
+import re
+import zlib
+import struct
+import logging
+from array import array
+from bisect import bisect_left, bisect_right
+from datetime import date
+
+from botocore.exceptions import ClientError
+
+from invoice_fields import normalize_vendor_name, parse_amount, parse_date
+
+logger = logging.getLogger()
+
+INDEX_KEY = "indexes/duplicate-index.bin"
+LOCAL_INDEX_PATH = "/tmp/duplicate-index.bin"
+AMOUNT_ABS_TOLERANCE = 1.00
+AMOUNT_REL_TOLERANCE = 0.005
+DATE_TOLERANCE_DAYS = 3
+SAVE_RETRIES = 3
+# New entries wait in small per-supplier buffers until this many, or a quarter of the index,
+# have been added (or the index is saved), then are merged into the sorted arrays in one pass
+# instead of one O(n) insert into every array each; a bulk load is then O(n log n)
+MERGE_THRESHOLD = 1024
+
+# On-disk layout: magic, version, entry count, then zlib-compressed sections
+# (sorted int64 keys, int32 date ordinals, supplier table, invoice numbers,
+# invoice ids). Arrays load with a single frombytes call each.
+_MAGIC = b"DUPIDX"
+_VERSION = 1
+_HEADER = struct.Struct("<6sHI")
+_SEP = "\x1f"
+# Composite key = supplier slot in the high bits, offset amount in cents below
+_AMOUNT_BITS = 43
+_AMOUNT_OFFSET = 1 << (_AMOUNT_BITS - 1)
+_AMOUNT_MASK = (1 << _AMOUNT_BITS) - 1
+_INVOICE_NUMBER_NOISE = re.compile(r"[^A-Z0-9]")
+
+_cached_index = None
+_cached_etag = None
+
+
+def normalize_invoice_number(invoice_number):
+    if not invoice_number:
+        return ""
+    return _INVOICE_NUMBER_NOISE.sub("", str(invoice_number).upper()).lstrip("0")
+
+
+def normalize_supplier(supplier_id, vendor_name=None):
+    if supplier_id:
+        return str(supplier_id).strip().upper()
+    return normalize_vendor_name(vendor_name)
+
+
+def _to_cents(amount):
+    cents = int(round(amount * 100)) + _AMOUNT_OFFSET
+    return min(max(cents, 0), _AMOUNT_MASK)
+
+
+def _to_ordinal(iso_date):
+    return date.fromisoformat(iso_date).toordinal() if iso_date else 0
+
+
+class DuplicateIndex:
+    """
+    Sorted index over (supplier, amount, date, invoice number) tuples.
+
+    Entries are kept in parallel arrays ordered by a composite int64 key so a
+    fuzzy amount lookup is a bisect over one supplier's key range, and exact
+    invoice-number matches are a dict hit. Added entries go to per-supplier
+    sorted buffers that are merged into the arrays in one pass per batch;
+    lookups see buffered entries before the merge.
+    """
+
+    def __init__(self):
+        self.suppliers = []
+        self._supplier_slots = {}
+        self.keys = array("q")
+        self.dates = array("i")
+        self.invoice_numbers = []
+        self.invoice_ids = []
+        self._id_set = set()
+        self._by_number = {}
+        # supplier slot -> (sorted keys, rows) added since the last merge
+        self._pending = {}
+        self._pending_count = 0
+
+    def __len__(self):
+        return len(self.keys) + self._pending_count
+
+    def _slot(self, supplier, create=False):
+        slot = self._supplier_slots.get(supplier)
+        if slot is None and create:
+            slot = len(self.suppliers)
+            self.suppliers.append(supplier)
+            self._supplier_slots[supplier] = slot
+        return slot
+
+    def add(self, invoice_id, supplier, amount, invoice_date=None, invoice_number=None):
+        """
+        Insert one invoice; re-adding an invoice_id that is already indexed is a no-op
+        """
+        number = normalize_invoice_number(invoice_number)
+        amount = parse_amount(amount)
+        if not supplier or amount is None:
+            return False
+        if invoice_id in self._id_set:
+            return False
+        slot = self._slot(supplier, create=True)
+        key = (slot << _AMOUNT_BITS) | _to_cents(amount)
+        keys, rows = self._pending.setdefault(slot, ([], []))
+        position = bisect_right(keys, key)
+        keys.insert(position, key)
+        rows.insert(position, (key, _to_ordinal(parse_date(invoice_date)), number, invoice_id))
+        self._pending_count += 1
+        self._id_set.add(invoice_id)
+        if number:
+            self._by_number.setdefault((slot, number), invoice_id)
+        if self._pending_count >= max(MERGE_THRESHOLD, len(self.keys) // 4):
+            self.merge()
+        return True
+
+    def merge(self):
+        """
+        Merge buffered entries into the sorted arrays in one pass of slice copies;
+        equal keys keep insertion order
+        """
+        if not self._pending:
+            return
+        keys, dates, numbers, ids = array("q"), array("i"), [], []
+        start = 0
+        # The slot is the high bits of the key, so slots in order give rows in key order
+        rows = (row for slot in sorted(self._pending) for row in self._pending[slot][1])
+        for key, ordinal, number, invoice_id in rows:
+            position = bisect_right(self.keys, key, start)
+            keys.extend(self.keys[start:position])
+            dates.extend(self.dates[start:position])
+            numbers.extend(self.invoice_numbers[start:position])
+            ids.extend(self.invoice_ids[start:position])
+            keys.append(key)
+            dates.append(ordinal)
+            numbers.append(number)
+            ids.append(invoice_id)
+            start = position
+        keys.extend(self.keys[start:])
+        dates.extend(self.dates[start:])
+        numbers.extend(self.invoice_numbers[start:])
+        ids.extend(self.invoice_ids[start:])
+        self.keys, self.dates, self.invoice_numbers, self.invoice_ids = keys, dates, numbers, ids
+        self._pending, self._pending_count = {}, 0
+
+    def _in_range(self, slot, low, high):
+        """
+        (invoice_id, date ordinal) of entries with a key in [low, high], merged or buffered
+        """
+        for position in range(bisect_left(self.keys, low), bisect_right(self.keys, high)):
+            yield self.invoice_ids[position], self.dates[position]
+        keys, rows = self._pending.get(slot, ((), ()))
+        for position in range(bisect_left(keys, low), bisect_right(keys, high)):
+            _, ordinal, _, invoice_id = rows[position]
+            yield invoice_id, ordinal
+
+    def find_duplicates(self, supplier, amount, invoice_date=None, invoice_number=None, exclude_id=None):
+        """
+        Return indexed invoices that are possible duplicates of the given one
+        """
+        slot = self._slot(supplier)
+        if slot is None:
+            return []
+        matches = {}
+
+        number = normalize_invoice_number(invoice_number)
+        if number:
+            match = self._by_number.get((slot, number))
+            if match and match != exclude_id:
+                matches[match] = "invoice_number"
+
+        amount = parse_amount(amount)
+        ordinal = _to_ordinal(parse_date(invoice_date))
+        if amount is not None and ordinal:
+            tolerance = max(AMOUNT_ABS_TOLERANCE, AMOUNT_REL_TOLERANCE * abs(amount))
+            low = (slot << _AMOUNT_BITS) | _to_cents(amount - tolerance)
+            high = (slot << _AMOUNT_BITS) | _to_cents(amount + tolerance)
+            for candidate, other_date in self._in_range(slot, low, high):
+                if candidate == exclude_id or candidate in matches or not other_date:
+                    continue
+                if abs(other_date - ordinal) <= DATE_TOLERANCE_DAYS:
+                    matches[candidate] = "amount_and_date"
+
+        return [{"invoice_id": invoice_id, "matched_on": reason} for invoice_id, reason in matches.items()]
+
+    def to_bytes(self):
+        self.merge()
+        sections = [
+            self.keys.tobytes(),
+            self.dates.tobytes(),
+            _SEP.join(self.suppliers).encode("utf-8"),
+            _SEP.join(self.invoice_numbers).encode("utf-8"),
+            _SEP.join(self.invoice_ids).encode("utf-8"),
+        ]
+        body = b"".join(struct.pack("<I", len(section)) + section for section in sections)
+        return _HEADER.pack(_MAGIC, _VERSION, len(self.keys)) + zlib.compress(body)
+
+    @classmethod
+    def from_bytes(cls, data):
+        magic, version, count = _HEADER.unpack_from(data)
+        if magic != _MAGIC or version != _VERSION:
+            raise ValueError("Unrecognized duplicate index format")
+        body = zlib.decompress(data[_HEADER.size:])
+        sections = []
+        offset = 0
+        while offset < len(body):
+            (length,) = struct.unpack_from("<I", body, offset)
+            offset += 4
+            sections.append(body[offset:offset + length])
+            offset += length
+
+        index = cls()
+        index.keys.frombytes(sections[0])
+        index.dates.frombytes(sections[1])
+
+        def split(section):
+            return section.decode("utf-8").split(_SEP) if count else []
+
+        suppliers = sections[2].decode("utf-8")
+        index.suppliers = suppliers.split(_SEP) if suppliers else []
+        index._supplier_slots = {supplier: slot for slot, supplier in enumerate(index.suppliers)}
+        index.invoice_numbers = split(sections[3])
+        index.invoice_ids = split(sections[4])
+        index._id_set = set(index.invoice_ids)
+        for key, number, invoice_id in zip(index.keys, index.invoice_numbers, index.invoice_ids):
+            if number:
+                index._by_number.setdefault((key >> _AMOUNT_BITS, number), invoice_id)
+        return index
+
+
+def load_index(s3_client, bucket, key=INDEX_KEY):
+    """
+    Return the index, reusing the in-memory or /tmp copy while the S3 ETag is unchanged
+    """
+    global _cached_index, _cached_etag
+    try:
+        etag = s3_client.head_object(Bucket=bucket, Key=key)["ETag"]
+    except ClientError as e:
+        if e.response["Error"]["Code"] in ("404", "NoSuchKey", "NotFound"):
+            _cached_index, _cached_etag = DuplicateIndex(), None
+            return _cached_index
+        raise
+
+    if _cached_index is not None and _cached_etag == etag:
+        return _cached_index
+
+    local_path = f"{LOCAL_INDEX_PATH}.{etag.strip(chr(34))}"
+    if os.path.exists(local_path):
+        with open(local_path, "rb") as f:
+            data = f.read()
+    else:
+        data = s3_client.get_object(Bucket=bucket, Key=key, IfMatch=etag)["Body"].read()
+        for stale in glob.glob(f"{LOCAL_INDEX_PATH}.*"):
+            os.remove(stale)
+        with open(local_path, "wb") as f:
+            f.write(data)
+
+    _cached_index, _cached_etag = DuplicateIndex.from_bytes(data), etag
+    logger.info(f"Loaded duplicate index with {len(_cached_index)} entries (etag {etag})")
+    return _cached_index
+
+
+def save_index(s3_client, bucket, index, key=INDEX_KEY):
+    """
+    Conditionally write the index so concurrent writers cannot overwrite each other
+    """
+    global _cached_etag
+    conditions = {"IfMatch": _cached_etag} if _cached_etag else {"IfNoneMatch": "*"}
+    response = s3_client.put_object(Bucket=bucket, Key=key, Body=index.to_bytes(), **conditions)
+    _cached_etag = response["ETag"]
+
+
+def check_many(s3_client, bucket, entries, allow_duplicate=False):
+    """
+    Look up possible duplicates without changing the index, so nothing is recorded for
+    invoices that are never stored; record the stored ones afterwards with record_many.
+
+    Invoices earlier in the batch count as recorded unless they were held back
+    themselves. Returns {invoice_id: possible_duplicates}.
+    """
+    index = load_index(s3_client, bucket)
+    batch = DuplicateIndex()
+    results = {}
+    for invoice_id, supplier, amount, invoice_date, invoice_number in entries:
+        duplicates = (index.find_duplicates(supplier, amount, invoice_date, invoice_number, exclude_id=invoice_id)
+                      + batch.find_duplicates(supplier, amount, invoice_date, invoice_number, exclude_id=invoice_id))
+        results[invoice_id] = duplicates
+        if not duplicates or allow_duplicate:
+            batch.add(invoice_id, supplier, amount, invoice_date, invoice_number)
+    return results
+
+
+def record_many(s3_client, bucket, entries):
+    """
+    Add stored invoices to the index, whatever they match; entries are as for check_and_record_many.
+
+    check_many and record_many are two steps, so two invocations storing the same invoice at
+    once can both pass the check. The write is conditional and a lost write is re-checked
+    against the newer index, so the later writer always sees the earlier one's entries:
+    returns {invoice_id: possible_duplicates} against the index version actually saved.
+    """
+    return check_and_record_many(s3_client, bucket, entries, allow_duplicate=True)
+
+
+def check_and_record(s3_client, bucket, invoice_id, supplier, amount, invoice_date=None, invoice_number=None,
+                     allow_duplicate=False):
+    """
+    Look up possible duplicates and add the invoice to the index unless one was found
+    """
+    entry = (invoice_id, supplier, amount, invoice_date, invoice_number)
+    return check_and_record_many(s3_client, bucket, [entry], allow_duplicate)[invoice_id]
+
+
+def check_and_record_many(s3_client, bucket, entries, allow_duplicate=False):
+    """
+    Batch form of check_and_record: one index load and one conditional write.
+
+    entries are (invoice_id, supplier, amount, invoice_date, invoice_number)
+    tuples; returns {invoice_id: possible_duplicates}. A lost conditional
+    write means another invocation updated the index first, so the index is
+    reloaded and the whole batch re-checked against the newer version.
+    """
+    for _ in range(SAVE_RETRIES):
+        index = load_index(s3_client, bucket)
+        results = {}
+        changed = False
+        for invoice_id, supplier, amount, invoice_date, invoice_number in entries:
+            duplicates = index.find_duplicates(supplier, amount, invoice_date, invoice_number, exclude_id=invoice_id)
+            results[invoice_id] = duplicates
+            if duplicates and not allow_duplicate:
+                continue
+            changed = index.add(invoice_id, supplier, amount, invoice_date, invoice_number) or changed
+        if not changed:
+            return results
+        try:
+            save_index(s3_client, bucket, index)
+            return results
+        except ClientError as e:
+            # The cached copy now holds unsaved entries, so it must not be reused
+            _invalidate()
+            if e.response["Error"]["Code"] not in ("PreconditionFailed", "ConditionalRequestConflict"):
+                raise
+            logger.info("Duplicate index changed concurrently, reloading")
+    raise RuntimeError("Could not update duplicate index after concurrent modifications")
+
+
+def _invalidate():
+    global _cached_index, _cached_etag
+    _cached_index, _cached_etag = None, None
@@ -4,10 +4,65 @@ import boto3
 import logging
 import uuid
 from datetime import datetime
+from botocore.exceptions import ClientError
+
+from invoice_fields import normalize_invoice
+from invoice_validation import validate_invoice
+from duplicate_index import check_many, normalize_supplier, record_many
+from invoice_store import put_invoices
+from result_cache import ResultCache
+from invoice_query import InvoiceDataset, query_invoices as run_invoice_query
+from vendor_embeddings import VendorIndex
+from bank_verification import verify_bank_details as check_bank_details
+from metrics import emit_metrics
+from session_context import load_document_context, remember_document, session_state_response, summarize_document
+from response_shaping import STORED_RESULT_PREFIXES, select_path, shape_response
+import key_layout
 
 logger = logging.getLogger()
 logger.setLevel(logging.INFO)
 
+AWS_REGION = os.environ.get('AWS_REGION', '')
+ACCOUNT_ID = os.environ.get('ACCOUNT_ID', '')
+S3_BUCKET = f"data-bucket-{ACCOUNT_ID}-{AWS_REGION}"
+VENDOR_MATCH_LIMIT = 5
+# Same floor the web app's supplier matcher applies before showing a match
+VENDOR_MATCH_THRESHOLD = 0.3
+
+s3_client = boto3.client('s3')
+# Kept at module scope so warm invocations in the same session reuse it
+result_cache = ResultCache()
+invoice_dataset = InvoiceDataset()
+vendor_index = VendorIndex()
+
+def get_named_parameter(event, name, default=''):
+    """
+    Value of a function-schema parameter, which Bedrock sends as a list of name/value pairs
+    """
+    for item in event.get('parameters') or []:
+        if item['name'] == name:
+            return item['value']
+    return default
+
+def populate_function_response(event, body, document_context=None, state=None):
+    """
+    Function-schema response envelope around a response body string
+    """
+    function_response = {'responseBody': {'TEXT': {'body': body}}}
+    if state:
+        function_response['responseState'] = state
+    response = {
+        'messageVersion': '1.0',
+        'response': {
+            'actionGroup': event.get('actionGroup'),
+            'function': event.get('function'),
+            'functionResponse': function_response
+        }
+    }
+    if document_context is not None:
+        response.update(session_state_response(event, document_context))
+    return response
+
 def lambda_handler(event, context):
     """
     Lambda handler for invoice processing action group
@@ -15,127 +70,239 @@ def lambda_handler(event, context):
     logger.info(f"Received event: {json.dumps(event)}")
     
     try:
-        action_group = event.get('actionGroup')
-        api_path = event.get('apiPath')
-        
-        # Extract parameters from the request
-        parameters = {}
-        request_body = event.get('requestBody', {})
-        
-        if request_body:
-            parameters = request_body.get('parameters', {})
+        function = event.get('function')
         
         response = None
+        document_context = load_document_context(event)
         
-        # Route to the appropriate function based on the API path
-        if api_path == 'verify_invoice_documents':
-            document = parameters.get('document', '')
-            response = verify_invoice_documents(document)
-        elif api_path == 'record_application_details':
-            invoice_data = parameters.get('invoice_data', '')
-            invoice_id = parameters.get('invoice_id', '')
-            response = record_application_details(invoice_data, invoice_id)
-        elif api_path == 'retrieve_vendor_list':
-            search_criteria = parameters.get('search_criteria', '')
+        # Route to the appropriate function based on the function name in the action group schema
+        if function == 'verify_invoice_documents':
+            document = get_named_parameter(event, 'document') or (event.get('sessionAttributes') or {}).get('document', '')
+            refresh = get_named_parameter(event, 'refresh', 'false')
+            response = verify_invoice_documents(document, document_context, refresh)
+        elif function == 'record_application_details':
+            invoice_data = get_named_parameter(event, 'invoice_data')
+            invoice_id = get_named_parameter(event, 'invoice_id')
+            allow_duplicate = get_named_parameter(event, 'allow_duplicate', 'false')
+            response = record_application_details(invoice_data, invoice_id, allow_duplicate)
+        elif function == 'retrieve_vendor_list':
+            search_criteria = get_named_parameter(event, 'search_criteria')
             response = retrieve_vendor_list(search_criteria)
-        elif api_path == 'generate_csv':
-            invoice_id = parameters.get('invoice_id', '')
-            include_vendor_mapping = parameters.get('include_vendor_mapping', 'true')
+        elif function == 'verify_bank_details':
+            response = verify_bank_details(
+                get_named_parameter(event, 'document'),
+                get_named_parameter(event, 'vendor'),
+                get_named_parameter(event, 'bank_account'),
+                get_named_parameter(event, 'bank_code'),
+                get_named_parameter(event, 'swift_code')
+            )
+        elif function == 'query_invoices':
+            response = query_invoices(
+                get_named_parameter(event, 'vendor'),
+                get_named_parameter(event, 'date_from'),
+                get_named_parameter(event, 'date_to'),
+                get_named_parameter(event, 'currency'),
+                get_named_parameter(event, 'group_by', 'none'),
+                get_named_parameter(event, 'limit')
+            )
+        elif function == 'get_stored_result':
+            response = get_stored_result(get_named_parameter(event, 'result_key'), get_named_parameter(event, 'path'))
+        elif function == 'generate_csv':
+            invoice_id = get_named_parameter(event, 'invoice_id')
+            include_vendor_mapping = get_named_parameter(event, 'include_vendor_mapping', 'true')
             response = generate_csv(invoice_id, include_vendor_mapping)
         else:
-            raise ValueError(f"Unknown API path: {api_path}")
+            raise ValueError(f"Unknown function: {function}")
         
-        return {
-            'messageVersion': '1.0',
-            'response': response
-        }
+        return populate_function_response(event, response['content'], document_context)
     except Exception as e:
         logger.error(f"Error processing request: {str(e)}")
-        return {
-            'messageVersion': '1.0',
-            'response': {
-                'error': str(e)
-            }
-        }
+        return populate_function_response(event, json.dumps({'error': str(e)}), state='FAILURE')
 
-def verify_invoice_documents(document):
+def result_keys(document):
+    """
+    Map a document name to the keys process_bda_output writes its result under, current layout first
     """
-    Verify and extract information from invoice documents
+    name = document.strip().split('/')[-1].split('.')[0]
+    return key_layout.result_keys(name.replace('_', '-').replace(' ', '-'))
+
+def verify_invoice_documents(document, document_context=None, refresh='false'):
+    """
+    Verify and extract information from invoice documents using the stored BDA results.
+    Documents already summarized earlier in the session return that summary
+    unless refresh is true, which keeps repeated turns small.
     """
     logger.info(f"Verifying invoice documents: {document}")
     
-    # Mock response for demonstration purposes
-    # In a real implementation, this would call Amazon Textract or a similar service
-    # to extract information from the document
-    
-    # Sample extracted data
-    extracted_data = {
-        "document_class": "invoice",
-        "confidence": 0.98,
-        "inference_result": {
-            "vendor": "ABC Corporation",
-            "invoice_date": "2025-06-15",
-            "payment_terms": "Net 30",
-            "due_date": "2025-07-15",
-            "currency": "USD",
-            "invoice_total_amount": "1250.00",
-            "special_remarks": "Please reference PO#12345 in payment",
-            "vendor_banking_details": {
-                "bank_account": "123456789",
-                "bank_code": "ABCDEF",
-                "swift_code": "ABCDEFGH"
-            },
-            "line_items": [
-                {
-                    "description": "Professional Services",
-                    "amount": "1000.00"
-                },
-                {
-                    "description": "Software License",
-                    "amount": "250.00"
+    document_context = {} if document_context is None else document_context
+    refresh = str(refresh).lower() == 'true'
+    documents = [doc.strip() for doc in document.split(',') if doc.strip()]
+    results = {}
+    
+    for doc in documents:
+        if doc in document_context and not refresh:
+            results[doc] = {
+                "status": "SUCCESS",
+                "source": "session_context",
+                "data": document_context[doc]
+            }
+            continue
+        try:
+            stored_key, extracted_data = key_layout.read_first(
+                result_keys(doc), lambda key: result_cache.get_json(s3_client, S3_BUCKET, key)
+            )
+            if extracted_data.get("status") == "SKIPPED":
+                results[doc] = {
+                    "status": "SKIPPED",
+                    "result_key": stored_key,
+                    "error": f"Document was not processed: {extracted_data.get('reason')}"
                 }
-            ],
-            "utility_details": {
-                "meter_number": "N/A",
-                "delta_readings": "N/A"
+                continue
+            validation = validate_invoice(extracted_data.get("inference_result") or {})
+            results[doc] = {
+                "status": "SUCCESS",
+                "result_key": stored_key,
+                "data": {**extracted_data, "validation": validation}
+            }
+            remember_document(document_context, doc, summarize_document(extracted_data, validation))
+        except ClientError as e:
+            if e.response['Error']['Code'] == 'NoSuchKey':
+                results[doc] = {
+                    "status": "MISSING_RESULT",
+                    "error": f"No analysis result found for document: {doc}"
+                }
+            else:
+                logger.error(f"Error accessing S3 for document {doc}: {str(e)}")
+                results[doc] = {
+                    "status": "ERROR",
+                    "error": f"Error accessing S3 for document {doc}: {str(e)}"
+                }
+        except Exception as e:
+            logger.error(f"Error processing document {doc}: {str(e)}")
+            results[doc] = {
+                "status": "ERROR",
+                "error": f"Error processing document {doc}: {str(e)}"
             }
-        }
-    }
+    
+    emit_metrics(result_cache.metrics(), units={'ResultCacheHitRate': 'Percent'})
     
     return {
-        "content": json.dumps(extracted_data),
+        "content": shape_response('verify_invoice_documents', {
+            "status": "COMPLETED",
+            "documents": results,
+            "summary": {
+                "total": len(documents),
+                "successful": sum(1 for doc in results.values() if doc["status"] == "SUCCESS"),
+                "failed": sum(1 for doc in results.values() if doc["status"] != "SUCCESS")
+            }
+        }, s3_client, S3_BUCKET),
         "contentType": "application/json"
     }
 
-def record_application_details(invoice_data, invoice_id):
+def record_application_details(invoice_data, invoice_id, allow_duplicate='false'):
     """
-    Record invoice details in the system
+    Record invoice details in the system. invoice_data is one invoice object or
+    a JSON list of invoice objects that each carry their own invoice_id.
     """
     logger.info(f"Recording invoice details for ID: {invoice_id}")
     
     try:
         # Parse the invoice data
         invoice_json = json.loads(invoice_data)
-        
-        # In a real implementation, this would store the data in a database
-        # For now, we'll just return a success message
-        
+        records = parse_invoice_records(invoice_json, invoice_id)
+    except json.JSONDecodeError:
         return {
             "content": json.dumps({
-                "status": "success",
-                "message": f"Invoice details recorded successfully with ID: {invoice_id}",
-                "timestamp": datetime.now().isoformat()
+                "status": "error",
+                "message": "Invalid JSON format in invoice_data"
             }),
             "contentType": "application/json"
         }
-    except json.JSONDecodeError:
+    except ValueError as e:
         return {
             "content": json.dumps({
                 "status": "error",
-                "message": "Invalid JSON format in invoice_data"
+                "message": str(e)
             }),
             "contentType": "application/json"
         }
+    
+    # Hold back invoices that look like ones already recorded
+    allow_duplicate = str(allow_duplicate).lower() == 'true'
+    entries = duplicate_entries(records)
+    duplicates = check_many(s3_client, S3_BUCKET, list(entries.values()), allow_duplicate)
+    blocked = {} if allow_duplicate else {k: v for k, v in duplicates.items() if v}
+    to_write = [(record_id, data) for record_id, data in records if record_id not in blocked]
+    result = put_invoices(to_write) if to_write else {'written': [], 'unprocessed': []}
+    # Only invoices that reached the table are indexed, so unprocessed ones can be retried
+    recorded = record_many(s3_client, S3_BUCKET, [entries[record_id] for record_id in result['written']]) if result['written'] else {}
+    # Matches recorded by a concurrent invocation after the check; these invoices are already stored
+    concurrent = {} if allow_duplicate else {k: v for k, v in recorded.items() if v}
+    
+    if blocked and not result['written']:
+        status = "possible_duplicate"
+    elif result['unprocessed'] and not result['written']:
+        status = "error"
+    elif blocked or result['unprocessed']:
+        status = "partial"
+    else:
+        status = "success"
+    
+    if status == "possible_duplicate" and len(records) == 1:
+        message = (f"Invoice {invoice_id} matches previously recorded invoices; "
+                   "set allow_duplicate to true to record it anyway")
+    elif status == "success" and len(records) == 1:
+        message = f"Invoice details recorded successfully with ID: {records[0][0]}"
+    else:
+        message = (f"Recorded {len(result['written'])} of {len(records)} invoices; "
+                   f"{len(blocked)} possible duplicates, {len(result['unprocessed'])} unprocessed")
+    if concurrent:
+        message += (f"; {len(concurrent)} recorded invoices match invoices recorded at the same time "
+                    "and should be reviewed")
+    
+    return {
+        "content": json.dumps({
+            "status": status,
+            "message": message,
+            "recorded": result['written'],
+            "unprocessed": result['unprocessed'],
+            "possible_duplicates": blocked,
+            "recorded_possible_duplicates": concurrent,
+            "timestamp": datetime.now().isoformat()
+        }),
+        "contentType": "application/json"
+    }
+
+def parse_invoice_records(invoice_json, invoice_id):
+    """
+    Normalize single or batched invoice_data into (invoice_id, invoice) pairs
+    """
+    if isinstance(invoice_json, dict):
+        record_id = invoice_id or invoice_json.get('invoice_id')
+        if not record_id:
+            raise ValueError("Missing invoice_id")
+        return [(str(record_id), invoice_json)]
+    if isinstance(invoice_json, list):
+        records = []
+        for position, item in enumerate(invoice_json):
+            if not isinstance(item, dict) or not item.get('invoice_id'):
+                raise ValueError(f"Invoice at position {position} has no invoice_id")
+            records.append((str(item['invoice_id']), item))
+        return records
+    raise ValueError("invoice_data must be a JSON object or a list of objects")
+
+def duplicate_entries(records):
+    """
+    Duplicate index entry of each invoice, keyed by its id
+    """
+    entries = {}
+    for record_id, invoice_json in records:
+        details = {**invoice_json, **invoice_json.get('invoice_details', {})}
+        record = normalize_invoice(details)
+        supplier = normalize_supplier(details.get('supplier_id'), record['vendor'])
+        entries[record_id] = (record_id, supplier, record['total'], record['invoice_date'],
+                              record['invoice_number'] or record_id)
+    return entries
 
 def retrieve_vendor_list(search_criteria):
     """
@@ -143,6 +310,26 @@ def retrieve_vendor_list(search_criteria):
     """
     logger.info(f"Retrieving vendor list with criteria: {search_criteria}")
     
+    # Match against the supplier master when one has been uploaded
+    if search_criteria and vendor_index.refresh(s3_client, S3_BUCKET):
+        matches = vendor_index.search(search_criteria, top_k=VENDOR_MATCH_LIMIT)
+        vendors = [
+            {
+                "vendor_id": supplier["code"],
+                "vendor_name": supplier["name"],
+                "category": supplier["category"],
+                "matched_name": matched_name,
+                "similarity": round(similarity, 3),
+                "confidence": "high" if similarity > 0.8 else "medium" if similarity > 0.5 else "low"
+            }
+            for supplier, similarity, matched_name in matches
+            if similarity >= VENDOR_MATCH_THRESHOLD
+        ]
+        return {
+            "content": json.dumps(vendors),
+            "contentType": "application/json"
+        }
+    
     # Mock vendor list for demonstration purposes
     vendors = [
         {
@@ -176,6 +363,117 @@ def retrieve_vendor_list(search_criteria):
         "contentType": "application/json"
     }
 
+def verify_bank_details(document, vendor, bank_account, bank_code, swift_code):
+    """
+    Check an invoice's bank details against the supplier master. Details are read
+    from the document's stored BDA result; explicit parameters override them.
+    """
+    logger.info(f"Verifying bank details for document={document} vendor={vendor}")
+    
+    if document:
+        try:
+            _, extracted_data = key_layout.read_first(
+                result_keys(document), lambda key: result_cache.get_json(s3_client, S3_BUCKET, key)
+            )
+            emit_metrics(result_cache.metrics(), units={'ResultCacheHitRate': 'Percent'})
+        except ClientError as e:
+            if e.response['Error']['Code'] != 'NoSuchKey':
+                raise
+            return {
+                "content": json.dumps({
+                    "status": "MISSING_RESULT",
+                    "error": f"No analysis result found for document: {document}"
+                }),
+                "contentType": "application/json"
+            }
+        if extracted_data.get("status") == "SKIPPED":
+            return {
+                "content": json.dumps({
+                    "status": "SKIPPED",
+                    "error": f"Document was not processed: {extracted_data.get('reason')}"
+                }),
+                "contentType": "application/json"
+            }
+        record = normalize_invoice(extracted_data.get("inference_result") or {})
+        vendor = vendor or record['vendor']
+        bank_account = bank_account or record['bank_account']
+        bank_code = bank_code or record['bank_code']
+        swift_code = swift_code or record['swift_code']
+    
+    if not vendor_index.refresh(s3_client, S3_BUCKET):
+        result = {"status": "NO_MASTER_DATA", "issues": ["No supplier list has been uploaded"]}
+    else:
+        matches = vendor_index.match_positions(vendor, top_k=3) if vendor else []
+        result = check_bank_details(
+            vendor_index.bank_index, vendor_index.suppliers,
+            [(position, similarity) for position, similarity, _ in matches],
+            bank_account, bank_code, swift_code
+        )
+    
+    return {
+        "content": json.dumps({
+            **result,
+            "checked": {
+                "vendor": vendor,
+                "bank_account": bank_account,
+                "bank_code": bank_code,
+                "swift_code": swift_code
+            }
+        }),
+        "contentType": "application/json"
+    }
+
+def query_invoices(vendor, date_from, date_to, currency, group_by, limit):
+    """
+    Answer aggregate questions (totals per vendor, month or currency) or list
+    matching invoices from the compacted invoice dataset; totals are per currency
+    """
+    logger.info(f"Querying invoices: vendor={vendor} from={date_from} to={date_to} currency={currency} "
+                f"group_by={group_by}")
+    
+    try:
+        result = run_invoice_query(invoice_dataset, s3_client, S3_BUCKET, vendor, date_from, date_to,
+                                   currency=currency, group_by=group_by, limit=limit)
+    except ValueError as e:
+        result = {"status": "error", "message": str(e)}
+    
+    if result.get('status') == 'success':
+        emit_metrics(
+            {'InvoiceQueryLatency': result['elapsed_ms'], 'InvoiceQueryCacheHit': int(result['cached'])},
+            units={'InvoiceQueryLatency': 'Milliseconds'}
+        )
+    
+    return {
+        "content": shape_response('query_invoices', result, s3_client, S3_BUCKET),
+        "contentType": "application/json"
+    }
+
+def get_stored_result(key, path):
+    """
+    Read one part of a stored BDA result or a clipped response by its S3 key,
+    so the agent can drill into data that was truncated to fit the response budget
+    """
+    logger.info(f"Reading stored result {key} at path {path}")
+    
+    if not key.startswith(STORED_RESULT_PREFIXES) or '..' in key:
+        result = {"status": "error", "message": f"result_key must start with one of: {', '.join(STORED_RESULT_PREFIXES)}"}
+        return {"content": json.dumps(result), "contentType": "application/json"}
+    try:
+        data = result_cache.get_json(s3_client, S3_BUCKET, key)
+        result = {"status": "success", "result_key": key, "path": path, "data": select_path(data, path)}
+    except ClientError as e:
+        if e.response['Error']['Code'] != 'NoSuchKey':
+            raise
+        result = {"status": "MISSING_RESULT", "error": f"No stored result found for key: {key}"}
+    except KeyError as e:
+        result = {"status": "error", "message": f"Path segment not found: {str(e)}"}
+    
+    return {
+        # Already stored, so a clipped answer points back at the same key instead of spilling again
+        "content": shape_response('get_stored_result', result, full_result_key=key),
+        "contentType": "application/json"
+    }
+
 def generate_csv(invoice_id, include_vendor_mapping):
     """
     Generate a CSV file with invoice data
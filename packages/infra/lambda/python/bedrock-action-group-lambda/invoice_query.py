@@ -0,0 +1,289 @@
+import os
+import json
+import time
+import shutil
+import logging
+from datetime import date
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+from botocore.exceptions import ClientError
+
+from invoice_fields import normalize_vendor_name, parse_date
+
+logger = logging.getLogger()
+
+# Parquet written by results_compaction.py
+ANALYTICS_PREFIX = "bda-analytics/invoices"
+MANIFEST_KEY = "bda-analytics/_manifest.json"
+LOCAL_DATASET_DIR = os.environ.get('ANALYTICS_CACHE_DIR', '/tmp/bda-analytics')
+# How long a loaded dataset is trusted before the manifest ETag is checked again
+FRESHNESS_SECONDS = int(os.environ.get('ANALYTICS_FRESHNESS_SECONDS', '60'))
+DEFAULT_ROW_LIMIT = 50
+MAX_ROW_LIMIT = 500
+MAX_CACHED_QUERIES = 128
+DOWNLOAD_WORKERS = 16
+QUERY_COLUMNS = (
+    'source_key', 'vendor', 'vendor_key', 'invoice_number', 'invoice_date', 'due_date',
+    'currency', 'total', 'tax_amount', 'invoice_month',
+)
+DICTIONARY_COLUMNS = ('vendor_key', 'invoice_month')
+ROW_COLUMNS = ('vendor', 'invoice_number', 'invoice_date', 'due_date', 'currency', 'total', 'tax_amount', 'source_key')
+# group_by parameter -> grouping columns; vendors group on the normalized name. Every
+# grouping splits by currency too, since amounts in different currencies cannot be added
+GROUPINGS = {
+    'vendor': ('vendor_key', 'currency'),
+    'month': ('invoice_month', 'currency'),
+    'currency': ('currency',),
+    'vendor_month': ('vendor_key', 'invoice_month', 'currency'),
+}
+
+
+class InvoiceDataset:
+    """
+    Local mirror of the compacted Parquet dataset, held in memory between warm
+    invocations. Partition files are downloaded to /tmp only when their ETag
+    changes, and query results are cached per dataset version.
+    """
+
+    def __init__(self, local_dir=LOCAL_DATASET_DIR, freshness_seconds=FRESHNESS_SECONDS):
+        self.local_dir = local_dir
+        self.freshness_seconds = freshness_seconds
+        self.table = None
+        self.vendor_keys = set()
+        self.version = None
+        self.updated_at = None
+        self.checked_at = 0.0
+        self.queries = OrderedDict()
+
+    def _local_index_path(self):
+        return os.path.join(self.local_dir, '_local.json')
+
+    def _sync_files(self, s3_client, bucket):
+        """
+        Bring /tmp in line with the partition files in S3, downloading only changed ones
+        """
+        try:
+            with open(self._local_index_path()) as f:
+                local = json.load(f)
+        except (OSError, ValueError):
+            local = {}
+
+        remote = {}
+        paginator = s3_client.get_paginator('list_objects_v2')
+        for page in paginator.paginate(Bucket=bucket, Prefix=f"{ANALYTICS_PREFIX}/"):
+            for obj in page.get('Contents', []):
+                if obj['Key'].endswith('.parquet'):
+                    remote[obj['Key']] = obj['ETag']
+
+        def local_path(key):
+            return os.path.join(self.local_dir, key[len(ANALYTICS_PREFIX) + 1:])
+
+        def download(key):
+            path = local_path(key)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            s3_client.download_file(bucket, key, path + '.tmp')
+            os.replace(path + '.tmp', path)
+
+        stale = [key for key, etag in remote.items() if local.get(key) != etag or not os.path.exists(local_path(key))]
+        with ThreadPoolExecutor(max_workers=DOWNLOAD_WORKERS) as executor:
+            list(executor.map(download, stale))
+        for key in set(local) - set(remote):
+            shutil.rmtree(os.path.dirname(local_path(key)), ignore_errors=True)
+
+        os.makedirs(self.local_dir, exist_ok=True)
+        with open(self._local_index_path(), 'w') as f:
+            json.dump(remote, f)
+        logger.info(f"Analytics mirror: {len(remote)} partitions, {len(stale)} downloaded")
+        return bool(remote)
+
+    def _load_table(self):
+        import pyarrow as pa
+        import pyarrow.dataset as ds
+        from results_compaction import RESULT_SCHEMA
+
+        partitioning = ds.partitioning(
+            pa.schema([('invoice_month', pa.string()), ('vendor_slug', pa.string())]), flavor='hive'
+        )
+        # Only core columns are read; field_* columns differ between partitions
+        schema = pa.schema(list(RESULT_SCHEMA) + [pa.field('invoice_month', pa.string()),
+                                                   pa.field('vendor_slug', pa.string())])
+        dataset = ds.dataset(self.local_dir, format='parquet', partitioning=partitioning, schema=schema,
+                             exclude_invalid_files=True)
+        # One chunk per partition file makes every kernel call pay per-chunk overhead, so
+        # merge them; low-cardinality columns are dictionary encoded for cheap filters and grouping
+        table = dataset.to_table(columns=list(QUERY_COLUMNS)).combine_chunks()
+        for name in DICTIONARY_COLUMNS:
+            position = table.schema.get_field_index(name)
+            table = table.set_column(position, name, table[name].dictionary_encode())
+        self.vendor_keys = set(table['vendor_key'].chunk(0).dictionary.to_pylist()) if table.num_rows else set()
+        return table.combine_chunks()
+
+    def refresh(self, s3_client, bucket):
+        """
+        Reload when the compaction manifest has changed; returns False when no dataset exists yet
+        """
+        if self.table is not None and time.time() - self.checked_at < self.freshness_seconds:
+            return True
+        try:
+            manifest = s3_client.get_object(Bucket=bucket, Key=MANIFEST_KEY,
+                                            **({'IfNoneMatch': self.version} if self.version else {}))
+        except ClientError as e:
+            code = e.response['Error']['Code']
+            if code in ('304', 'NotModified'):
+                self.checked_at = time.time()
+                return True
+            if code == 'NoSuchKey':
+                return False
+            raise
+        version = manifest['ETag']
+        self.updated_at = json.loads(manifest['Body'].read()).get('updated_at')
+        if not self._sync_files(s3_client, bucket):
+            return False
+        self.table = self._load_table()
+        self.version = version
+        self.checked_at = time.time()
+        self.queries.clear()
+        return True
+
+    def cached(self, key):
+        if key in self.queries:
+            self.queries.move_to_end(key)
+            return self.queries[key]
+        return None
+
+    def remember(self, key, result):
+        self.queries[key] = result
+        while len(self.queries) > MAX_CACHED_QUERIES:
+            self.queries.popitem(last=False)
+
+
+def _to_date(value, name):
+    if not value:
+        return None
+    parsed = parse_date(value)
+    if not parsed:
+        raise ValueError(f"{name} must be a date such as 2025-01-31")
+    return date.fromisoformat(parsed)
+
+
+def build_filter(vendor=None, date_from=None, date_to=None, currency=None, known_vendors=()):
+    """
+    Return (pyarrow expression or None, normalized filters). A vendor that matches
+    a known normalized name exactly is filtered on equality, otherwise every known
+    name containing it matches.
+    """
+    import pyarrow.compute as pc
+
+    filters = {
+        'vendor': normalize_vendor_name(vendor) or None,
+        'date_from': _to_date(date_from, 'date_from'),
+        'date_to': _to_date(date_to, 'date_to'),
+        'currency': currency.strip().upper() if currency and currency.strip() else None,
+    }
+    expression = None
+
+    def both(condition):
+        return condition if expression is None else expression & condition
+
+    if filters['vendor'] in known_vendors:
+        expression = both(pc.field('vendor_key') == filters['vendor'])
+    elif filters['vendor']:
+        # Resolve the substring against the distinct names once instead of scanning every row
+        matches = sorted(key for key in known_vendors if filters['vendor'] in key)
+        expression = both(pc.field('vendor_key').isin(matches))
+    if filters['date_from']:
+        expression = both(pc.field('invoice_date') >= filters['date_from'])
+    if filters['date_to']:
+        expression = both(pc.field('invoice_date') <= filters['date_to'])
+    if filters['currency']:
+        expression = both(pc.field('currency') == filters['currency'])
+    return expression, {k: str(v) if isinstance(v, date) else v for k, v in filters.items()}
+
+
+def _jsonable(rows):
+    return [{k: v.isoformat() if isinstance(v, date) else v for k, v in row.items()} for row in rows]
+
+
+def run_query(table, expression, group_by='none', limit=DEFAULT_ROW_LIMIT):
+    """
+    Filter the invoice table and either aggregate it or return the newest matching invoices.
+    Totals are per currency; a single total_amount is only given when one currency matched.
+    """
+    matched = table.filter(expression) if expression is not None else table
+    by_currency = matched.group_by(['currency']).aggregate([('total', 'count'), ('total', 'sum')])
+    by_currency = [
+        {'currency': row['currency'], 'invoice_count': row['total_count'], 'total_amount': round(row['total_sum'] or 0.0, 2)}
+        for row in by_currency.sort_by([('total_sum', 'descending')]).to_pylist()
+    ]
+    totals = {'invoice_count': matched.num_rows, 'totals_by_currency': by_currency}
+    if len(by_currency) == 1:
+        totals.update(currency=by_currency[0]['currency'], total_amount=by_currency[0]['total_amount'])
+
+    if group_by in GROUPINGS:
+        keys = list(GROUPINGS[group_by])
+        grouped = matched.group_by(keys).aggregate([
+            ('total', 'count'), ('total', 'sum'), ('total', 'mean'), ('total', 'max'), ('vendor', 'min'),
+        ])
+        grouped = grouped.sort_by([('total_sum', 'descending')])
+        rows = []
+        for row in grouped.slice(0, limit).to_pylist():
+            item = {key: row[key] for key in keys if key != 'vendor_key'}
+            if 'vendor_key' in keys:
+                item['vendor'] = row['vendor_min'] or row['vendor_key']
+            item.update({
+                'invoice_count': row['total_count'],
+                'total_amount': round(row['total_sum'] or 0.0, 2),
+                'average_amount': round(row['total_mean'] or 0.0, 2),
+                'largest_amount': row['total_max'],
+            })
+            rows.append(item)
+        group_count = grouped.num_rows
+    else:
+        ordered = matched.sort_by([('invoice_date', 'descending')]).slice(0, limit)
+        rows = _jsonable(ordered.select(list(ROW_COLUMNS)).to_pylist())
+        group_count = matched.num_rows
+
+    return {
+        'summary': totals,
+        'rows': rows,
+        'row_count': len(rows),
+        'truncated': group_count > len(rows),
+    }
+
+
+def query_invoices(dataset, s3_client, bucket, vendor=None, date_from=None, date_to=None,
+                   currency=None, group_by='none', limit=None):
+    """
+    Answer a filtered/aggregated question over the compacted invoices, caching
+    results until the dataset changes
+    """
+    start = time.time()
+    group_by = (group_by or 'none').strip().lower()
+    if group_by not in GROUPINGS and group_by != 'none':
+        raise ValueError(f"group_by must be one of: none, {', '.join(GROUPINGS)}")
+    try:
+        limit = min(max(int(limit), 1), MAX_ROW_LIMIT) if limit else DEFAULT_ROW_LIMIT
+    except ValueError:
+        raise ValueError("limit must be a number")
+
+    if not dataset.refresh(s3_client, bucket):
+        return {'status': 'no_data', 'message': 'No compacted invoice data is available yet'}
+
+    expression, filters = build_filter(vendor, date_from, date_to, currency, dataset.vendor_keys)
+    cache_key = json.dumps([filters, group_by, limit], sort_keys=True)
+    result = dataset.cached(cache_key)
+    cached = result is not None
+    if not cached:
+        result = run_query(dataset.table, expression, group_by, limit)
+        dataset.remember(cache_key, result)
+
+    return {
+        'status': 'success',
+        'filters': filters,
+        'group_by': group_by,
+        **result,
+        'data_as_of': dataset.updated_at,
+        'cached': cached,
+        'elapsed_ms': round((time.time() - start) * 1000, 1),
+    }
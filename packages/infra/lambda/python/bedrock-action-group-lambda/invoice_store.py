@@ -0,0 +1,138 @@
+import os
+import sys
+import json
+import time
+import random
+import hashlib
+import logging
+from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
+
+import boto3
+from botocore.config import Config
+
+from invoice_fields import normalize_invoice
+
+logger = logging.getLogger()
+
+INVOICE_TABLE_NAME = os.environ.get('INVOICE_TABLE_NAME', '')
+# Point at DynamoDB Local (e.g. http://localhost:8000) for bulk-import testing
+DYNAMODB_ENDPOINT_URL = os.environ.get('DYNAMODB_ENDPOINT_URL') or None
+BATCH_SIZE = 25  # BatchWriteItem hard limit
+WRITE_WORKERS = 8
+MAX_RETRIES = 8
+BASE_BACKOFF_SECONDS = 0.05
+MAX_BACKOFF_SECONDS = 2.0
+
+config = Config(
+    retries=dict(
+        max_attempts=3,
+        mode='standard'
+    ),
+    max_pool_connections=WRITE_WORKERS * 2
+)
+
+_dynamodb = None
+
+
+def get_client():
+    global _dynamodb
+    if _dynamodb is None:
+        _dynamodb = boto3.client('dynamodb', endpoint_url=DYNAMODB_ENDPOINT_URL, config=config)
+    return _dynamodb
+
+
+def to_item(invoice_id, invoice_json):
+    """
+    Build a DynamoDB item; the full payload is kept as one JSON string attribute
+    """
+    details = {**invoice_json, **invoice_json.get('invoice_details', {})} if isinstance(invoice_json, dict) else {}
+    record = normalize_invoice(details)
+    payload = json.dumps(invoice_json, sort_keys=True, separators=(',', ':'))
+    item = {
+        'invoice_id': {'S': str(invoice_id)},
+        'invoice_data': {'S': payload},
+        'content_hash': {'S': hashlib.sha256(payload.encode('utf-8')).hexdigest()},
+        'recorded_at': {'S': datetime.now().isoformat()},
+    }
+    if record['vendor']:
+        item['vendor'] = {'S': record['vendor']}
+    if record['invoice_date']:
+        item['invoice_date'] = {'S': record['invoice_date']}
+    if record['total'] is not None:
+        item['invoice_total_amount'] = {'N': repr(record['total'])}
+    if record['currency']:
+        item['currency'] = {'S': str(record['currency'])}
+    return item
+
+
+def _write_chunk(client, table_name, requests):
+    """
+    Write up to 25 put requests, retrying UnprocessedItems with jittered backoff
+    """
+    pending = {table_name: requests}
+    for attempt in range(MAX_RETRIES + 1):
+        response = client.batch_write_item(RequestItems=pending)
+        pending = response.get('UnprocessedItems') or {}
+        if not pending:
+            return []
+        if attempt < MAX_RETRIES:
+            # nosemgrep: arbitrary-sleep
+            time.sleep(random.uniform(0, min(MAX_BACKOFF_SECONDS, BASE_BACKOFF_SECONDS * 2 ** attempt)))
+    return [request['PutRequest']['Item']['invoice_id']['S'] for request in pending.get(table_name, [])]
+
+
+def put_invoices(records, table_name=None, client=None):
+    """
+    Idempotently write (invoice_id, invoice_json) records in parallel batches.
+
+    invoice_id is the table's partition key, so replaying a record overwrites
+    it rather than adding a second copy. Within one call the last record for
+    an id wins, since BatchWriteItem rejects duplicate keys in a batch.
+    Returns the ids written and any that stayed unprocessed after retries.
+    """
+    table_name = table_name or INVOICE_TABLE_NAME
+    client = client or get_client()
+
+    latest = {}
+    for invoice_id, invoice_json in records:
+        latest[str(invoice_id)] = invoice_json
+    requests = [{'PutRequest': {'Item': to_item(invoice_id, invoice_json)}}
+                for invoice_id, invoice_json in latest.items()]
+    chunks = [requests[i:i + BATCH_SIZE] for i in range(0, len(requests), BATCH_SIZE)]
+
+    failed = []
+    if len(chunks) == 1:
+        failed = _write_chunk(client, table_name, chunks[0])
+    elif chunks:
+        with ThreadPoolExecutor(max_workers=WRITE_WORKERS) as executor:
+            for unprocessed in executor.map(lambda chunk: _write_chunk(client, table_name, chunk), chunks):
+                failed.extend(unprocessed)
+
+    failed_ids = set(failed)
+    if failed_ids:
+        logger.error(f"{len(failed_ids)} invoices left unprocessed after {MAX_RETRIES} retries")
+    return {
+        'written': [invoice_id for invoice_id in latest if invoice_id not in failed_ids],
+        'unprocessed': sorted(failed_ids),
+    }
+
+
+def bulk_import(path, table_name=None, client=None):
+    """
+    Load a JSONL file of invoices (each line carrying an invoice_id) into the table
+    """
+    with open(path, encoding='utf-8') as f:
+        records = [(row['invoice_id'], row) for row in map(json.loads, f) if row.get('invoice_id')]
+    start = time.perf_counter()
+    result = put_invoices(records, table_name, client)
+    elapsed = time.perf_counter() - start
+    print(f"Imported {len(result['written'])} invoices in {elapsed:.2f}s "
+          f"({len(result['written']) / elapsed if elapsed else 0:.0f}/s), "
+          f"{len(result['unprocessed'])} unprocessed")
+    return result
+
+
+if __name__ == '__main__':
+    # PYTHONPATH=../layers/common python invoice_store.py invoices.jsonl [table_name]
+    bulk_import(sys.argv[1], sys.argv[2] if len(sys.argv) > 2 else None)
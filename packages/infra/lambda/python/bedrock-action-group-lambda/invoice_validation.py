@@ -0,0 +1,206 @@
+import sys
+import json
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+from invoice_fields import normalize_invoice, normalize_vendor_name
+
+logger = logging.getLogger()
+
+# An amount matches when it is within max(ABS, REL * |expected|)
+AMOUNT_ABS_TOLERANCE = 0.01
+AMOUNT_REL_TOLERANCE = 0.001
+# Robust z-score (median/MAD) above which an amount is an outlier for its vendor
+OUTLIER_Z_THRESHOLD = 3.5
+MIN_VENDOR_HISTORY = 5
+# Contribution of each failed check to the 0..1 anomaly score
+ANOMALY_WEIGHTS = {
+    'line_items_mismatch': 0.35,
+    'tax_mismatch': 0.25,
+    'duplicate': 0.25,
+    'amount_outlier': 0.15,
+}
+S3_READ_WORKERS = 32
+
+
+def _tolerance(expected):
+    return max(AMOUNT_ABS_TOLERANCE, AMOUNT_REL_TOLERANCE * abs(expected))
+
+
+def _status(issues, score):
+    if not issues:
+        return 'PASS'
+    return 'FAIL' if score >= 0.5 else 'WARN'
+
+
+def validate_invoice(inference_result):
+    """
+    Per-invoice arithmetic checks for the action group (no pandas import). Duplicate
+    and vendor outlier checks need other invoices and run in validate_invoice_batch only.
+    """
+    record = normalize_invoice(inference_result)
+    total = record['total']
+    issues = []
+    checks = {}
+
+    if total is None:
+        issues.append('missing_total')
+    elif record['line_item_amounts']:
+        line_sum = round(sum(record['line_item_amounts']), 2)
+        # Line items are usually pre-tax, so either the subtotal or the total may match
+        targets = [t for t in (total, record['subtotal']) if t is not None]
+        matched = any(abs(line_sum - t) <= _tolerance(t) for t in targets)
+        checks['line_items_sum'] = {'expected': total, 'actual': line_sum, 'ok': matched}
+        if not matched:
+            issues.append('line_items_mismatch')
+
+    subtotal, tax = record['subtotal'], record['tax_amount']
+    if total is not None and subtotal is not None and tax is not None:
+        expected = subtotal + tax - (record['discount'] or 0.0) + (record['shipping'] or 0.0)
+        ok = abs(expected - total) <= _tolerance(total)
+        if ok and record['tax_rate'] is not None:
+            ok = abs(subtotal * record['tax_rate'] / 100.0 - tax) <= _tolerance(tax)
+        checks['tax_reconciliation'] = {'expected': round(expected, 2), 'actual': total, 'ok': ok}
+        if not ok:
+            issues.append('tax_mismatch')
+
+    score = round(float(sum(ANOMALY_WEIGHTS.get(issue, 0.5) for issue in issues)), 2)
+    return {
+        'status': _status(issues, score),
+        'anomaly_score': min(score, 1.0),
+        'issues': issues,
+        'checks': checks,
+    }
+
+
+def validate_invoice_batch(results):
+    """
+    Vectorized validation over many stored results.
+
+    results is an iterable of (document_id, inference_result) pairs. Returns a
+    pandas DataFrame with one row per document, the individual check flags,
+    duplicate group ids, per-vendor robust z-scores and an anomaly score.
+    """
+    import numpy as np
+    import pandas as pd
+
+    rows = []
+    for document_id, inference_result in results:
+        record = normalize_invoice(inference_result)
+        amounts = record.pop('line_item_amounts')
+        record['document_id'] = document_id
+        record['line_count'] = len(amounts)
+        record['line_sum'] = sum(amounts) if amounts else np.nan
+        record['vendor_key'] = normalize_vendor_name(record['vendor'])
+        rows.append(record)
+
+    columns = ['document_id', 'vendor', 'vendor_key', 'invoice_number', 'invoice_date',
+               'total', 'subtotal', 'tax_amount', 'tax_rate', 'discount', 'shipping',
+               'line_count', 'line_sum']
+    df = pd.DataFrame.from_records(rows, columns=columns)
+    numeric = ['total', 'subtotal', 'tax_amount', 'tax_rate', 'discount', 'shipping', 'line_sum']
+    df[numeric] = df[numeric].apply(pd.to_numeric, errors='coerce').astype('float64')
+
+    total = df['total'].to_numpy()
+    subtotal = df['subtotal'].to_numpy()
+    tax = df['tax_amount'].to_numpy()
+    line_sum = df['line_sum'].to_numpy()
+    tol_total = np.maximum(AMOUNT_ABS_TOLERANCE, AMOUNT_REL_TOLERANCE * np.abs(total))
+    tol_subtotal = np.maximum(AMOUNT_ABS_TOLERANCE, AMOUNT_REL_TOLERANCE * np.abs(subtotal))
+    tol_tax = np.maximum(AMOUNT_ABS_TOLERANCE, AMOUNT_REL_TOLERANCE * np.abs(tax))
+
+    # NaN comparisons are False, so missing inputs never raise a flag
+    has_lines = ~np.isnan(line_sum) & ~np.isnan(total)
+    line_ok = (np.abs(line_sum - total) <= tol_total) | (np.abs(line_sum - subtotal) <= tol_subtotal)
+    df['line_items_mismatch'] = has_lines & ~line_ok
+
+    expected_total = (subtotal + tax - df['discount'].fillna(0.0).to_numpy()
+                      + df['shipping'].fillna(0.0).to_numpy())
+    has_tax = ~np.isnan(expected_total) & ~np.isnan(total)
+    rate_diff = np.abs(subtotal * df['tax_rate'].to_numpy() / 100.0 - tax)
+    rate_bad = ~np.isnan(rate_diff) & (rate_diff > tol_tax)
+    df['tax_mismatch'] = has_tax & ((np.abs(expected_total - total) > tol_total) | rate_bad)
+
+    # Duplicates: same vendor, same amount to the cent, same invoice date
+    dup_keys = ['vendor_key', 'total_cents', 'invoice_date']
+    df['total_cents'] = np.round(total * 100)
+    keyed = df['vendor_key'].ne('') & df['total'].notna() & df['invoice_date'].notna()
+    dup_mask = keyed & df.duplicated(subset=dup_keys, keep=False)
+    df['duplicate'] = dup_mask
+    df['duplicate_group'] = -1
+    if dup_mask.any():
+        df.loc[dup_mask, 'duplicate_group'] = df[dup_mask].groupby(dup_keys, sort=False).ngroup()
+    df = df.drop(columns='total_cents')
+
+    # Per-vendor outliers using a median/MAD robust z-score
+    has_vendor = df['vendor_key'].ne('')
+    by_vendor = df['total'].where(has_vendor).groupby(df['vendor_key'])
+    median = by_vendor.transform('median')
+    mad = (df['total'] - median).abs().groupby(df['vendor_key']).transform('median')
+    count = by_vendor.transform('count')
+    df['vendor_z'] = 0.6745 * (df['total'] - median) / mad.replace(0.0, np.nan)
+    df['amount_outlier'] = has_vendor & (count >= MIN_VENDOR_HISTORY) & (df['vendor_z'].abs() > OUTLIER_Z_THRESHOLD)
+
+    score = np.zeros(len(df))
+    for flag, weight in ANOMALY_WEIGHTS.items():
+        score += weight * df[flag].to_numpy(dtype=bool)
+    df['anomaly_score'] = np.minimum(np.round(score, 2), 1.0)
+    df['status'] = np.select(
+        [df['anomaly_score'] >= 0.5, df['anomaly_score'] > 0],
+        ['FAIL', 'WARN'],
+        default='PASS'
+    )
+    return df
+
+
+def load_stored_results(s3_client, bucket, prefix='bda-result/'):
+    """
+    Read every stored BDA result under prefix as (document_id, inference_result). Split
+    uploads carry several documents under "documents"; each is its own "<key>#<index>".
+    """
+    keys = []
+    paginator = s3_client.get_paginator('list_objects_v2')
+    for page in paginator.paginate(Bucket=bucket, Prefix=prefix):
+        keys.extend(obj['Key'] for obj in page.get('Contents', []) if obj['Key'].endswith('.json'))
+
+    def fetch(key):
+        try:
+            result = json.loads(s3_client.get_object(Bucket=bucket, Key=key)['Body'].read())
+        except Exception as e:
+            logger.error(f"Skipping unreadable result {key}: {str(e)}")
+            return []
+        # Uploads the pre-classifier skipped have nothing to validate
+        if result.get('status') == 'SKIPPED':
+            return []
+        documents = result.get('documents')
+        if not documents:
+            return [(key, result.get('inference_result') or {})]
+        return [(f"{key}#{index}", document.get('inference_result') or {}) for index, document in enumerate(documents)]
+
+    with ThreadPoolExecutor(max_workers=S3_READ_WORKERS) as executor:
+        return [row for rows in executor.map(fetch, keys) for row in rows]
+
+
+def validate_stored_results(s3_client, bucket, prefix='bda-result/'):
+    """
+    Batch job entry point: validate all stored results and summarise anomalies
+    """
+    df = validate_invoice_batch(load_stored_results(s3_client, bucket, prefix))
+    flagged = df[df['status'] != 'PASS'].sort_values('anomaly_score', ascending=False)
+    return {
+        'summary': {
+            'total': int(len(df)),
+            'passed': int((df['status'] == 'PASS').sum()),
+            'warnings': int((df['status'] == 'WARN').sum()),
+            'failed': int((df['status'] == 'FAIL').sum()),
+            'duplicates': int(df['duplicate'].sum()),
+            'outliers': int(df['amount_outlier'].sum()),
+        },
+        'flagged': json.loads(flagged.to_json(orient='records')),
+    }
+
+
+if __name__ == '__main__':
+    # Audit every stored result from a workstation: PYTHONPATH=../layers/common python invoice_validation.py <bucket> [prefix] > report.json
+    import boto3
+    print(json.dumps(validate_stored_results(boto3.client('s3'), sys.argv[1], *sys.argv[2:3]), indent=2))
@@ -4,12 +4,16 @@ import boto3
 from datetime import datetime, timedelta
 from botocore.exceptions import ClientError 
 
+from session_context import load_document_context, remember_document, session_state_response, summarize_document
+from response_shaping import shape_response
+from result_stream import PROCESSED_RESULT_FIELDS, read_s3_fields
+import key_layout
+
 NO_DOCUMENT_MESSAGE = "No document ID was provided as a parameter, and it was not passed in session state."
 NO_APPLICATION_DATA_MESSAGE = "No application data was provided in the parameters."
 AWS_REGION = os.environ['AWS_REGION']
-PREFIX = "bda-result"
-APPLICATION_PREFIX = "applications"
 ACCOUNT_ID = os.environ.get('ACCOUNT_ID', '')
+MAX_ID_ATTEMPTS = 3
 S3_BUCKET = f"data-bucket-{ACCOUNT_ID}-{AWS_REGION}"
 
 def get_named_parameter(event, name):
@@ -22,9 +26,24 @@ def get_named_parameter(event, name):
     else:
         return None
     
-def populate_function_response(event, response_body):
-    return {'response': {'actionGroup': event['actionGroup'], 'function': event['function'],
-                'functionResponse': {'responseBody': {'TEXT': {'body': str(response_body)}}}}}
+def populate_function_response(event, response_body, document_context=None):
+    if not isinstance(response_body, str):
+        response_body = shape_response(event['function'], response_body, boto3.client('s3'), S3_BUCKET)
+    response = {'response': {'actionGroup': event['actionGroup'], 'function': event['function'],
+                'functionResponse': {'responseBody': {'TEXT': {'body': response_body}}}}}
+    if document_context is not None:
+        response.update(session_state_response(event, document_context))
+    return response
+
+def load_application(s3_client, application_id):
+    """
+    Read an application from its sharded key, or from the flat key older applications used
+    """
+    _, application_data = key_layout.read_first(
+        key_layout.application_keys(application_id),
+        lambda key: json.loads(s3_client.get_object(Bucket=S3_BUCKET, Key=key)['Body'].read().decode('utf-8'))
+    )
+    return application_data
 
 def record_application_details(application_id, application_data):
     """
@@ -32,14 +51,11 @@ def record_application_details(application_id, application_data):
     """
     try:
         s3_client = boto3.client('s3')
-        s3_key = f"{APPLICATION_PREFIX}/{application_id}.json"
+        # Updates are always written under the sharded key, which moves older applications there
+        s3_key = key_layout.application_key(application_id)
         
         # Get existing application data (contains DTI)
-        response = s3_client.get_object(
-            Bucket=S3_BUCKET,
-            Key=s3_key
-        )
-        existing_data = json.loads(response['Body'].read().decode('utf-8'))
+        existing_data = load_application(s3_client, application_id)
         
         # Update with new details while preserving DTI and other root fields
         if isinstance(application_data, str):
@@ -72,7 +88,12 @@ def record_application_details(application_id, application_data):
             "message": error_message
         }
 
-def verify_applicant_documents(documents):
+def verify_applicant_documents(documents, document_context=None, refresh=False):
+    """
+    Fetch stored BDA results; documents summarized earlier in the session return
+    their summary instead unless refresh is set
+    """
+    document_context = {} if document_context is None else document_context
     try:
         def format_document_name(doc):
             doc = doc.strip().lower()
@@ -96,23 +117,34 @@ def verify_applicant_documents(documents):
         s3_client = boto3.client('s3')
         
         for document in document_list:
+            if document in document_context and not refresh:
+                results[document] = {
+                    "status": "SUCCESS",
+                    "source": "session_context",
+                    "data": document_context[document]
+                }
+                continue
             try:
-                s3_key = f"{PREFIX}/{document}-result.json"
-                
-                # Get the object from S3
-                response = s3_client.get_object(
-                    Bucket=S3_BUCKET,
-                    Key=s3_key
+                # Stream the object from S3, keeping only the result fields
+                s3_key, json_content = key_layout.read_first(
+                    key_layout.result_keys(document),
+                    lambda key: read_s3_fields(s3_client, S3_BUCKET, key, PROCESSED_RESULT_FIELDS)
                 )
-                
-                # Read and parse the JSON content
-                json_content = json.loads(response['Body'].read().decode('utf-8'))
                 print(f"Retrieved document analysis result for {document}: {json_content}")
+                if json_content.get("status") == "SKIPPED":
+                    results[document] = {
+                        "status": "SKIPPED",
+                        "result_key": s3_key,
+                        "error": f"Document was not processed: {json_content.get('reason')}"
+                    }
+                    continue
                 
                 results[document] = {
                     "status": "SUCCESS",
+                    "result_key": s3_key,
                     "data": json_content
                 }
+                remember_document(document_context, document, summarize_document(json_content))
                 
             except ClientError as e:
                 if e.response['Error']['Code'] == 'NoSuchKey':
@@ -169,26 +201,31 @@ def record_dti(dti_value):
     Creates initial application with DTI value at root level
     """
     try:
-        # Generate application ID using timestamp
-        timestamp = datetime.now().strftime('%Y%m%d%H%M%S')
-        application_id = f"ML_{timestamp}"
-        
-        # Create initial application data with DTI at root level
-        application_data = {
-            'application_id': application_id,
-            'timestamp': datetime.now().isoformat(),
-            'debt_to_income': dti_value  # DTI at root level
-        }
-        
-        # Store in S3
         s3_client = boto3.client('s3')
-        s3_key = f"{APPLICATION_PREFIX}/{application_id}.json"
-        
-        s3_client.put_object(
-            Bucket=S3_BUCKET,
-            Key=s3_key,
-            Body=json.dumps(application_data)
-        )
+        for attempt in range(MAX_ID_ATTEMPTS):
+            # Time-ordered and unique even for applications created in the same millisecond
+            application_id = key_layout.new_application_id()
+            
+            # Create initial application data with DTI at root level
+            application_data = {
+                'application_id': application_id,
+                'timestamp': datetime.now().isoformat(),
+                'debt_to_income': dti_value  # DTI at root level
+            }
+            
+            # Store in S3; the condition guarantees an existing application is never overwritten
+            try:
+                s3_client.put_object(
+                    Bucket=S3_BUCKET,
+                    Key=key_layout.application_key(application_id),
+                    Body=json.dumps(application_data),
+                    IfNoneMatch='*'
+                )
+                break
+            except ClientError as e:
+                if e.response['Error']['Code'] not in ('PreconditionFailed', 'ConditionalRequestConflict') \
+                        or attempt == MAX_ID_ATTEMPTS - 1:
+                    raise
         
         return {
             "status": "success",
@@ -211,14 +248,10 @@ def record_summary(application_id, summary):
     """
     try:
         s3_client = boto3.client('s3')
-        s3_key = f"{APPLICATION_PREFIX}/{application_id}.json"
+        s3_key = key_layout.application_key(application_id)
         
         # Get existing application data
-        response = s3_client.get_object(
-            Bucket=S3_BUCKET,
-            Key=s3_key
-        )
-        application_data = json.loads(response['Body'].read().decode('utf-8'))
+        application_data = load_application(s3_client, application_id)
         
         # Add summary
         application_data['summary'] = {
@@ -278,6 +311,7 @@ def lambda_handler(event, context):
 
     elif function == 'verify_applicant_documents':
         document = get_named_parameter(event, 'document')
+        refresh = str(get_named_parameter(event, 'refresh')).lower() == 'true'
         print(f"Processing verify_applicant_documents for document: {document}")
 
         if not document:
@@ -286,7 +320,11 @@ def lambda_handler(event, context):
             if not document:
                 return populate_function_response(event, NO_DOCUMENT_MESSAGE)
             print(f"Document was pulled from session state variable = {document}")
-        result = verify_applicant_documents(document)
+        document_context = load_document_context(event)
+        result = verify_applicant_documents(document, document_context, refresh)
+        response = populate_function_response(event, result, document_context)
+        print(f"Returning response: {json.dumps(response)}")
+        return response
     
     else:
         error_message = f"Unrecognized function: {function}"
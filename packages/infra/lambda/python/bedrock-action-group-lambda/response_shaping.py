@@ -0,0 +1,172 @@
+import os
+import json
+import hashlib
+import logging
+
+from metrics import emit_metrics
+
+logger = logging.getLogger()
+
+# Bedrock caps an action-group response at 25 KB; leave room for the envelope and session attributes
+RESPONSE_BUDGET_BYTES = int(os.environ.get('ACTION_RESPONSE_BUDGET_BYTES', '20000'))
+SPILL_PREFIX = "agent-responses"
+# Keys get_stored_result may read back
+STORED_RESULT_PREFIXES = ("bda-result/", f"{SPILL_PREFIX}/")
+# Successively tighter (max string chars, max list items) passes tried before falling back to a summary
+SHRINK_STEPS = ((2000, 50), (500, 20), (200, 10), (80, 5), (40, 3))
+WILDCARD = '*'
+
+# Dotted paths kept per function; '*' matches every key of a dict or item of a list.
+# Functions without an entry are returned whole (still budgeted).
+PROJECTIONS = {
+    'verify_invoice_documents': (
+        'status', 'summary',
+        'documents.*.status', 'documents.*.source', 'documents.*.error', 'documents.*.result_key',
+        'documents.*.data.document_class', 'documents.*.data.matched_blueprint.name',
+        'documents.*.data.matched_blueprint.confidence', 'documents.*.data.inference_result',
+        'documents.*.data.validation', 'documents.*.data.documents.*.inference_result',
+        'documents.*.data.documents.*.pages', 'documents.*.data.documents.*.document_class',
+        # Session-context summaries are already compact
+        'documents.*.data.class', 'documents.*.data.vendor', 'documents.*.data.invoice_number',
+        'documents.*.data.invoice_date', 'documents.*.data.due_date', 'documents.*.data.currency',
+        'documents.*.data.total', 'documents.*.data.line_items',
+    ),
+    'verify_applicant_documents': (
+        'status', 'summary', 'error',
+        'documents.*.status', 'documents.*.source', 'documents.*.error', 'documents.*.result_key',
+        'documents.*.data.document_class', 'documents.*.data.matched_blueprint.name',
+        'documents.*.data.inference_result', 'documents.*.data.class',
+    ),
+}
+
+
+def compact_json(value):
+    return json.dumps(value, separators=(',', ':'), ensure_ascii=False, default=str)
+
+
+def _split(path):
+    return path.split('.') if isinstance(path, str) else list(path)
+
+
+def project(value, paths):
+    """
+    Keep only the given dotted paths of a nested dict/list structure
+    """
+    tree = {}
+    for path in paths:
+        node = tree
+        for part in _split(path):
+            node = node.setdefault(part, {})
+
+    def walk(value, node):
+        if not node:
+            return value
+        if isinstance(value, list):
+            child = node.get(WILDCARD)
+            return [walk(item, child) for item in value] if child is not None else value
+        if not isinstance(value, dict):
+            return value
+        kept = {}
+        for key, item in value.items():
+            child = node.get(key, node.get(WILDCARD))
+            if child is not None:
+                kept[key] = walk(item, child)
+        return kept
+
+    return walk(value, tree)
+
+
+def select_path(value, path):
+    """
+    Return the part of value at a dotted path (list items by index), or raise KeyError
+    """
+    for part in _split(path) if path else []:
+        if isinstance(value, list) and part.isdigit() and int(part) < len(value):
+            value = value[int(part)]
+        elif isinstance(value, dict) and part in value:
+            value = value[part]
+        else:
+            raise KeyError(part)
+    return value
+
+
+def shrink(value, max_chars, max_items):
+    """
+    Clip long strings and lists, noting how much was left out
+    """
+    if isinstance(value, str):
+        return value if len(value) <= max_chars else f"{value[:max_chars]}... [{len(value) - max_chars} more chars]"
+    if isinstance(value, list):
+        items = [shrink(item, max_chars, max_items) for item in value[:max_items]]
+        if len(value) > max_items:
+            items.append(f"... [{len(value) - max_items} more items]")
+        return items
+    if isinstance(value, dict):
+        return {key: shrink(item, max_chars, max_items) for key, item in value.items()}
+    return value
+
+
+def _outline(value):
+    """
+    Scalars of the top level plus the size of each container, for payloads no pass could fit
+    """
+    if not isinstance(value, dict):
+        return {'type': type(value).__name__, 'length': len(value) if hasattr(value, '__len__') else None}
+    outline = {}
+    for key, item in value.items():
+        if isinstance(item, (dict, list)):
+            outline[key] = f"[{type(item).__name__} with {len(item)} entries]"
+        else:
+            outline[key] = shrink(item, 80, 0)
+    return outline
+
+
+def spill(s3_client, bucket, function, body):
+    """
+    Store a full response body in S3 and return its key
+    """
+    key = f"{SPILL_PREFIX}/{function}/{hashlib.sha1(body.encode('utf-8')).hexdigest()[:24]}.json"
+    s3_client.put_object(Bucket=bucket, Key=key, Body=body.encode('utf-8'), ContentType='application/json')
+    return key
+
+
+def shape_response(function, payload, s3_client=None, bucket=None, budget=RESPONSE_BUDGET_BYTES,
+                   full_result_key=None):
+    """
+    Serialize an action-group result for the agent: project it to the fields the
+    function needs, then fit it to the byte budget. When it has to be clipped, the
+    full data is referenced by S3 key (full_result_key, or a spilled copy) so the
+    agent can fetch parts of it with get_stored_result. Returns the JSON text.
+    """
+    projected = project(payload, PROJECTIONS[function]) if function in PROJECTIONS else payload
+    body = compact_json(projected)
+    full_bytes = len(body.encode('utf-8'))
+    truncated = full_bytes > budget
+
+    if truncated:
+        if full_result_key is None and s3_client is not None:
+            full_result_key = spill(s3_client, bucket, function, compact_json(payload))
+        note = {
+            'truncated': True,
+            'full_bytes': full_bytes,
+            'full_result_key': full_result_key,
+            'hint': 'Call get_stored_result with full_result_key and a path to read a specific part',
+        }
+        for max_chars, max_items in SHRINK_STEPS:
+            candidate = shrink(projected, max_chars, max_items)
+            body = compact_json({**candidate, '_response': note} if isinstance(candidate, dict)
+                                else {'result': candidate, '_response': note})
+            if len(body.encode('utf-8')) <= budget:
+                break
+        else:
+            body = compact_json({'outline': _outline(projected), '_response': note})
+
+    emit_metrics(
+        {'ActionResponseBytes': len(body.encode('utf-8')), 'ActionResponseFullBytes': full_bytes,
+         'ActionResponseTruncated': int(truncated)},
+        units={'ActionResponseBytes': 'Bytes', 'ActionResponseFullBytes': 'Bytes'},
+        dimensions={'Function': function}
+    )
+    if truncated:
+        logger.info(f"{function} response clipped from {full_bytes} to {len(body.encode('utf-8'))} bytes")
+    return body
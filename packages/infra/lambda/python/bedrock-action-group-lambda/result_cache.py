@@ -0,0 +1,143 @@
+import os
+import json
+import time
+import hashlib
+import logging
+from collections import OrderedDict
+
+from botocore.exceptions import ClientError
+
+logger = logging.getLogger()
+
+MAX_MEMORY_ENTRIES = int(os.environ.get('RESULT_CACHE_MAX_ENTRIES', '256'))
+SPILL_DIR = os.environ.get('RESULT_CACHE_SPILL_DIR', '/tmp/bda-result-cache')
+MAX_SPILL_BYTES = int(os.environ.get('RESULT_CACHE_MAX_SPILL_BYTES', str(256 * 1024 * 1024)))
+# Entries younger than this are served without contacting S3; older ones are
+# revalidated with a conditional GET that costs no body transfer when unchanged
+FRESHNESS_SECONDS = int(os.environ.get('RESULT_CACHE_FRESHNESS_SECONDS', '300'))
+
+
+class ResultCache:
+    """
+    Read-through cache for JSON objects in S3, keyed on (key, ETag).
+
+    Recently used objects stay in an in-memory LRU; evicted ones are spilled
+    to /tmp so a warm Lambda can still revalidate them cheaply instead of
+    downloading the body again.
+    """
+
+    def __init__(self, max_entries=MAX_MEMORY_ENTRIES, spill_dir=SPILL_DIR, max_spill_bytes=MAX_SPILL_BYTES,
+                 freshness_seconds=FRESHNESS_SECONDS):
+        self.max_entries = max_entries
+        self.spill_dir = spill_dir
+        self.max_spill_bytes = max_spill_bytes
+        self.freshness_seconds = freshness_seconds
+        self._entries = OrderedDict()
+        self.stats = {'memory_hits': 0, 'spill_hits': 0, 'revalidated': 0, 'misses': 0}
+
+    def get_json(self, s3_client, bucket, key):
+        """
+        Return the parsed object, fetching from S3 only when the cached copy is stale or changed
+        """
+        cache_key = f"{bucket}/{key}"
+        entry = self._entries.get(cache_key)
+        if entry is not None:
+            self._entries.move_to_end(cache_key)
+            source = 'memory_hits'
+        else:
+            entry = self._read_spill(cache_key)
+            source = 'spill_hits'
+
+        if entry is not None and time.time() - entry['fetched_at'] < self.freshness_seconds:
+            self.stats[source] += 1
+            return entry['data']
+
+        request = {'Bucket': bucket, 'Key': key}
+        if entry is not None:
+            request['IfNoneMatch'] = entry['etag']
+        try:
+            response = s3_client.get_object(**request)
+        except ClientError as e:
+            if entry is None or e.response['Error']['Code'] not in ('304', 'NotModified'):
+                raise
+            entry['fetched_at'] = time.time()
+            self.stats['revalidated'] += 1
+            self._store(cache_key, entry)
+            return entry['data']
+
+        self.stats['misses'] += 1
+        entry = {
+            'etag': response['ETag'],
+            'fetched_at': time.time(),
+            'data': json.loads(response['Body'].read()),
+        }
+        self._store(cache_key, entry)
+        return entry['data']
+
+    def hit_rate(self, stats=None):
+        stats = stats or self.stats
+        hits = stats['memory_hits'] + stats['spill_hits'] + stats['revalidated']
+        total = hits + stats['misses']
+        return hits / total if total else 0.0
+
+    def metrics(self):
+        """
+        Counts since the previous call, which start again from zero, so each emitted
+        metric covers one request instead of the lifetime of the warm instance
+        """
+        stats, self.stats = self.stats, dict.fromkeys(self.stats, 0)
+        metrics = {
+            'ResultCacheMemoryHits': stats['memory_hits'],
+            'ResultCacheSpillHits': stats['spill_hits'],
+            'ResultCacheRevalidations': stats['revalidated'],
+            'ResultCacheMisses': stats['misses'],
+        }
+        # A request that looked nothing up has no hit rate, rather than a rate of zero
+        if any(stats.values()):
+            metrics['ResultCacheHitRate'] = round(self.hit_rate(stats) * 100, 2)
+        return metrics
+
+    def _store(self, cache_key, entry):
+        self._entries[cache_key] = entry
+        self._entries.move_to_end(cache_key)
+        while len(self._entries) > self.max_entries:
+            evicted_key, evicted = self._entries.popitem(last=False)
+            self._write_spill(evicted_key, evicted)
+
+    def _spill_path(self, cache_key):
+        return os.path.join(self.spill_dir, hashlib.sha1(cache_key.encode('utf-8')).hexdigest() + '.json')
+
+    def _read_spill(self, cache_key):
+        path = self._spill_path(cache_key)
+        try:
+            with open(path, encoding='utf-8') as f:
+                entry = json.load(f)
+        except (OSError, ValueError):
+            return None
+        # Promote back into memory; the file is rewritten if it is evicted again
+        os.remove(path)
+        self._store(cache_key, entry)
+        return entry
+
+    def _write_spill(self, cache_key, entry):
+        try:
+            os.makedirs(self.spill_dir, exist_ok=True)
+            with open(self._spill_path(cache_key), 'w', encoding='utf-8') as f:
+                json.dump(entry, f, separators=(',', ':'))
+            self._trim_spill()
+        except OSError as e:
+            logger.warning(f"Could not spill cache entry {cache_key}: {str(e)}")
+
+    def _trim_spill(self):
+        files = []
+        total = 0
+        for name in os.listdir(self.spill_dir):
+            path = os.path.join(self.spill_dir, name)
+            stat = os.stat(path)
+            files.append((stat.st_mtime, stat.st_size, path))
+            total += stat.st_size
+        for _, size, path in sorted(files):
+            if total <= self.max_spill_bytes:
+                break
+            os.remove(path)
+            total -= size
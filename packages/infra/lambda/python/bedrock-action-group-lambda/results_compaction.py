@@ -0,0 +1,343 @@
+import io
+import os
+import re
+import json
+import time
+import logging
+from datetime import date, datetime, timezone
+from concurrent.futures import ThreadPoolExecutor
+
+import boto3
+import pyarrow as pa
+import pyarrow.parquet as pq
+from botocore.exceptions import ClientError
+
+from invoice_fields import normalize_invoice, normalize_vendor_name
+from metrics import emit_metrics
+
+logger = logging.getLogger()
+logger.setLevel(logging.INFO)
+
+AWS_REGION = os.environ.get('AWS_REGION', '')
+ACCOUNT_ID = os.environ.get('ACCOUNT_ID', '')
+S3_BUCKET = f"data-bucket-{ACCOUNT_ID}-{AWS_REGION}"
+RESULT_PREFIX = "bda-result/"
+# Hive-style layout: bda-analytics/invoices/invoice_month=YYYY-MM/vendor_slug=<slug>/data.parquet
+ANALYTICS_PREFIX = "bda-analytics/invoices"
+MANIFEST_KEY = "bda-analytics/_manifest.json"
+# Version 1 manifests kept only the first document's partition of each result
+MANIFEST_VERSION = 2
+READ_WORKERS = 16
+# Flattened inference_result columns beyond this are left out rather than widening every file
+MAX_FIELD_COLUMNS = int(os.environ.get('MAX_FIELD_COLUMNS', '256'))
+FIELD_COLUMN_PREFIX = 'field_'
+UNKNOWN_PARTITION = 'unknown'
+
+_CAMEL_BOUNDARY = re.compile(r'(?<=[a-z0-9])(?=[A-Z])')
+_NON_IDENTIFIER = re.compile(r'[^a-z0-9]+')
+
+RESULT_SCHEMA = pa.schema([
+    ('source_key', pa.string()),
+    ('source_etag', pa.string()),
+    ('source_last_modified', pa.timestamp('ms', tz='UTC')),
+    ('document_index', pa.int32()),
+    ('first_page', pa.int32()),
+    ('last_page', pa.int32()),
+    ('document_class', pa.string()),
+    ('matched_blueprint', pa.string()),
+    ('vendor', pa.string()),
+    ('vendor_key', pa.string()),
+    ('invoice_number', pa.string()),
+    ('invoice_date', pa.date32()),
+    ('due_date', pa.date32()),
+    ('payment_terms', pa.string()),
+    ('currency', pa.string()),
+    ('total', pa.float64()),
+    ('subtotal', pa.float64()),
+    ('tax_amount', pa.float64()),
+    ('tax_rate', pa.float64()),
+    ('discount', pa.float64()),
+    ('shipping', pa.float64()),
+    ('line_item_count', pa.int32()),
+])
+
+s3_client = boto3.client('s3')
+
+
+def column_name(path):
+    """
+    Turn a nested field path such as VendorAddress.City into field_vendor_address_city
+    """
+    parts = [_NON_IDENTIFIER.sub('_', _CAMEL_BOUNDARY.sub('_', str(part)).lower()).strip('_') for part in path]
+    return FIELD_COLUMN_PREFIX + '_'.join(part for part in parts if part)
+
+
+def flatten_fields(data, path=()):
+    """
+    Yield (column, value) for every leaf of inference_result; lists are kept as JSON text
+    """
+    for key, value in (data or {}).items():
+        if isinstance(value, dict):
+            yield from flatten_fields(value, path + (key,))
+        elif isinstance(value, list):
+            yield column_name(path + (key,)), json.dumps(value, default=str)
+        elif value is not None:
+            yield column_name(path + (key,)), value
+
+
+def _field_type(value):
+    return 'double' if isinstance(value, (int, float)) and not isinstance(value, bool) else 'string'
+
+
+def _label(value):
+    if isinstance(value, dict):
+        return value.get('name') or value.get('type') or value.get('arn')
+    return value
+
+
+def partition_of(row):
+    month = row['invoice_date'].strftime('%Y-%m') if row['invoice_date'] else UNKNOWN_PARTITION
+    vendor = (row['vendor_key'] or '').replace(' ', '-') or UNKNOWN_PARTITION
+    return f"invoice_month={month}/vendor_slug={vendor}"
+
+
+def result_rows(key, etag, last_modified, result):
+    """
+    One row per document in a stored result; split uploads carry several under "documents".
+    Uploads the pre-classifier skipped have no rows.
+    """
+    if result.get('status') == 'SKIPPED':
+        return []
+    documents = result.get('documents') or [result]
+    rows = []
+    for index, document in enumerate(documents):
+        inference_result = document.get('inference_result') or {}
+        record = normalize_invoice(inference_result)
+        pages = document.get('pages') or [None, None]
+        row = {
+            'source_key': key,
+            'source_etag': etag,
+            'source_last_modified': last_modified,
+            'document_index': index,
+            'first_page': pages[0],
+            'last_page': pages[-1],
+            'document_class': _label(document.get('document_class')),
+            'matched_blueprint': _label(document.get('matched_blueprint')),
+            'vendor': record['vendor'],
+            'vendor_key': normalize_vendor_name(record['vendor']) or None,
+            'invoice_number': record['invoice_number'],
+            'invoice_date': date.fromisoformat(record['invoice_date']) if record['invoice_date'] else None,
+            'due_date': date.fromisoformat(record['due_date']) if record['due_date'] else None,
+            'payment_terms': record['payment_terms'],
+            'currency': record['currency'],
+            'total': record['total'],
+            'subtotal': record['subtotal'],
+            'tax_amount': record['tax_amount'],
+            'tax_rate': record['tax_rate'],
+            'discount': record['discount'],
+            'shipping': record['shipping'],
+            'line_item_count': len(record['line_item_amounts']),
+        }
+        row.update(flatten_fields(inference_result))
+        rows.append(row)
+    return rows
+
+
+def load_manifest(s3_client, bucket):
+    """
+    Return (manifest, etag); the manifest maps each compacted result to its ETag and the
+    partitions its documents were written to
+    """
+    try:
+        response = s3_client.get_object(Bucket=bucket, Key=MANIFEST_KEY)
+    except ClientError as e:
+        if e.response['Error']['Code'] == 'NoSuchKey':
+            return {'version': MANIFEST_VERSION, 'objects': {}, 'columns': {}}, None
+        raise
+    return json.loads(response['Body'].read()), response['ETag']
+
+
+def save_manifest(s3_client, bucket, manifest, etag):
+    """
+    Conditional write so two overlapping runs cannot both record their view of the dataset
+    """
+    conditions = {'IfMatch': etag} if etag else {'IfNoneMatch': '*'}
+    s3_client.put_object(
+        Bucket=bucket,
+        Key=MANIFEST_KEY,
+        Body=json.dumps(manifest, separators=(',', ':')),
+        ContentType='application/json',
+        **conditions
+    )
+
+
+def list_results(s3_client, bucket):
+    """
+    Return {key: (etag, last_modified)} for every stored result
+    """
+    listed = {}
+    paginator = s3_client.get_paginator('list_objects_v2')
+    for page in paginator.paginate(Bucket=bucket, Prefix=RESULT_PREFIX):
+        for obj in page.get('Contents', []):
+            if obj['Key'].endswith('.json'):
+                listed[obj['Key']] = (obj['ETag'], obj.get('LastModified'))
+    return listed
+
+
+def list_partitions(s3_client, bucket):
+    """
+    Every partition that currently has a data file
+    """
+    partitions = set()
+    paginator = s3_client.get_paginator('list_objects_v2')
+    for page in paginator.paginate(Bucket=bucket, Prefix=f"{ANALYTICS_PREFIX}/"):
+        for obj in page.get('Contents', []):
+            if obj['Key'].endswith('/data.parquet'):
+                partitions.add(obj['Key'][len(ANALYTICS_PREFIX) + 1:-len('/data.parquet')])
+    return partitions
+
+
+def _widen_columns(columns, rows):
+    for row in rows:
+        for name, value in row.items():
+            if not name.startswith(FIELD_COLUMN_PREFIX):
+                continue
+            if name not in columns:
+                if len(columns) >= MAX_FIELD_COLUMNS:
+                    continue
+                columns[name] = _field_type(value)
+            elif columns[name] == 'double' and _field_type(value) == 'string':
+                # Only ever widen, so earlier partitions stay readable alongside new ones
+                columns[name] = 'string'
+
+
+def _partition_table(rows, columns):
+    schema = RESULT_SCHEMA
+    present = sorted({name for row in rows for name in row if name in columns})
+    for name in present:
+        schema = schema.append(pa.field(name, pa.float64() if columns[name] == 'double' else pa.string()))
+    cleaned = []
+    for row in rows:
+        item = {field.name: row.get(field.name) for field in schema}
+        for name in present:
+            if columns[name] == 'string' and item[name] is not None and not isinstance(item[name], str):
+                item[name] = str(item[name])
+        cleaned.append(item)
+    return pa.Table.from_pylist(cleaned, schema=schema)
+
+
+def rewrite_partition(s3_client, bucket, partition, new_rows, removed_keys, columns):
+    """
+    Replace one partition file: keep rows whose source was not removed or changed, add the new rows
+    """
+    key = f"{ANALYTICS_PREFIX}/{partition}/data.parquet"
+    rows = []
+    try:
+        existing = s3_client.get_object(Bucket=bucket, Key=key)['Body'].read()
+        rows = [row for row in pq.read_table(io.BytesIO(existing)).to_pylist() if row['source_key'] not in removed_keys]
+    except ClientError as e:
+        if e.response['Error']['Code'] != 'NoSuchKey':
+            raise
+    rows.extend(new_rows)
+
+    if not rows:
+        s3_client.delete_object(Bucket=bucket, Key=key)
+        return 0
+    buffer = io.BytesIO()
+    pq.write_table(_partition_table(rows, columns), buffer, compression='zstd')
+    s3_client.put_object(Bucket=bucket, Key=key, Body=buffer.getvalue(), ContentType='application/vnd.apache.parquet')
+    return len(rows)
+
+
+def compact_results(s3_client=s3_client, bucket=S3_BUCKET):
+    """
+    Fold new, changed and deleted bda-result/*.json objects into the partitioned Parquet dataset.
+
+    Only objects whose ETag differs from the manifest are read, and only the
+    partitions they enter or leave are rewritten.
+    """
+    start = time.time()
+    manifest, manifest_etag = load_manifest(s3_client, bucket)
+    compacted = manifest['objects']
+    listed = list_results(s3_client, bucket)
+
+    stale = set()
+    if manifest.get('version') != MANIFEST_VERSION:
+        # Older manifests do not know every partition a result reached, so every result is
+        # re-read and every existing partition rewritten once
+        logger.info(f"Rebuilding analytics dataset from manifest version {manifest.get('version', 1)}")
+        stale = list_partitions(s3_client, bucket)
+        compacted = {key: {} for key in compacted}
+        manifest.update(version=MANIFEST_VERSION, objects=compacted)
+
+    changed = [key for key, (etag, _) in listed.items() if compacted.get(key, {}).get('etag') != etag]
+    deleted = [key for key in compacted if key not in listed]
+    if not changed and not deleted:
+        logger.info("Analytics dataset is up to date")
+        return {'status': 'up_to_date', 'objects': len(listed)}
+
+    def read_result(key):
+        etag, last_modified = listed[key]
+        try:
+            result = json.loads(s3_client.get_object(Bucket=bucket, Key=key)['Body'].read())
+        except (ClientError, ValueError) as e:
+            logger.warning(f"Skipping unreadable result {key}: {str(e)}")
+            return key, None
+        return key, result_rows(key, etag, last_modified, result)
+
+    with ThreadPoolExecutor(max_workers=READ_WORKERS) as executor:
+        read = dict(executor.map(read_result, changed))
+
+    removed_keys = set(changed) | set(deleted)
+    new_rows = {}
+    for key, rows in read.items():
+        for row in rows or []:
+            new_rows.setdefault(partition_of(row), []).append(row)
+    affected = set(new_rows) | stale
+    for key in removed_keys:
+        affected.update(compacted.get(key, {}).get('partitions', []))
+    _widen_columns(manifest['columns'], [row for rows in new_rows.values() for row in rows])
+
+    def rewrite(partition):
+        return rewrite_partition(s3_client, bucket, partition, new_rows.get(partition, []),
+                                 removed_keys, manifest['columns'])
+
+    with ThreadPoolExecutor(max_workers=READ_WORKERS) as executor:
+        rows_written = sum(executor.map(rewrite, affected))
+
+    for key in deleted:
+        compacted.pop(key, None)
+    for key, rows in read.items():
+        if rows is None:
+            continue
+        compacted[key] = {'etag': listed[key][0], 'partitions': sorted({partition_of(row) for row in rows}),
+                          'rows': len(rows)}
+    manifest['updated_at'] = datetime.now(timezone.utc).isoformat()
+    save_manifest(s3_client, bucket, manifest, manifest_etag)
+
+    summary = {
+        'status': 'compacted',
+        'objects_compacted': sum(1 for rows in read.values() if rows is not None),
+        'objects_removed': len(deleted),
+        'partitions_rewritten': len(affected),
+        'rows_written': rows_written,
+    }
+    emit_metrics(
+        {'ResultsCompacted': summary['objects_compacted'], 'PartitionsRewritten': len(affected),
+         'CompactionDuration': round(time.time() - start, 3)},
+        units={'CompactionDuration': 'Seconds'}
+    )
+    logger.info(f"Compaction summary: {json.dumps(summary)}")
+    return summary
+
+
+def lambda_handler(event, context):
+    """
+    Scheduled entry point for incremental compaction
+    """
+    return compact_results()
+
+
+if __name__ == '__main__':
+    # Backfill from a workstation: ACCOUNT_ID=... AWS_REGION=... PYTHONPATH=../layers/common python results_compaction.py
+    print(json.dumps(compact_results(), indent=2))
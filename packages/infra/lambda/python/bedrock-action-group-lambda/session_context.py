@@ -0,0 +1,98 @@
+import json
+import logging
+
+from invoice_fields import normalize_invoice
+
+logger = logging.getLogger()
+
+# Session attribute holding {document: summary} as JSON between action-group calls
+CONTEXT_ATTRIBUTE = 'document_context'
+# Prompt attribute the agent sees on every turn, so it need not re-fetch documents
+PROMPT_ATTRIBUTE = 'known_documents'
+MAX_CONTEXT_DOCUMENTS = 10
+MAX_SUMMARY_FIELDS = 12
+MAX_VALUE_CHARS = 80
+INVOICE_SUMMARY_FIELDS = ('vendor', 'invoice_number', 'invoice_date', 'due_date', 'currency', 'total')
+
+
+def load_document_context(event):
+    """
+    Read the document summaries carried in the event's session attributes
+    """
+    raw = (event.get('sessionAttributes') or {}).get(CONTEXT_ATTRIBUTE)
+    if not raw:
+        return {}
+    try:
+        context = json.loads(raw)
+        return context if isinstance(context, dict) else {}
+    except ValueError:
+        logger.warning("Ignoring malformed document context in session attributes")
+        return {}
+
+
+def _clip(value):
+    text = str(value)
+    return text if len(text) <= MAX_VALUE_CHARS else text[:MAX_VALUE_CHARS - 3] + '...'
+
+
+def _scalar_fields(data, prefix=''):
+    for key, value in (data or {}).items():
+        if isinstance(value, dict):
+            yield from _scalar_fields(value, f"{prefix}{key}.")
+        elif not isinstance(value, list) and value not in (None, '', 'N/A'):
+            yield f"{prefix}{key}", value
+
+
+def summarize_document(result, validation=None):
+    """
+    Reduce a stored BDA result to the handful of fields the agent usually needs
+    """
+    document_class = result.get('document_class')
+    if isinstance(document_class, dict):
+        document_class = document_class.get('type')
+    if not document_class:
+        # Class from the content-based pre-classifier when BDA matched no blueprint
+        document_class = (result.get('pre_classification') or {}).get('class')
+    inference_result = result.get('inference_result') or {}
+
+    summary = {'class': document_class}
+    record = normalize_invoice(inference_result)
+    if record['total'] is not None or record['vendor']:
+        summary.update({field: record[field] for field in INVOICE_SUMMARY_FIELDS if record[field] is not None})
+        summary['line_items'] = len(record['line_item_amounts'])
+    else:
+        for count, (field, value) in enumerate(_scalar_fields(inference_result)):
+            if count >= MAX_SUMMARY_FIELDS:
+                break
+            summary[field] = _clip(value)
+    if validation:
+        summary['validation'] = validation.get('status')
+    return summary
+
+
+def remember_document(context, document, summary):
+    """
+    Add or refresh a summary, keeping only the most recent documents
+    """
+    context.pop(document, None)
+    context[document] = summary
+    while len(context) > MAX_CONTEXT_DOCUMENTS:
+        context.pop(next(iter(context)))
+
+
+def session_state_response(event, context):
+    """
+    Build the sessionAttributes/promptSessionAttributes to return with the action-group response
+    """
+    session_attributes = dict(event.get('sessionAttributes') or {})
+    prompt_attributes = dict(event.get('promptSessionAttributes') or {})
+    if context:
+        session_attributes[CONTEXT_ATTRIBUTE] = json.dumps(context, separators=(',', ':'), default=str)
+        prompt_attributes[PROMPT_ATTRIBUTE] = '; '.join(
+            f"{document}: " + ', '.join(f"{k}={v}" for k, v in summary.items())
+            for document, summary in context.items()
+        )
+    return {
+        'sessionAttributes': session_attributes,
+        'promptSessionAttributes': prompt_attributes
+    }
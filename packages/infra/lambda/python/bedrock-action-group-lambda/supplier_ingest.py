@@ -0,0 +1,68 @@
+import os
+import json
+import time
+import logging
+from urllib.parse import unquote_plus
+
+import boto3
+
+from metrics import emit_metrics
+from vendor_embeddings import (
+    CHANGES_PREFIX, SUPPLIER_LIST_KEY, IndexConflict, VendorIndex,
+    apply_supplier_changes, build_from_supplier_list,
+)
+
+logger = logging.getLogger()
+logger.setLevel(logging.INFO)
+
+AWS_REGION = os.environ.get('AWS_REGION', '')
+ACCOUNT_ID = os.environ.get('ACCOUNT_ID', '')
+S3_BUCKET = f"data-bucket-{ACCOUNT_ID}-{AWS_REGION}"
+# Pointer swaps are compare-and-swap; a lost race re-reads the pointer and tries again
+MAX_PUBLISH_ATTEMPTS = 3
+
+s3_client = boto3.client('s3')
+# Kept warm so consecutive change files only open the newest segments
+vendor_index = VendorIndex()
+
+
+def ingest_object(bucket, key):
+    """
+    Publish a full supplier master as a new base, or a change file as a delta segment
+    """
+    for attempt in range(MAX_PUBLISH_ATTEMPTS):
+        try:
+            if key == SUPPLIER_LIST_KEY:
+                pointer = build_from_supplier_list(s3_client, bucket)
+                return {'status': 'rebuilt', 'version': pointer['version'], 'delta_segments': 0}
+            response = s3_client.get_object(Bucket=bucket, Key=key)
+            content = response['Body'].read().decode('utf-8-sig')
+            return apply_supplier_changes(s3_client, bucket, content, f"{key}#{response['ETag']}", vendor_index)
+        except IndexConflict:
+            logger.warning(f"Vendor index pointer moved while publishing {key} (attempt {attempt + 1})")
+    raise IndexConflict(key)
+
+
+def lambda_handler(event, context):
+    """
+    EventBridge "Object Created" events for SupplierList.csv and supplier-changes/*.csv
+    """
+    start = time.time()
+    bucket = event.get('detail', {}).get('bucket', {}).get('name', S3_BUCKET)
+    key = unquote_plus(event.get('detail', {}).get('object', {}).get('key', ''))
+    if key != SUPPLIER_LIST_KEY and not (key.startswith(CHANGES_PREFIX) and key.lower().endswith('.csv')):
+        logger.info(f"Ignoring {key}")
+        return {'status': 'ignored', 'key': key}
+
+    summary = ingest_object(bucket, key)
+    summary['key'] = key
+    emit_metrics(
+        {'SupplierRecordsUpserted': summary.get('upserted', 0),
+         'SupplierRecordsDeleted': summary.get('deleted', 0),
+         'VendorIndexDeltaSegments': summary.get('delta_segments', 0),
+         'SupplierIngestDuration': round(time.time() - start, 3)},
+        units={'SupplierIngestDuration': 'Seconds'},
+        properties={'Status': summary['status']}
+    )
+    logger.info(f"Supplier ingest summary: {json.dumps(summary)}")
+    return summary
@@ -0,0 +1,583 @@
+import io
+import os
+import csv
+import sys
+import json
+import time
+import shutil
+import zlib
+import hashlib
+import logging
+import unicodedata
+from datetime import datetime, timezone
+
+import numpy as np
+from botocore.exceptions import ClientError
+
+from invoice_fields import normalize_vendor_name
+from bank_verification import bank_fields, build_bank_index
+
+logger = logging.getLogger()
+
+# Supplier master uploaded from the web app's Supplier Management tab
+SUPPLIER_LIST_KEY = "SupplierList.csv"
+INDEX_PREFIX = "vendor-index"
+CURRENT_POINTER_KEY = f"{INDEX_PREFIX}/current.json"
+LOCAL_INDEX_DIR = os.environ.get('VENDOR_INDEX_DIR', '/tmp/vendor-index')
+FRESHNESS_SECONDS = int(os.environ.get('VENDOR_INDEX_FRESHNESS_SECONDS', '300'))
+EMBEDDING_DIM = 256
+NGRAM_SIZE = 3
+WORD_WEIGHT = 2.0
+# A flat scan stays around 15 ms up to this many names; larger masters get an IVF coarse index
+IVF_MIN_ROWS = 100000
+IVF_ITERATIONS = 8
+# Lists probed per query; trades recall for latency (32 of ~400 lists is ~1.5 ms)
+IVF_NPROBE = int(os.environ.get('VENDOR_INDEX_NPROBE', '32'))
+ASSIGN_BLOCK_ROWS = 8192
+# SAP splits long names across Name 1 / Name 2 at this width, sometimes mid-word
+SAP_NAME_WIDTH = 35
+# Bumped whenever the published files change shape, so a new version is built
+INDEX_FORMAT = 2
+INDEX_FILES = ('vectors.npy', 'row_supplier.npy', 'centroids.npy', 'offsets.npy', 'bank_index.json', 'meta.json')
+# Daily master changes are published as small delta segments on top of a full base
+# index; they are folded into a new base once there are too many or they grow too large
+CHANGES_PREFIX = "supplier-changes/"
+CHANGE_COLUMNS = ('change', 'action', 'operation')
+DELETE_CHANGES = ('DELETE', 'DEL', 'D', 'REMOVE')
+MAX_DELTA_SEGMENTS = int(os.environ.get('VENDOR_INDEX_MAX_DELTAS', '24'))
+DELTA_FOLD_RATIO = float(os.environ.get('VENDOR_INDEX_FOLD_RATIO', '0.1'))
+# Change files already applied, remembered so redelivered upload events are no-ops
+APPLIED_CHANGES_KEPT = 200
+MAX_SUPERSEDED_OVERFETCH = 256
+
+# Abbreviations common on invoices, expanded so they share n-grams with the master record
+ABBREVIATIONS = {
+    'svc': 'service', 'svcs': 'services', 'serv': 'service', 'eng': 'engineering', 'engg': 'engineering',
+    'intl': 'international', 'mgmt': 'management', 'dev': 'development', 'sys': 'systems',
+    'tech': 'technology', 'hk': 'hong kong', 'govt': 'government', 'dept': 'department',
+    'assoc': 'association', 'bros': 'brothers', 'mfg': 'manufacturing', 'pwc': 'pricewaterhousecoopers',
+}
+_TRUNCATED_SUFFIXES = {'limite', 'limit', 'limi', 'compan'}
+
+
+def normalize_for_embedding(name):
+    """
+    ASCII-fold a vendor name, drop legal-form noise and expand abbreviations
+    """
+    folded = unicodedata.normalize('NFKD', str(name or '')).encode('ascii', 'ignore').decode('ascii')
+    tokens = normalize_vendor_name(folded.replace('&', ' and ')).split()
+    expanded = []
+    for token in tokens:
+        if token in _TRUNCATED_SUFFIXES:
+            continue
+        expanded.extend(ABBREVIATIONS.get(token, token).split())
+    return ' '.join(expanded)
+
+
+def _features(text):
+    padded = f" {text} "
+    for position in range(len(padded) - NGRAM_SIZE + 1):
+        yield padded[position:position + NGRAM_SIZE], 1.0
+    for word in text.split():
+        yield f"w:{word}", WORD_WEIGHT
+
+
+def embed(name, dim=EMBEDDING_DIM):
+    """
+    Signed feature-hashing vector over character trigrams and words, L2 normalized
+    """
+    vector = np.zeros(dim, dtype=np.float32)
+    for feature, weight in _features(normalize_for_embedding(name)):
+        hashed = zlib.crc32(feature.encode('utf-8'))
+        vector[hashed % dim] += weight if (hashed >> 16) & 1 else -weight
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm else vector
+
+
+def embed_many(names, dim=EMBEDDING_DIM):
+    matrix = np.zeros((len(names), dim), dtype=np.float32)
+    for row, name in enumerate(names):
+        matrix[row] = embed(name, dim)
+    return matrix
+
+
+def combine_names(name1, name2):
+    """
+    Re-join a name that SAP split across Name 1 / Name 2
+    """
+    name1, name2 = (name1 or '').strip(), (name2 or '').strip()
+    if not name2:
+        return name1
+    return f"{name1}{name2}" if len(name1) >= SAP_NAME_WIDTH else f"{name1} {name2}"
+
+
+def _supplier(headers, values, alias_column):
+    values = values + [''] * (8 - len(values))
+    aliases = []
+    if alias_column is not None and alias_column < len(values):
+        aliases = [alias.strip() for alias in values[alias_column].split(';') if alias.strip()]
+    return {
+        'code': values[0].strip(),
+        'name': combine_names(values[1], values[2]),
+        'group': values[3].strip(),
+        'category': values[4].strip(),
+        'country': values[5].strip(),
+        'status': values[7].strip(),
+        'aliases': aliases,
+        **bank_fields(headers, values),
+    }
+
+
+def _read_csv(content):
+    rows = list(csv.reader(io.StringIO(content.lstrip('\ufeff'))))
+    if not rows:
+        return [], [], None
+    headers = [header.strip().lower() for header in rows[0]]
+    alias_column = next((i for i, header in enumerate(headers) if header in ('alias', 'aliases')), None)
+    return headers, rows[1:], alias_column
+
+
+def parse_supplier_csv(content):
+    """
+    Parse the supplier master (Supplier, Name 1, Name 2, Group, Group, C/R, C/R, status)
+    plus optional Aliases and bank detail columns, located by header
+    """
+    headers, rows, alias_column = _read_csv(content)
+    suppliers = []
+    for values in rows:
+        supplier = _supplier(headers, values, alias_column)
+        if supplier['code'] and supplier['name']:
+            suppliers.append(supplier)
+    return suppliers
+
+
+def parse_change_csv(content):
+    """
+    Parse a supplier master change file: the master's columns plus a Change column
+    of ADD, UPDATE or DELETE (blank means ADD/UPDATE). Returns (upserts, deleted codes);
+    the last row for a code wins.
+    """
+    headers, rows, alias_column = _read_csv(content)
+    change_column = next((i for i, header in enumerate(headers) if header in CHANGE_COLUMNS), None)
+    changes = {}
+    for values in rows:
+        supplier = _supplier(headers, values, alias_column)
+        if not supplier['code']:
+            continue
+        change = values[change_column].strip().upper() if change_column is not None and change_column < len(values) else ''
+        if change in DELETE_CHANGES:
+            changes[supplier['code']] = None
+        elif supplier['name']:
+            changes[supplier['code']] = supplier
+    upserts = [supplier for supplier in changes.values() if supplier]
+    deleted = [code for code, supplier in changes.items() if supplier is None]
+    return upserts, deleted
+
+
+def train_ivf(vectors, nlist, iterations=IVF_ITERATIONS, seed=0):
+    """
+    Spherical k-means; returns (centroids, assignment per row)
+    """
+    rng = np.random.default_rng(seed)
+    centroids = vectors[rng.choice(len(vectors), nlist, replace=False)].copy()
+    assignment = np.zeros(len(vectors), dtype=np.int32)
+    for _ in range(iterations):
+        for start in range(0, len(vectors), ASSIGN_BLOCK_ROWS):
+            block = vectors[start:start + ASSIGN_BLOCK_ROWS]
+            assignment[start:start + len(block)] = np.argmax(block @ centroids.T, axis=1)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, assignment, vectors)
+        norms = np.linalg.norm(sums, axis=1, keepdims=True)
+        empty = norms[:, 0] == 0
+        centroids = np.where(empty[:, None], vectors[rng.choice(len(vectors), nlist)], sums / np.maximum(norms, 1e-12))
+    return centroids.astype(np.float32), assignment
+
+
+def build_index(suppliers, output_dir, dim=EMBEDDING_DIM, deleted=()):
+    """
+    Embed every supplier name and alias into output_dir; large masters also get an IVF
+    coarse index. A delta segment also lists the supplier codes it deletes.
+    """
+    names = []
+    row_supplier = []
+    for position, supplier in enumerate(suppliers):
+        for name in dict.fromkeys([supplier['name']] + supplier.get('aliases', [])):
+            names.append(name)
+            row_supplier.append(position)
+    vectors = embed_many(names, dim)
+    row_supplier = np.asarray(row_supplier, dtype=np.int32)
+
+    if len(vectors) >= IVF_MIN_ROWS:
+        nlist = int(np.sqrt(len(vectors)))
+        centroids, assignment = train_ivf(vectors, nlist)
+        # Rows are stored grouped by list so each probe reads one contiguous slice of the memory map
+        order = np.argsort(assignment, kind='stable')
+        vectors, row_supplier, names = vectors[order], row_supplier[order], [names[i] for i in order]
+        offsets = np.searchsorted(assignment[order], np.arange(nlist + 1)).astype(np.int64)
+    else:
+        centroids = np.zeros((0, dim), dtype=np.float32)
+        offsets = np.zeros(1, dtype=np.int64)
+
+    os.makedirs(output_dir, exist_ok=True)
+    np.save(os.path.join(output_dir, 'vectors.npy'), vectors)
+    np.save(os.path.join(output_dir, 'row_supplier.npy'), row_supplier)
+    np.save(os.path.join(output_dir, 'centroids.npy'), centroids)
+    np.save(os.path.join(output_dir, 'offsets.npy'), offsets)
+    with open(os.path.join(output_dir, 'bank_index.json'), 'w') as f:
+        json.dump(build_bank_index(suppliers), f, separators=(',', ':'))
+    with open(os.path.join(output_dir, 'meta.json'), 'w') as f:
+        json.dump({
+            'format': INDEX_FORMAT,
+            'dim': dim,
+            'ngram': NGRAM_SIZE,
+            'suppliers': suppliers,
+            'names': names,
+            'deleted': list(deleted),
+            'created_at': datetime.now(timezone.utc).isoformat(),
+        }, f, separators=(',', ':'))
+    return len(vectors)
+
+
+class IndexConflict(Exception):
+    """
+    The current pointer changed between reading it and swapping it
+    """
+
+
+def _pointer(body):
+    pointer = json.loads(body)
+    # Pointers written before delta segments existed name only a base version
+    pointer.setdefault('base', pointer['version'])
+    pointer.setdefault('deltas', [])
+    pointer.setdefault('applied', [])
+    return pointer
+
+
+def load_pointer(s3_client, bucket):
+    """
+    Return (pointer, etag) for the published index, or (None, None)
+    """
+    try:
+        response = s3_client.get_object(Bucket=bucket, Key=CURRENT_POINTER_KEY)
+    except ClientError as e:
+        if e.response['Error']['Code'] == 'NoSuchKey':
+            return None, None
+        raise
+    return _pointer(response['Body'].read()), response['ETag']
+
+
+def upload_segment(s3_client, bucket, output_dir, segment):
+    """
+    Upload one immutable index directory; meta.json last so a partial upload is never read
+    """
+    for name in INDEX_FILES:
+        s3_client.upload_file(os.path.join(output_dir, name), bucket, f"{INDEX_PREFIX}/{segment}/{name}")
+
+
+def swap_pointer(s3_client, bucket, pointer, etag):
+    """
+    Compare-and-swap the current pointer; etag None means no pointer may exist yet
+    """
+    conditions = {'IfMatch': etag} if etag else {'IfNoneMatch': '*'}
+    pointer = {**pointer, 'published_at': datetime.now(timezone.utc).isoformat()}
+    try:
+        s3_client.put_object(
+            Bucket=bucket,
+            Key=CURRENT_POINTER_KEY,
+            Body=json.dumps(pointer, separators=(',', ':')),
+            ContentType='application/json',
+            **conditions
+        )
+    except ClientError as e:
+        if e.response['Error']['Code'] in ('PreconditionFailed', 'ConditionalRequestConflict'):
+            raise IndexConflict(CURRENT_POINTER_KEY)
+        raise
+    return pointer
+
+
+def _segment_id(content):
+    return hashlib.sha1(f"{INDEX_FORMAT}:{EMBEDDING_DIM}:{NGRAM_SIZE}:{content}".encode('utf-8')).hexdigest()[:16]
+
+
+def publish_base(s3_client, bucket, suppliers, version, etag, applied=()):
+    """
+    Build and upload a full index, then point at it with no delta segments
+    """
+    output_dir = os.path.join(LOCAL_INDEX_DIR, version)
+    rows = build_index(suppliers, output_dir)
+    logger.info(f"Built vendor index {version} with {rows} names")
+    upload_segment(s3_client, bucket, output_dir, version)
+    return swap_pointer(s3_client, bucket, {
+        'version': version, 'base': version, 'deltas': [], 'applied': list(applied)[-APPLIED_CHANGES_KEPT:],
+    }, etag)
+
+
+def build_from_supplier_list(s3_client, bucket, publish=True):
+    """
+    Embed the full supplier master in S3 and publish it as a new base, replacing
+    any delta segments; returns the published pointer (or the version when not publishing)
+    """
+    content = s3_client.get_object(Bucket=bucket, Key=SUPPLIER_LIST_KEY)['Body'].read().decode('utf-8-sig')
+    version = _segment_id(content)
+    if not publish:
+        build_index(parse_supplier_csv(content), os.path.join(LOCAL_INDEX_DIR, version))
+        return version
+    _, etag = load_pointer(s3_client, bucket)
+    return publish_base(s3_client, bucket, parse_supplier_csv(content), version, etag)
+
+
+def apply_supplier_changes(s3_client, bucket, content, source, index):
+    """
+    Publish a change file as a delta segment on top of the current index.
+
+    Only the changed suppliers are embedded and uploaded, so warm readers fetch
+    just that segment. Once deltas pass MAX_DELTA_SEGMENTS or DELTA_FOLD_RATIO of
+    the base, the live suppliers are folded into a fresh base instead.
+    """
+    pointer, etag = load_pointer(s3_client, bucket)
+    if pointer is None:
+        # Changes can arrive before any full master; start them from an empty base
+        try:
+            build_from_supplier_list(s3_client, bucket)
+        except ClientError as e:
+            if e.response['Error']['Code'] != 'NoSuchKey':
+                raise
+            publish_base(s3_client, bucket, [], _segment_id(''), None)
+        pointer, etag = load_pointer(s3_client, bucket)
+    if source in pointer['applied']:
+        return {'status': 'already_applied', 'version': pointer['version']}
+
+    upserts, deleted = parse_change_csv(content)
+    applied = (pointer['applied'] + [source])[-APPLIED_CHANGES_KEPT:]
+    segment = _segment_id(f"{pointer['version']}:{source}:{content}")
+    output_dir = os.path.join(LOCAL_INDEX_DIR, segment)
+    build_index(upserts, output_dir, deleted=deleted)
+    upload_segment(s3_client, bucket, output_dir, segment)
+    candidate = {**pointer, 'version': segment, 'deltas': pointer['deltas'] + [segment], 'applied': applied}
+
+    index.activate(s3_client, bucket, candidate)
+    delta_suppliers = sum(len(s.suppliers) + len(s.deleted) for s in index.segments[1:])
+    if len(candidate['deltas']) > MAX_DELTA_SEGMENTS or delta_suppliers > DELTA_FOLD_RATIO * max(len(index.segments[0].suppliers), 1):
+        suppliers = index.live_suppliers()
+        version = _segment_id(json.dumps(suppliers, sort_keys=True))
+        published = publish_base(s3_client, bucket, suppliers, version, etag, applied)
+        status = 'folded'
+    else:
+        published = swap_pointer(s3_client, bucket, candidate, etag)
+        status = 'applied'
+    return {
+        'status': status,
+        'version': published['version'],
+        'delta_segments': len(published['deltas']),
+        'upserted': len(upserts),
+        'deleted': len(deleted),
+    }
+
+
+class IndexSegment:
+    """
+    One published index directory: the full base or a delta of changed suppliers
+    """
+
+    def __init__(self, path):
+        with open(os.path.join(path, 'meta.json')) as f:
+            meta = json.load(f)
+        self.path = path
+        self.vectors = np.load(os.path.join(path, 'vectors.npy'), mmap_mode='r')
+        self.row_supplier = np.load(os.path.join(path, 'row_supplier.npy'))
+        self.centroids = np.load(os.path.join(path, 'centroids.npy'))
+        self.offsets = np.load(os.path.join(path, 'offsets.npy'))
+        with open(os.path.join(path, 'bank_index.json')) as f:
+            self.bank_index = json.load(f)
+        self.suppliers = meta['suppliers']
+        self.names = meta['names']
+        self.dim = meta['dim']
+        self.deleted = meta.get('deleted', [])
+        self._codes = None
+
+    def codes(self):
+        """
+        Supplier code -> position, built once per segment on first use
+        """
+        if self._codes is None:
+            self._codes = {supplier['code']: position for position, supplier in enumerate(self.suppliers)}
+        return self._codes
+
+    def scores(self, query, nprobe):
+        """
+        Return (rows, similarities) for the rows worth scoring against query
+        """
+        if len(self.centroids):
+            lists = np.argsort(-(self.centroids @ query))[:nprobe]
+            rows = np.concatenate([np.arange(self.offsets[l], self.offsets[l + 1]) for l in lists])
+            return rows, np.concatenate([self.vectors[self.offsets[l]:self.offsets[l + 1]] @ query for l in lists])
+        return np.arange(len(self.names)), self.vectors @ query
+
+
+class _BankLookup:
+    """
+    One bank_index table read across segments, in global positions, live suppliers only
+    """
+
+    def __init__(self, segments, starts, live, table):
+        self.segments = segments
+        self.starts = starts
+        self.live = live
+        self.table = table
+
+    def get(self, key, default=None):
+        owners = [start + position for start, segment in zip(self.starts, self.segments)
+                  for position in segment.bank_index[self.table].get(key, ()) if self.live[start + position]]
+        return owners or default
+
+
+class VendorIndex:
+    """
+    Memory-mapped supplier embeddings: a base index plus delta segments, where a
+    later segment supersedes earlier records with the same supplier code. The
+    pointer ETag is re-checked at most every FRESHNESS_SECONDS, and a new version
+    only downloads the segments not already in /tmp. Supplier positions are global
+    across segments.
+    """
+
+    def __init__(self, local_dir=LOCAL_INDEX_DIR, freshness_seconds=FRESHNESS_SECONDS):
+        self.local_dir = local_dir
+        self.freshness_seconds = freshness_seconds
+        self.version = None
+        self.pointer_etag = None
+        self.checked_at = 0.0
+        self.loaded = {}
+        self.segments = []
+        self.starts = []
+        self.live = None
+        self.dead = 0
+        self.suppliers = []
+        self.bank_index = {}
+
+    def _fetch(self, s3_client, bucket, segment):
+        path = os.path.join(self.local_dir, segment)
+        if not os.path.exists(os.path.join(path, 'meta.json')):
+            os.makedirs(path, exist_ok=True)
+            # meta.json last, so its presence marks a complete download
+            for name in INDEX_FILES:
+                s3_client.download_file(bucket, f"{INDEX_PREFIX}/{segment}/{name}", os.path.join(path, name))
+        return path
+
+    def activate(self, s3_client, bucket, pointer):
+        """
+        Open the segments a pointer names, reusing those already loaded, and swap them in
+        """
+        names = [pointer['base']] + pointer['deltas']
+        for name in names:
+            if name not in self.loaded:
+                self.loaded[name] = IndexSegment(self._fetch(s3_client, bucket, name))
+        segments = [self.loaded[name] for name in names]
+        for name in set(self.loaded) - set(names):
+            shutil.rmtree(self.loaded.pop(name).path, ignore_errors=True)
+
+        starts = [0]
+        for segment in segments:
+            starts.append(starts[-1] + len(segment.suppliers))
+        live = np.ones(starts[-1], dtype=bool)
+        # Only codes touched by deltas are tracked; everything else resolves to the base
+        owners = {}
+        base_codes = segments[0].codes()
+        for start, segment in zip(starts[1:], segments[1:]):
+            for code in segment.deleted + [supplier['code'] for supplier in segment.suppliers]:
+                previous = owners[code] if code in owners else base_codes.get(code)
+                if previous is not None:
+                    live[previous] = False
+                owners[code] = None
+            for position, supplier in enumerate(segment.suppliers):
+                owners[supplier['code']] = start + position
+
+        suppliers = segments[0].suppliers
+        if len(segments) > 1:
+            suppliers = [supplier for segment in segments for supplier in segment.suppliers]
+        starts = starts[:-1]
+        self.segments, self.starts, self.live, self.suppliers = segments, starts, live, suppliers
+        self.dead = int(len(live) - live.sum())
+        self.bank_index = {table: _BankLookup(segments, starts, live, table) for table in ('accounts', 'swift')}
+        self.dim = segments[0].dim
+        self.version = pointer['version']
+
+    def live_suppliers(self):
+        return [supplier for position, supplier in enumerate(self.suppliers) if self.live[position]]
+
+    def refresh(self, s3_client, bucket):
+        """
+        Make sure the current index is open; builds and publishes one from the
+        supplier list if none exists yet. Returns False when there is no supplier list.
+        """
+        if self.segments and time.time() - self.checked_at < self.freshness_seconds:
+            return True
+        try:
+            response = s3_client.get_object(Bucket=bucket, Key=CURRENT_POINTER_KEY,
+                                            **({'IfNoneMatch': self.pointer_etag} if self.pointer_etag else {}))
+            pointer = _pointer(response['Body'].read())
+            etag = response['ETag']
+        except ClientError as e:
+            code = e.response['Error']['Code']
+            if code in ('304', 'NotModified'):
+                self.checked_at = time.time()
+                return True
+            if code != 'NoSuchKey':
+                raise
+            try:
+                build_from_supplier_list(s3_client, bucket)
+            except ClientError as e:
+                if e.response['Error']['Code'] == 'NoSuchKey':
+                    return False
+                raise
+            except IndexConflict:
+                pass
+            pointer, etag = load_pointer(s3_client, bucket)
+        if pointer['version'] != self.version:
+            self.activate(s3_client, bucket, pointer)
+        self.pointer_etag = etag
+        self.checked_at = time.time()
+        return True
+
+    def search(self, name, top_k=5, nprobe=IVF_NPROBE):
+        """
+        Return up to top_k (supplier, similarity, matched_name), best alias per supplier
+        """
+        return [(self.suppliers[position], similarity, matched_name)
+                for position, similarity, matched_name in self.match_positions(name, top_k, nprobe)]
+
+    def match_positions(self, name, top_k=5, nprobe=IVF_NPROBE):
+        """
+        Like search, but with supplier positions for looking up other per-supplier indexes
+        """
+        if not self.segments:
+            return []
+        query = embed(name, self.dim)
+        if not query.any():
+            return []
+        # Over-fetch so several aliases of one supplier, or superseded records, cannot crowd others out
+        wanted = top_k * 4 + min(self.dead, MAX_SUPERSEDED_OVERFETCH)
+        candidates = []
+        for start, segment in zip(self.starts, self.segments):
+            rows, scores = segment.scores(query, nprobe)
+            if not len(scores):
+                continue
+            count = min(len(scores), wanted)
+            for position in np.argpartition(-scores, count - 1)[:count]:
+                row = int(rows[position])
+                candidates.append((float(scores[position]), start + int(segment.row_supplier[row]), segment.names[row]))
+
+        matches = {}
+        for similarity, supplier, matched_name in sorted(candidates, key=lambda candidate: -candidate[0]):
+            if supplier in matches or not self.live[supplier]:
+                continue
+            matches[supplier] = (supplier, similarity, matched_name)
+            if len(matches) == top_k:
+                break
+        return list(matches.values())
+
+
+if __name__ == '__main__':
+    # PYTHONPATH=../layers/common python vendor_embeddings.py SupplierList.csv <output_dir>
+    with open(sys.argv[1], encoding='utf-8-sig') as f:
+        supplier_rows = parse_supplier_csv(f.read())
+    print(f"Embedded {build_index(supplier_rows, sys.argv[2])} names from {len(supplier_rows)} suppliers")
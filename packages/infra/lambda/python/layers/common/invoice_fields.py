@@ -0,0 +1,136 @@
+import re
+from datetime import datetime
+
+# BDA output keys depend on the blueprint that matched: the action group
+# contract and the public invoice blueprint use snake_case (invoice_total_amount,
+# line_items) while the Comprehensive-Invoice blueprint emits PascalCase
+# (InvoiceTotalAmount, LineItems). Keys are folded (lower-case, no separators)
+# before lookup so both shapes resolve to the same canonical field. Shared with
+# the BDA load function, whose vendor templates learn fields through these aliases.
+FIELD_ALIASES = {
+    'vendor': ('vendor', 'vendorname', 'suppliername', 'supplier'),
+    'invoice_number': ('invoicenumber', 'invoiceno', 'invoiceid'),
+    'invoice_date': ('invoicedate', 'date'),
+    'due_date': ('duedate',),
+    'payment_terms': ('paymentterms',),
+    'currency': ('currency',),
+    'total': ('invoicetotalamount', 'totalamount', 'amountdue', 'total'),
+    'subtotal': ('subtotalamount', 'subtotal'),
+    'tax_amount': ('taxamount', 'tax'),
+    'tax_rate': ('taxrate',),
+    'discount': ('discountamount', 'discount'),
+    'shipping': ('shippingamount', 'shipping'),
+}
+LINE_ITEM_KEYS = ('lineitems', 'invoicelineitems', 'items')
+LINE_AMOUNT_KEYS = ('amount', 'linetotal', 'total')
+BANK_DETAIL_KEYS = ('vendorbankingdetails', 'vendorbankdetails', 'bankdetails')
+BANK_ALIASES = {
+    'bank_account': ('bankaccount', 'bankaccountnumber', 'accountnumber'),
+    'bank_code': ('bankcode', 'routingnumber'),
+    'swift_code': ('swiftcode', 'swift', 'bic'),
+}
+AMOUNT_FIELDS = ('total', 'subtotal', 'tax_amount', 'tax_rate', 'discount', 'shipping')
+DATE_FIELDS = ('invoice_date', 'due_date')
+DATE_FORMATS = (
+    '%Y-%m-%d', '%m/%d/%Y', '%Y/%m/%d', '%d-%m-%Y', '%d.%m.%Y',
+    '%d %b %Y', '%d %B %Y', '%b %d, %Y', '%B %d, %Y', '%m/%d/%y',
+)
+
+_AMOUNT_STRIP = re.compile(r'[^0-9.\-]')
+_NAME_NOISE = re.compile(r'[^a-z0-9]+')
+_NAME_SUFFIXES = {'limited', 'ltd', 'co', 'company', 'inc', 'corp', 'corporation', 'llc', 'plc', 'the'}
+
+
+def fold_key(key):
+    return str(key).replace('_', '').replace('-', '').replace(' ', '').lower()
+
+
+def _folded(mapping):
+    if not isinstance(mapping, dict):
+        return {}
+    return {fold_key(k): v for k, v in mapping.items()}
+
+
+def _first(folded, aliases):
+    for alias in aliases:
+        value = folded.get(alias)
+        if value not in (None, '', 'N/A'):
+            return value
+    return None
+
+
+def parse_amount(value):
+    """
+    Parse an extracted amount such as "HK$1,250.00" or "(12.50)" into a float
+    """
+    if value is None or isinstance(value, bool):
+        return None
+    if isinstance(value, (int, float)):
+        return float(value)
+    text = str(value).strip()
+    negative = text.startswith('(') and text.endswith(')')
+    text = _AMOUNT_STRIP.sub('', text)
+    if text in ('', '-', '.', '-.'):
+        return None
+    try:
+        amount = float(text)
+    except ValueError:
+        return None
+    return -amount if negative else amount
+
+
+def parse_date(value):
+    """
+    Parse an extracted date into an ISO (YYYY-MM-DD) string
+    """
+    if not value:
+        return None
+    text = str(value).strip()
+    for fmt in DATE_FORMATS:
+        try:
+            return datetime.strptime(text, fmt).date().isoformat()
+        except ValueError:
+            continue
+    return None
+
+
+def normalize_vendor_name(name):
+    """
+    Lower-case a vendor name and drop punctuation and legal-form suffixes
+    """
+    if not name:
+        return ''
+    tokens = _NAME_NOISE.sub(' ', str(name).lower()).split()
+    return ' '.join(token for token in tokens if token not in _NAME_SUFFIXES)
+
+
+def normalize_invoice(inference_result):
+    """
+    Map a BDA inference_result (either key style) onto canonical flat fields
+    """
+    folded = _folded(inference_result)
+    record = {field: _first(folded, aliases) for field, aliases in FIELD_ALIASES.items()}
+
+    for field in AMOUNT_FIELDS:
+        record[field] = parse_amount(record[field])
+    for field in DATE_FIELDS:
+        record[field] = parse_date(record[field])
+    if record['vendor'] is not None:
+        record['vendor'] = str(record['vendor']).strip()
+    if record['invoice_number'] is not None:
+        record['invoice_number'] = str(record['invoice_number']).strip()
+
+    line_items = _first(folded, LINE_ITEM_KEYS) or []
+    amounts = []
+    for item in line_items if isinstance(line_items, list) else []:
+        amount = parse_amount(_first(_folded(item), LINE_AMOUNT_KEYS))
+        if amount is not None:
+            amounts.append(amount)
+    record['line_item_amounts'] = amounts
+
+    bank = _folded(_first(folded, BANK_DETAIL_KEYS)) or folded
+    for field, aliases in BANK_ALIASES.items():
+        value = _first(bank, aliases)
+        record[field] = str(value).strip() if value is not None else None
+
+    return record
@@ -0,0 +1,96 @@
+import os
+import time
+import hashlib
+import threading
+
+from botocore.exceptions import ClientError
+
+UPLOAD_PREFIX = "datasets/documents"
+APPLICATION_PREFIX = "applications"
+RESULT_PREFIX = "bda-result"
+RAW_RESULT_PREFIX = "bda-result-raw"
+APPLICATION_ID_PREFIX = "ML_"
+# Hex characters of the hash shard that follows each prefix, giving 256 prefixes S3 can
+# partition independently; every key moves if it changes, so it is not configurable
+SHARD_CHARS = 2
+
+_CROCKFORD = '0123456789ABCDEFGHJKMNPQRSTVWXYZ'
+_RANDOM_MASK = (1 << 80) - 1
+_ulid_lock = threading.Lock()
+_last_ulid = [0, 0]
+
+
+def new_ulid(clock=time.time):
+    """
+    26-character ULID: a 48-bit millisecond timestamp then 80 random bits, in Crockford
+    base32. IDs sort by creation time; within one millisecond the random part is
+    incremented, so IDs from the same process never repeat and stay ordered.
+    """
+    with _ulid_lock:
+        millis = int(clock() * 1000)
+        if millis <= _last_ulid[0]:
+            millis, randomness = _last_ulid[0], (_last_ulid[1] + 1) & _RANDOM_MASK
+        else:
+            randomness = int.from_bytes(os.urandom(10), 'big')
+        _last_ulid[:] = [millis, randomness]
+    value = (millis << 80) | randomness
+    return ''.join(_CROCKFORD[(value >> shift) & 31] for shift in range(125, -1, -5))
+
+
+def new_application_id():
+    return f"{APPLICATION_ID_PREFIX}{new_ulid()}"
+
+
+def shard(name):
+    """
+    Hash shard of a key's file name; readers that only know the name can compute it too
+    """
+    return hashlib.sha1(name.split('/')[-1].encode('utf-8')).hexdigest()[:SHARD_CHARS]
+
+
+def application_key(application_id):
+    return f"{APPLICATION_PREFIX}/{shard(application_id)}/{application_id}.json"
+
+
+def application_keys(application_id):
+    """
+    Keys an application may be stored under, current layout first
+    """
+    return [application_key(application_id), f"{APPLICATION_PREFIX}/{application_id}.json"]
+
+
+def document_name(upload_key):
+    """
+    Result name of an upload: its path under datasets/documents without the extension, '_' as '-'
+    """
+    name = upload_key[len(UPLOAD_PREFIX) + 1:] if upload_key.startswith(f"{UPLOAD_PREFIX}/") else upload_key
+    return name.split('.')[0].replace('_', '-')
+
+
+def result_key(name):
+    return f"{RESULT_PREFIX}/{shard(name)}/{name}-result.json"
+
+
+def result_keys(name):
+    """
+    Keys a processed result may be stored under, current layout first
+    """
+    return [result_key(name), f"{RESULT_PREFIX}/{name}-result.json"]
+
+
+def raw_result_prefix(name):
+    return f"{RAW_RESULT_PREFIX}/{shard(name)}/{name}"
+
+
+def read_first(keys, read):
+    """
+    Call read(key) on each candidate key in turn and return (key, value) for the first
+    one that exists; a missing last candidate raises as read() does
+    """
+    for key in keys[:-1]:
+        try:
+            return key, read(key)
+        except ClientError as e:
+            if e.response['Error']['Code'] not in ('NoSuchKey', '404'):
+                raise
+    return keys[-1], read(keys[-1])
@@ -0,0 +1,31 @@
+import os
+import json
+import time
+
+METRICS_NAMESPACE = os.environ.get('METRICS_NAMESPACE', 'InvoiceAssistant')
+FUNCTION_NAME = os.environ.get('AWS_LAMBDA_FUNCTION_NAME', 'local')
+
+
+def emit_metrics(metrics, units=None, dimensions=None, properties=None, namespace=METRICS_NAMESPACE):
+    """
+    Print metrics in CloudWatch Embedded Metric Format.
+
+    Lambda ships stdout to CloudWatch Logs, which extracts EMF lines into
+    metrics without any API calls from the function.
+    """
+    dimensions = {'FunctionName': FUNCTION_NAME, **(dimensions or {})}
+    units = units or {}
+    record = {
+        '_aws': {
+            'Timestamp': int(time.time() * 1000),
+            'CloudWatchMetrics': [{
+                'Namespace': namespace,
+                'Dimensions': [list(dimensions)],
+                'Metrics': [{'Name': name, 'Unit': units.get(name, 'Count')} for name in metrics],
+            }],
+        },
+        **dimensions,
+        **(properties or {}),
+        **metrics,
+    }
+    print(json.dumps(record, default=str))
@@ -0,0 +1,48 @@
+import ijson
+from ijson.common import ObjectBuilder
+
+# The parts of a BDA custom_output result that are kept; explainability_info and
+# page geometry, usually most of the file, are skipped without being parsed into objects
+RESULT_FIELDS = ('matched_blueprint', 'document_class', 'inference_result')
+# Processed results written by process_bda_output / process_large_document
+PROCESSED_RESULT_FIELDS = RESULT_FIELDS + ('documents', 'pages', 'failed_pages', 'pre_classification', 'status', 'reason')
+READ_CHUNK_BYTES = 64 * 1024
+
+
+def read_fields(stream, fields=RESULT_FIELDS):
+    """
+    Incrementally parse a JSON object from a file-like stream (such as an S3
+    StreamingBody) and return {field: value} for the wanted top-level fields.
+
+    Only the wanted values are built; everything else passes through the parser
+    as events, so peak memory is one read chunk plus the kept fields. Reading
+    stops as soon as every wanted field has been seen.
+    """
+    wanted = set(fields)
+    found = {}
+    builder = None
+    current = None
+    for prefix, event, value in ijson.parse(stream, buf_size=READ_CHUNK_BYTES, use_float=True):
+        if prefix == '' and event in ('map_key', 'end_map'):
+            if current is not None:
+                found[current] = builder.value
+                current = None
+                if len(found) == len(wanted):
+                    break
+            if event == 'map_key' and value in wanted:
+                builder = ObjectBuilder()
+                current = value
+        elif current is not None:
+            builder.event(event, value)
+    return found
+
+
+def read_s3_fields(s3_client, bucket, key, fields=RESULT_FIELDS):
+    """
+    Stream an S3 JSON object and return only the wanted top-level fields
+    """
+    body = s3_client.get_object(Bucket=bucket, Key=key)['Body']
+    try:
+        return read_fields(body, fields)
+    finally:
+        body.close()
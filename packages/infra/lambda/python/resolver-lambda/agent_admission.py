@@ -0,0 +1,486 @@
+import os
+import time
+import uuid
+import random
+import threading
+
+import boto3
+from botocore.exceptions import ClientError
+from aws_lambda_powertools.logging import Logger
+from aws_lambda_powertools.metrics import MetricUnit, single_metric
+
+logger = Logger(child=True)
+
+METRICS_NAMESPACE = os.environ.get('POWERTOOLS_METRICS_NAMESPACE', 'InvoiceAssistant')
+# Shared across Lambda instances; without it every warm instance enforces the limits on its own
+ADMISSION_TABLE_NAME = os.environ.get('AGENT_ADMISSION_TABLE', '')
+# Sustained rate and burst of invoke_agent calls per agent alias
+RATE_PER_SECOND = float(os.environ.get('AGENT_RATE_PER_SECOND', '2'))
+BURST = int(os.environ.get('AGENT_BURST', '5'))
+MAX_CONCURRENCY = int(os.environ.get('AGENT_MAX_CONCURRENCY', '4'))
+# A request waits at most this long for a token or a slot before failing fast
+MAX_QUEUE_SECONDS = float(os.environ.get('AGENT_MAX_QUEUE_SECONDS', '10'))
+# The breaker opens after this many throttles within the window and stays open for the cooldown
+BREAKER_THRESHOLD = int(os.environ.get('AGENT_BREAKER_THRESHOLD', '5'))
+BREAKER_WINDOW_SECONDS = float(os.environ.get('AGENT_BREAKER_WINDOW_SECONDS', '30'))
+BREAKER_COOLDOWN_SECONDS = float(os.environ.get('AGENT_BREAKER_COOLDOWN_SECONDS', '30'))
+# A concurrency slot held by an instance that died is freed after this long
+SLOT_LEASE_SECONDS = int(os.environ.get('AGENT_SLOT_LEASE_SECONDS', '300'))
+SLOT_POLL_SECONDS = 0.25
+THROTTLING_CODES = {
+    'throttlingexception', 'throttling', 'toomanyrequestsexception', 'servicequotaexceededexception',
+    'serviceunavailableexception', 'requestlimitexceeded',
+}
+
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half-open'
+
+
+class AgentUnavailable(Exception):
+    """
+    The agent call was refused without being sent; retry_after is a hint in seconds
+    """
+
+    def __init__(self, reason, retry_after):
+        super().__init__(f"{reason}; retry in {int(retry_after) + 1}s")
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+def is_throttling(error):
+    """
+    Throttling raised by the invoke call itself or mid-stream from the completion event stream
+    """
+    if isinstance(error, ClientError):
+        return error.response.get('Error', {}).get('Code', '').lower() in THROTTLING_CODES
+    return False
+
+
+class TokenBucket:
+    """
+    Classic token bucket; reserve() returns how long the caller must wait for its token
+    """
+
+    def __init__(self, rate, burst, clock=time.monotonic):
+        self.rate = rate
+        self.burst = burst
+        self.clock = clock
+        self.tokens = float(burst)
+        self.updated = clock()
+
+    def _refill(self):
+        now = self.clock()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def reserve(self, max_wait):
+        """
+        Take a token, possibly borrowed against the future; None when the wait would exceed max_wait
+        """
+        self._refill()
+        wait = max(0.0, (1 - self.tokens) / self.rate)
+        if wait > max_wait:
+            return None
+        self.tokens -= 1
+        return wait
+
+    def drain(self):
+        # After a throttle, new calls have to wait for the bucket to refill
+        self._refill()
+        self.tokens = min(self.tokens, 0.0)
+
+
+class CircuitBreaker:
+    """
+    Opens after BREAKER_THRESHOLD throttles within the window, then lets a single probe through after the cooldown
+    """
+
+    def __init__(self, threshold=BREAKER_THRESHOLD, window=BREAKER_WINDOW_SECONDS, cooldown=BREAKER_COOLDOWN_SECONDS,
+                 clock=time.monotonic):
+        self.threshold = threshold
+        self.window = window
+        self.cooldown = cooldown
+        self.clock = clock
+        self.state = CLOSED
+        self.throttles = []
+        self.opened_at = 0.0
+        self.probing = False
+
+    def before_call(self):
+        """
+        Return None when the call may proceed, or the seconds until the breaker allows a probe
+        """
+        if self.state == OPEN:
+            remaining = self.opened_at + self.cooldown - self.clock()
+            if remaining > 0:
+                return remaining
+            self.state = HALF_OPEN
+        if self.state == HALF_OPEN:
+            if self.probing:
+                return self.cooldown
+            self.probing = True
+        return None
+
+    def record_success(self):
+        if self.state != CLOSED:
+            logger.info("Agent circuit breaker closed")
+        self.state = CLOSED
+        self.probing = False
+        self.throttles = []
+
+    def record_throttle(self):
+        now = self.clock()
+        self.throttles = [t for t in self.throttles if now - t < self.window] + [now]
+        if self.state == HALF_OPEN or len(self.throttles) >= self.threshold:
+            if self.state != OPEN:
+                logger.warning(f"Agent circuit breaker opened after {len(self.throttles)} throttles")
+            self.state = OPEN
+            self.opened_at = now
+            self.probing = False
+
+    def record_failure(self):
+        # Non-throttling errors say nothing about capacity; just release a probe slot
+        self.probing = False
+
+
+def _millis(seconds):
+    # DynamoDB numbers must not be floats; times are stored as epoch milliseconds
+    return int(seconds * 1000)
+
+
+def _conditional_failure(error):
+    return error.response['Error']['Code'] == 'ConditionalCheckFailedException'
+
+
+class SharedTokenBucket:
+    """
+    Token bucket shared through DynamoDB, approximated by fixed windows of burst / rate
+    seconds that each admit burst calls. A call that does not fit the current window
+    reserves a place in a later one, like borrowing a token against the future.
+    """
+
+    def __init__(self, table, key, rate, burst, clock=time.time):
+        self.table = table
+        self.key = key
+        self.burst = burst
+        self.rate = rate
+        self.window = max(burst / rate, 1.0)
+        self.clock = clock
+        self.tokens = float(burst)
+
+    def _window_key(self, start):
+        return f"{self.key}#rate#{int(start * 1000)}"
+
+    def reserve(self, max_wait):
+        now = self.clock()
+        start = now - now % self.window
+        while start - now <= max_wait:
+            try:
+                self.table.update_item(
+                    Key={'limit_key': self._window_key(start)},
+                    UpdateExpression='ADD calls :one SET expires_at = :expires',
+                    ConditionExpression='attribute_not_exists(calls) OR calls < :burst',
+                    ExpressionAttributeValues={':one': 1, ':burst': self.burst,
+                                               ':expires': int(start + self.window + 60)}
+                )
+                return max(0.0, start - now)
+            except ClientError as e:
+                if not _conditional_failure(e):
+                    logger.warning(f"Shared rate limit unavailable, admitting call: {str(e)}")
+                    return 0.0
+            start += self.window
+        # Reported as the wait for a token when the call is rejected
+        self.tokens = 1 - (start - now) * self.rate
+        return None
+
+    def drain(self):
+        # After a throttle, every instance has to wait for the next window
+        now = self.clock()
+        try:
+            self.table.update_item(
+                Key={'limit_key': self._window_key(now - now % self.window)},
+                UpdateExpression='SET calls = :burst, expires_at = :expires',
+                ExpressionAttributeValues={':burst': self.burst, ':expires': int(now + self.window + 60)}
+            )
+        except ClientError as e:
+            logger.warning(f"Could not drain shared rate limit: {str(e)}")
+
+
+class SharedCircuitBreaker:
+    """
+    Circuit breaker shared through DynamoDB: throttles are counted per window, the open
+    breaker is one item with its reopening time, and a conditional write lets exactly
+    one instance send the half-open probe.
+    """
+
+    def __init__(self, table, key, threshold=BREAKER_THRESHOLD, window=BREAKER_WINDOW_SECONDS,
+                 cooldown=BREAKER_COOLDOWN_SECONDS, clock=time.time):
+        self.table = table
+        self.key = f"{key}#breaker"
+        self.threshold = threshold
+        self.window = window
+        self.cooldown = cooldown
+        self.clock = clock
+        self.probing = False
+
+    @property
+    def state(self):
+        return HALF_OPEN if self.probing else CLOSED
+
+    def before_call(self):
+        now = self.clock()
+        try:
+            item = self.table.get_item(Key={'limit_key': self.key}, ConsistentRead=True).get('Item')
+        except ClientError as e:
+            logger.warning(f"Shared circuit breaker unavailable, admitting call: {str(e)}")
+            return None
+        if not item:
+            return None
+        remaining = int(item['opened_until']) / 1000 - now
+        if remaining > 0:
+            return remaining
+        try:
+            self.table.update_item(
+                Key={'limit_key': self.key},
+                UpdateExpression='SET probe_until = :until',
+                ConditionExpression='attribute_exists(opened_until) AND '
+                                    '(attribute_not_exists(probe_until) OR probe_until < :now)',
+                ExpressionAttributeValues={':until': _millis(now + self.cooldown), ':now': _millis(now)}
+            )
+        except ClientError as e:
+            if _conditional_failure(e):
+                return self.cooldown
+            logger.warning(f"Shared circuit breaker unavailable, admitting call: {str(e)}")
+            return None
+        self.probing = True
+        return None
+
+    def _open(self, throttles):
+        now = self.clock()
+        logger.warning(f"Agent circuit breaker opened after {throttles} throttles")
+        try:
+            self.table.put_item(Item={'limit_key': self.key, 'opened_until': _millis(now + self.cooldown),
+                                      'expires_at': int(now + self.cooldown + 3600)})
+        except ClientError as e:
+            logger.warning(f"Could not open shared circuit breaker: {str(e)}")
+
+    def record_success(self):
+        if not self.probing:
+            return
+        self.probing = False
+        logger.info("Agent circuit breaker closed")
+        try:
+            self.table.delete_item(Key={'limit_key': self.key})
+        except ClientError as e:
+            logger.warning(f"Could not close shared circuit breaker: {str(e)}")
+
+    def record_throttle(self):
+        if self.probing:
+            self.probing = False
+            self._open('probe')
+            return
+        now = self.clock()
+        start = now - now % self.window
+        try:
+            throttles = self.table.update_item(
+                Key={'limit_key': f"{self.key}#throttles#{int(start)}"},
+                UpdateExpression='ADD throttles :one SET expires_at = :expires',
+                ExpressionAttributeValues={':one': 1, ':expires': int(start + self.window + 60)},
+                ReturnValues='UPDATED_NEW'
+            )['Attributes']['throttles']
+        except ClientError as e:
+            logger.warning(f"Could not count throttle: {str(e)}")
+            return
+        if throttles >= self.threshold:
+            self._open(throttles)
+
+    def record_failure(self):
+        if not self.probing:
+            return
+        self.probing = False
+        try:
+            self.table.update_item(Key={'limit_key': self.key}, UpdateExpression='REMOVE probe_until',
+                                   ConditionExpression='attribute_exists(opened_until)')
+        except ClientError as e:
+            if not _conditional_failure(e):
+                logger.warning(f"Could not release circuit breaker probe: {str(e)}")
+
+
+class SharedSlots:
+    """
+    Concurrency limit shared through DynamoDB: max_concurrency slot items per alias, each
+    held under a lease so a slot taken by an instance that died is freed when it expires.
+    """
+
+    def __init__(self, table, key, max_concurrency, lease_seconds=SLOT_LEASE_SECONDS, clock=time.time,
+                 sleep=time.sleep):
+        self.table = table
+        self.key = key
+        self.max_concurrency = max_concurrency
+        self.lease_seconds = lease_seconds
+        self.clock = clock
+        self.sleep = sleep
+        self.held = None
+
+    def _take(self, slot, owner):
+        now = self.clock()
+        try:
+            self.table.put_item(
+                Item={'limit_key': f"{self.key}#slot#{slot}", 'owner': owner,
+                      'lease_until': _millis(now + self.lease_seconds), 'expires_at': int(now + self.lease_seconds + 60)},
+                ConditionExpression='attribute_not_exists(lease_until) OR lease_until < :now',
+                ExpressionAttributeValues={':now': _millis(now)}
+            )
+            return True
+        except ClientError as e:
+            if _conditional_failure(e):
+                return False
+            raise
+
+    def acquire(self, timeout):
+        owner = uuid.uuid4().hex
+        deadline = self.clock() + timeout
+        while True:
+            try:
+                for slot in random.sample(range(self.max_concurrency), self.max_concurrency):
+                    if self._take(slot, owner):
+                        self.held = (slot, owner)
+                        return True
+            except ClientError as e:
+                logger.warning(f"Shared concurrency limit unavailable, admitting call: {str(e)}")
+                self.held = None
+                return True
+            remaining = deadline - self.clock()
+            if remaining <= 0:
+                return False
+            self.sleep(min(SLOT_POLL_SECONDS, remaining))
+
+    def release(self):
+        if self.held is None:
+            return
+        slot, owner = self.held
+        self.held = None
+        try:
+            self.table.delete_item(Key={'limit_key': f"{self.key}#slot#{slot}"},
+                                   ConditionExpression='#owner = :owner',
+                                   ExpressionAttributeNames={'#owner': 'owner'},
+                                   ExpressionAttributeValues={':owner': owner})
+        except ClientError as e:
+            if not _conditional_failure(e):
+                logger.warning(f"Could not release concurrency slot: {str(e)}")
+
+
+class AdmissionController:
+    """
+    Admission control for invoke_agent: a token bucket and circuit breaker per agent
+    alias plus a concurrency limit. Calls wait at most max_queue_seconds and
+    otherwise fail fast with AgentUnavailable instead of piling onto a throttled service.
+
+    With a table the limits hold across all resolver instances; without one they are
+    kept in memory and apply to each instance separately.
+    """
+
+    def __init__(self, rate=RATE_PER_SECOND, burst=BURST, max_concurrency=MAX_CONCURRENCY,
+                 max_queue_seconds=MAX_QUEUE_SECONDS, clock=time.monotonic, sleep=time.sleep, emit=True, table=None):
+        self.rate = rate
+        self.burst = burst
+        self.max_concurrency = max_concurrency
+        self.max_queue_seconds = max_queue_seconds
+        self.clock = clock
+        self.sleep = sleep
+        self.emit = emit
+        self.table = table
+        self.local_slots = threading.BoundedSemaphore(max_concurrency)
+        self.lock = threading.Lock()
+        self.buckets = {}
+        self.breakers = {}
+        self.slots = {}
+
+    def _limits(self, alias_key):
+        if alias_key not in self.buckets:
+            if self.table is not None:
+                self.buckets[alias_key] = SharedTokenBucket(self.table, alias_key, self.rate, self.burst)
+                self.breakers[alias_key] = SharedCircuitBreaker(self.table, alias_key)
+                self.slots[alias_key] = SharedSlots(self.table, alias_key, self.max_concurrency, sleep=self.sleep)
+            else:
+                self.buckets[alias_key] = TokenBucket(self.rate, self.burst, self.clock)
+                self.breakers[alias_key] = CircuitBreaker(clock=self.clock)
+                self.slots[alias_key] = self.local_slots
+        return self.buckets[alias_key], self.breakers[alias_key], self.slots[alias_key]
+
+    def _metric(self, name, value, unit, alias_key):
+        if not self.emit:
+            return
+        with single_metric(name=name, unit=unit, value=value, namespace=METRICS_NAMESPACE) as metric:
+            metric.add_dimension(name='AgentAlias', value=alias_key)
+
+    def _reject(self, alias_key, reason, retry_after):
+        self._metric('AgentCallsRejected', 1, MetricUnit.Count, alias_key)
+        raise AgentUnavailable(reason, retry_after)
+
+    def call(self, alias_key, invoke):
+        """
+        Run invoke() under admission control and return its result
+        """
+        start = self.clock()
+        with self.lock:
+            bucket, breaker, slots = self._limits(alias_key)
+            retry_after = breaker.before_call()
+            if retry_after is not None:
+                self._reject(alias_key, 'Agent is being throttled', retry_after)
+            wait = bucket.reserve(self.max_queue_seconds)
+            if wait is None:
+                breaker.record_failure()
+                self._reject(alias_key, 'Agent request rate exceeded', (1 - bucket.tokens) / bucket.rate)
+        if wait:
+            self.sleep(wait)
+        remaining = self.max_queue_seconds - (self.clock() - start)
+        if not slots.acquire(timeout=max(remaining, 0)):
+            with self.lock:
+                breaker.record_failure()
+            self._reject(alias_key, 'Too many agent requests in progress', 1)
+        self._metric('AgentQueueTime', round((self.clock() - start) * 1000, 1), MetricUnit.Milliseconds, alias_key)
+
+        try:
+            result = invoke()
+        except Exception as e:
+            with self.lock:
+                if is_throttling(e):
+                    bucket.drain()
+                    breaker.record_throttle()
+                else:
+                    breaker.record_failure()
+            if is_throttling(e):
+                self._metric('AgentThrottles', 1, MetricUnit.Count, alias_key)
+                raise AgentUnavailable('Agent is being throttled', bucket.burst / bucket.rate) from e
+            raise
+        finally:
+            slots.release()
+        with self.lock:
+            breaker.record_success()
+        return result
+
+
+def create_admission_controller():
+    table = boto3.resource('dynamodb').Table(ADMISSION_TABLE_NAME) if ADMISSION_TABLE_NAME else None
+    return AdmissionController(table=table)
+
+
+if __name__ == '__main__':
+    # Simulate sustained throttling on a fake clock: python agent_admission.py
+    now = [0.0]
+    controller = AdmissionController(clock=lambda: now[0], sleep=lambda s: now.__setitem__(0, now[0] + s), emit=False)
+    throttle = ClientError({'Error': {'Code': 'throttlingException', 'Message': 'Rate exceeded'}}, 'InvokeAgent')
+
+    def throttled():
+        raise throttle
+
+    for attempt in range(12):
+        try:
+            controller.call('alias', throttled if attempt < 7 else (lambda: 'ok'))
+            outcome = 'ok'
+        except AgentUnavailable as e:
+            outcome = str(e)
+        print(f"t={now[0]:5.1f}s attempt {attempt}: {outcome} (breaker {controller.breakers['alias'].state})")
+        now[0] += 5 if attempt >= 5 else 0.1
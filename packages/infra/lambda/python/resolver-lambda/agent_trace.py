@@ -0,0 +1,159 @@
+import os
+import time
+import random
+from datetime import datetime
+
+from aws_lambda_powertools.logging import Logger
+from aws_lambda_powertools.metrics import EphemeralMetrics, MetricUnit
+
+logger = Logger(child=True)
+
+METRICS_NAMESPACE = os.environ.get('POWERTOOLS_METRICS_NAMESPACE', 'InvoiceAssistant')
+# Share of agent turns invoked with enableTrace; tracing adds stream volume, not latency
+TRACE_SAMPLE_RATE = float(os.environ.get('AGENT_TRACE_SAMPLE_RATE', '0.05'))
+# Trace parts that carry a model call and tool invocations in the same shape
+MODEL_TRACE_PARTS = ('orchestrationTrace', 'routingClassifierTrace', 'preProcessingTrace', 'postProcessingTrace')
+CALL_STAGES = {
+    'ACTION_GROUP': 'action_group',
+    'AGENT_COLLABORATOR': 'collaborator',
+    'KNOWLEDGE_BASE': 'knowledge_base',
+}
+
+
+def should_trace(requested=False, sample_rate=TRACE_SAMPLE_RATE):
+    """
+    Trace when the caller asked for it, otherwise for a random sample of turns
+    """
+    return bool(requested) or random.random() < sample_rate
+
+
+def _call_name(stage, invocation):
+    if stage == 'action_group':
+        call = invocation.get('actionGroupInvocationInput', {})
+        return '/'.join(filter(None, [call.get('actionGroupName'), call.get('function') or call.get('apiPath')]))
+    if stage == 'collaborator':
+        return invocation.get('agentCollaboratorInvocationInput', {}).get('agentCollaboratorName')
+    return invocation.get('knowledgeBaseLookupInput', {}).get('knowledgeBaseId')
+
+
+def _call_metadata(observation):
+    for field in ('actionGroupInvocationOutput', 'agentCollaboratorInvocationOutput', 'knowledgeBaseLookupOutput'):
+        if field in observation:
+            return observation[field].get('metadata', {})
+    return {}
+
+
+class AgentTrace:
+    """
+    Folds the trace events of one invoke_agent turn into a compact timeline.
+
+    Stage durations use the service's totalTimeMs when the trace carries it,
+    otherwise the gap between the start and end events (eventTime, or arrival
+    time when that is missing).
+    """
+
+    def __init__(self, operation, clock=time.time):
+        self.operation = operation
+        self.clock = clock
+        self.started = clock()
+        self.steps = []
+        self.pending = {}
+        self.failure = None
+
+    def _now(self, event):
+        event_time = event.get('eventTime')
+        return event_time.timestamp() if isinstance(event_time, datetime) else self.clock()
+
+    def _open(self, key, now, **step):
+        self.pending[key] = (now, step)
+
+    def _close(self, key, now, metadata=None, **fields):
+        opened, step = self.pending.pop(key, (None, {}))
+        if opened is None:
+            return
+        elapsed = (metadata or {}).get('totalTimeMs')
+        step.update(fields)
+        step['start_ms'] = round((opened - self.started) * 1000, 1)
+        step['ms'] = round(elapsed if elapsed is not None else (now - opened) * 1000, 1)
+        self.steps.append({k: v for k, v in step.items() if v is not None})
+
+    def add(self, event):
+        """
+        Record one 'trace' event from the completion stream
+        """
+        now = self._now(event)
+        agent = event.get('collaboratorName')
+        for part, body in event.get('trace', {}).items():
+            if part == 'failureTrace':
+                self.failure = body.get('failureReason')
+            elif part == 'guardrailTrace':
+                step = {'stage': 'guardrail', 'agent': agent, 'action': body.get('action'),
+                        'start_ms': round((now - self.started) * 1000, 1),
+                        'ms': body.get('metadata', {}).get('totalTimeMs')}
+                self.steps.append({k: v for k, v in step.items() if v is not None})
+            elif part in MODEL_TRACE_PARTS:
+                self._model_trace(part, body, agent, now)
+
+    def _model_trace(self, part, body, agent, now):
+        phase = part[:-len('Trace')]
+        if 'modelInvocationInput' in body:
+            trace_id = body['modelInvocationInput'].get('traceId')
+            self._open(('model', trace_id), now, stage='model', phase=phase, agent=agent)
+        if 'modelInvocationOutput' in body:
+            output = body['modelInvocationOutput']
+            metadata = output.get('metadata', {})
+            usage = metadata.get('usage', {})
+            self._close(('model', output.get('traceId')), now, metadata,
+                        input_tokens=usage.get('inputTokens'), output_tokens=usage.get('outputTokens'))
+        if 'invocationInput' in body:
+            invocation = body['invocationInput']
+            stage = CALL_STAGES.get(invocation.get('invocationType'))
+            if stage:
+                self._open(('call', invocation.get('traceId')), now, stage=stage, agent=agent,
+                           name=_call_name(stage, invocation))
+        if 'observation' in body:
+            observation = body['observation']
+            if observation.get('type') in CALL_STAGES:
+                self._close(('call', observation.get('traceId')), now, _call_metadata(observation))
+
+    def timeline(self):
+        """
+        Per-turn summary plus the ordered steps; 'other_ms' is supervisor time outside model and tool calls
+        """
+        turn_ms = round((self.clock() - self.started) * 1000, 1)
+        by_stage = {}
+        for step in self.steps:
+            by_stage[step['stage']] = round(by_stage.get(step['stage'], 0) + (step.get('ms') or 0), 1)
+        top_level = sum(step.get('ms') or 0 for step in self.steps if 'agent' not in step)
+        return {
+            'operation': self.operation,
+            'turn_ms': turn_ms,
+            'stage_ms': by_stage,
+            'other_ms': round(max(turn_ms - top_level, 0), 1),
+            'model_calls': sum(1 for step in self.steps if step['stage'] == 'model'),
+            'tool_calls': sum(1 for step in self.steps if step['stage'] in CALL_STAGES.values()),
+            'input_tokens': sum(step.get('input_tokens', 0) for step in self.steps),
+            'output_tokens': sum(step.get('output_tokens', 0) for step in self.steps),
+            'failure': self.failure,
+            'steps': sorted(self.steps, key=lambda step: step.get('start_ms', 0)),
+        }
+
+    def publish(self, agent_alias_id):
+        """
+        Log the timeline and emit its totals as metrics; returns the timeline
+        """
+        timeline = self.timeline()
+        logger.info("Agent trace timeline", extra={'agent_trace': timeline})
+        metrics = EphemeralMetrics(namespace=METRICS_NAMESPACE)
+        metrics.add_dimension(name='AgentAlias', value=agent_alias_id or 'unknown')
+        metrics.add_dimension(name='Operation', value=self.operation)
+        metrics.add_metric(name='AgentTurnTime', unit=MetricUnit.Milliseconds, value=timeline['turn_ms'])
+        metrics.add_metric(name='AgentOrchestrationOverhead', unit=MetricUnit.Milliseconds, value=timeline['other_ms'])
+        for stage, ms in timeline['stage_ms'].items():
+            metrics.add_metric(name=f"Agent{stage.title().replace('_', '')}Time", unit=MetricUnit.Milliseconds, value=ms)
+        metrics.add_metric(name='AgentModelCalls', unit=MetricUnit.Count, value=timeline['model_calls'])
+        metrics.add_metric(name='AgentToolCalls', unit=MetricUnit.Count, value=timeline['tool_calls'])
+        metrics.add_metric(name='AgentInputTokens', unit=MetricUnit.Count, value=timeline['input_tokens'])
+        metrics.add_metric(name='AgentOutputTokens', unit=MetricUnit.Count, value=timeline['output_tokens'])
+        metrics.flush_metrics()
+        return timeline
@@ -0,0 +1,232 @@
+import os
+import re
+import json
+import time
+import uuid
+import hashlib
+
+import boto3
+from botocore.exceptions import ClientError
+from aws_lambda_powertools.logging import Logger
+
+from response_cache import MemoryStore
+
+logger = Logger(child=True)
+
+# Shared across Lambda instances; without it each warm instance rotates sessions on its own
+SESSION_TABLE_NAME = os.environ.get('CHAT_SESSION_TABLE', '')
+# The agent replays the whole session history every turn, so a session is closed after this
+# many turns and the next one starts from a summary instead
+MAX_SESSION_TURNS = int(os.environ.get('CHAT_MAX_SESSION_TURNS', '8'))
+# Should not exceed the agent's idleSessionTTLInSeconds (600 by default): past it the agent
+# has already dropped the history and only the summary can carry the conversation over
+SESSION_IDLE_SECONDS = int(os.environ.get('CHAT_SESSION_IDLE_SECONDS', '600'))
+# Budget of the summary sent with every turn, and of each turn's share of it
+MAX_SUMMARY_CHARS = int(os.environ.get('CHAT_MAX_SUMMARY_CHARS', '1500'))
+MAX_TURN_CHARS = int(os.environ.get('CHAT_MAX_TURN_CHARS', '240'))
+# Longer messages are cut so a single turn cannot blow up the agent's input
+MAX_MESSAGE_CHARS = int(os.environ.get('CHAT_MAX_MESSAGE_CHARS', '6000'))
+MAX_DOCUMENTS = 10
+# Conversation state is forgotten after a week without activity
+STATE_TTL_SECONDS = 7 * 24 * 3600
+SUMMARY_ATTRIBUTE = 'conversation_summary'
+
+_WHITESPACE = re.compile(r'\s+')
+_SENTENCE_END = re.compile(r'(?<=[.!?])\s')
+_MARKUP = re.compile(r'<[^>]+>|[*_`#|]+')
+_OMITTED = re.compile(r'\((\d+) earlier turns omitted\)')
+
+
+def _clip(text, limit):
+    text = _WHITESPACE.sub(' ', _MARKUP.sub(' ', text or '')).strip()
+    return text if len(text) <= limit else text[:limit - 3].rstrip() + '...'
+
+
+def clip_message(message, limit=MAX_MESSAGE_CHARS):
+    """
+    The message cut to the per-turn budget; returns (message, clipped)
+    """
+    if len(message) <= limit:
+        return message, False
+    return message[:limit - 15].rstrip() + ' [message cut]', True
+
+
+def input_digest(agent_input):
+    return hashlib.sha256(json.dumps(agent_input, sort_keys=True, default=str).encode('utf-8')).hexdigest()
+
+
+def turn_digest(human, bot):
+    """
+    One line per turn: the user's words and the first sentences of the answer
+    """
+    share = max(MAX_TURN_CHARS // 2, 40)
+    question = _clip(human, share)
+    answer = _clip(' '.join(_SENTENCE_END.split(_WHITESPACE.sub(' ', bot or '').strip())[:2]), MAX_TURN_CHARS - len(question))
+    return f"user: {question} / assistant: {answer}"
+
+
+def fold_summary(lines, limit=MAX_SUMMARY_CHARS):
+    """
+    Keep the most recent turn lines that fit the budget; older ones are counted, not kept
+    """
+    omitted = 0
+    for line in lines:
+        marker = _OMITTED.fullmatch(line)
+        if marker:
+            omitted += int(marker.group(1))
+    lines = [line for line in lines if not _OMITTED.fullmatch(line)]
+    kept, size = [], 0
+    for line in reversed(lines):
+        if size + len(line) + 1 > limit:
+            break
+        kept.append(line)
+        size += len(line) + 1
+    kept.reverse()
+    omitted += len(lines) - len(kept)
+    return ([f"({omitted} earlier turns omitted)"] if omitted else []) + kept
+
+
+class ChatSession:
+    """
+    Conversation state of one user: the agent session in use and what earlier sessions covered
+    """
+
+    def __init__(self, state, rotated=None):
+        self.state = state
+        self.rotated = rotated
+        self.cached_as = None
+
+    @property
+    def session_id(self):
+        return self.state['session_id']
+
+    @property
+    def turn(self):
+        return self.state['turns'] + 1
+
+    def cache_turn(self, agent_input):
+        """
+        Turn a chat answer is cached under: input identical to the last recorded turn's is a
+        resubmission and shares its entry, anything else belongs to the next turn
+        """
+        digest = input_digest(agent_input)
+        if self.state.get('last_input') == digest:
+            turn = self.state['last_cache_turn']
+        else:
+            turn = self.turn
+        self.cached_as = (digest, turn)
+        return turn
+
+    def prompt_attributes(self):
+        """
+        promptSessionAttributes carrying earlier sessions into the current one
+        """
+        summary = self.state.get('summary') or []
+        return {SUMMARY_ATTRIBUTE: '\n'.join(summary)} if summary else {}
+
+    def documents(self):
+        return self.state.get('documents') or []
+
+    def describe(self):
+        return {'session_id': self.session_id, 'turn': self.turn, 'rotated': self.rotated}
+
+
+class DynamoDBSessionStore:
+    """
+    Session state on a DynamoDB table keyed by user_id, with TTL on expires_at.
+    Failures are logged and fall back to a fresh session so chat never fails on them.
+    """
+
+    def __init__(self, table_name):
+        self.table = boto3.resource('dynamodb').Table(table_name)
+
+    def get(self, key):
+        try:
+            item = self.table.get_item(Key={'user_id': key}).get('Item')
+        except ClientError as e:
+            logger.warning(f"Chat session read failed: {str(e)}")
+            return None
+        if not item or int(item['expires_at']) <= time.time():
+            return None
+        state = {**item, 'turns': int(item['turns']), 'last_active': int(item['last_active']),
+                 'expires_at': int(item['expires_at'])}
+        if 'last_cache_turn' in item:
+            state['last_cache_turn'] = int(item['last_cache_turn'])
+        return state
+
+    def put(self, key, state):
+        try:
+            self.table.put_item(Item={**state, 'user_id': key})
+        except ClientError as e:
+            logger.warning(f"Chat session write failed: {str(e)}")
+
+
+class SessionManager:
+    """
+    Rotates a user's agent session after MAX_SESSION_TURNS turns or SESSION_IDLE_SECONDS
+    of inactivity, so the history the agent replays stays bounded. Turns of closed sessions
+    are carried forward as a rolling summary of at most MAX_SUMMARY_CHARS.
+    """
+
+    def __init__(self, store=None, max_turns=MAX_SESSION_TURNS, idle_seconds=SESSION_IDLE_SECONDS, clock=time.time):
+        self.store = store or MemoryStore()
+        self.max_turns = max_turns
+        self.idle_seconds = idle_seconds
+        self.clock = clock
+
+    def _new_state(self, user_id, summary, documents):
+        return {
+            'session_id': f"{user_id}-{uuid.uuid4().hex[:12]}",
+            'turns': 0,
+            'summary': summary,
+            'history': [],
+            'documents': documents,
+            'last_active': int(self.clock()),
+            'expires_at': int(self.clock() + STATE_TTL_SECONDS),
+        }
+
+    def begin(self, user_id):
+        """
+        The session for the user's next turn, rotating to a new one when the current one is full or idle
+        """
+        state = self.store.get(user_id)
+        if state is None:
+            return ChatSession(self._new_state(user_id, [], []))
+        if state['turns'] >= self.max_turns:
+            rotated = 'turns'
+        elif self.clock() - state['last_active'] >= self.idle_seconds:
+            rotated = 'idle'
+        else:
+            return ChatSession(state)
+        summary = fold_summary((state.get('summary') or []) + (state.get('history') or []))
+        logger.info(f"Rotating chat session {state['session_id']} after {state['turns']} turns ({rotated})")
+        return ChatSession(self._new_state(user_id, summary, state.get('documents') or []), rotated)
+
+    def record_turn(self, user_id, session, human, bot, documents=None):
+        """
+        Count the turn and add it to the session's history for the next summary
+        """
+        state = session.state
+        state['turns'] += 1
+        state['history'] = fold_summary((state.get('history') or []) + [turn_digest(human, bot)])
+        if session.cached_as:
+            state['last_input'], state['last_cache_turn'] = session.cached_as
+        titles = [doc['title'] for doc in documents or [] if doc.get('title')]
+        if titles:
+            known = [title for title in state.get('documents') or [] if title not in titles]
+            state['documents'] = (known + titles)[-MAX_DOCUMENTS:]
+        state['last_active'] = int(self.clock())
+        state['expires_at'] = int(self.clock() + STATE_TTL_SECONDS)
+        self.store.put(user_id, state)
+
+    def end(self, user_id):
+        """
+        Forget the conversation; the next turn starts a fresh session without a summary
+        """
+        state = self._new_state(user_id, [], [])
+        self.store.put(user_id, state)
+        return ChatSession(state)
+
+
+def create_session_manager():
+    return SessionManager(store=DynamoDBSessionStore(SESSION_TABLE_NAME) if SESSION_TABLE_NAME else None)
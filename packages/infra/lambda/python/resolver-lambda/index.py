@@ -15,6 +15,11 @@ from aws_lambda_powertools.logging import Logger, correlation_paths
 # graphQL imports
 from gql_utils import gql_executor, success_response, failure_response
 from gql import get_chats_by_user_id, update_chat_by_id
+from response_cache import cache_key, create_response_cache, normalize_input
+from agent_admission import AgentUnavailable, create_admission_controller
+from agent_trace import AgentTrace, should_trace
+from prompt_encoding import document_list, encode_block, report_prompt
+from chat_sessions import clip_message, create_session_manager
 
 # Initializers
 logger = Logger()
@@ -22,12 +27,13 @@ logger = Logger()
 # environment variables
 region_name = os.environ['AWS_REGION']
 graphql_endpoint = os.environ['graphql_endpoint']
-# create the bedrock agent runtime client
+# create the bedrock agent runtime client; throttling is handled by agent_admission, so
+# botocore retries once instead of queueing requests behind its own adaptive rate limiter
 config = Config(
     read_timeout=1000,
     retries=dict(
-        max_attempts=3,
-        mode='adaptive'
+        max_attempts=2,
+        mode='standard'
     ),
     # Add rate limiting
     max_pool_connections=10,
@@ -42,6 +48,10 @@ bedrock_agent_runtime = boto3.client(
 current_datetime = datetime.now()
 agentId = os.environ.get('AGENT_ID', '')
 agentAliasId = os.environ.get('AGENT_ALIAS_ID', '')
+# Repeated identical requests are answered from here instead of invoking the agent again
+response_cache = create_response_cache()
+admission = create_admission_controller()
+sessions = create_session_manager()
 
 
 def sort_by_js_date(data, date_key):
@@ -51,19 +61,6 @@ def sort_by_js_date(data, date_key):
 
     return sorted(data, key=date_converter)
 
-def escape_special_chars(text):
-    return (
-        text.replace("&", "&amp;")
-            .replace("<", "&lt;")
-            .replace(">", "&gt;")
-            .replace('"', "&quot;")
-            .replace("'", "&#39;")
-    )
-
-def create_safe_message(input_data):
-    safe_data = escape_special_chars(json.dumps(input_data, indent=4))
-    return f"<input>\n{safe_data}\n</input>"
-
 def process_bot_response(bot_response):
     # Preserve special characters and formatting
     print("process_bot_response", bot_response)
@@ -106,38 +103,47 @@ def lambda_handler(event, context):
     try:
         if args["opr"] == "chat":
             end_session = False
-            message_content = args["message"]
+            message_content, clipped = clip_message(args["message"])
+            if clipped:
+                logger.warning(f"Chat message cut from {len(args['message'])} characters")
             if "end_session" in message_content:
                 end_session = True
+            # Sessions are bounded; earlier turns reach a new session as a summary
+            session = sessions.begin(args["userID"])
 
             if "documents" in args and args["documents"]:
-                doc_info = "\nAttached Documents:\n" + "\n".join([f"- {doc['title']}" for doc in args["documents"]])
-                message_content += doc_info
+                message_content += document_list(args["documents"])
 
             print("Message message_content:", message_content)
-            try:
-                enable_trace = False
-
+            report_prompt("chat", message_content)
+            session_state = {
+                'promptSessionAttributes': {
+                    "today's date": str(current_datetime.date()),
+                    **session.prompt_attributes()
+                },
+            }
+            documents = [doc['title'] for doc in args.get("documents") or []] or (session.documents() if session.rotated else [])
+            if documents:
+                # Action groups fall back to this when the model omits the document parameter;
+                # extracted summaries are then kept in the agent session by the action groups
+                session_state['sessionAttributes'] = {
+                    'document': ",".join(documents)
+                }
+            def invoke_chat():
+                enable_trace = should_trace(args.get("trace"))
+                trace = AgentTrace("chat") if enable_trace else None
 
                 response = bedrock_agent_runtime.invoke_agent(
                     agentId=agentId,
                     agentAliasId=agentAliasId,
-                    sessionId=args["userID"],
+                    sessionId=session.session_id,
                     enableTrace=enable_trace,
                     endSession=end_session,
                     inputText=message_content,
-                    sessionState={
-                        'promptSessionAttributes': {
-                            "today's date": str(current_datetime.date())
-                        },
-                    }
+                    sessionState=session_state
                 )
 
-                if enable_trace:
-                    print("Agent response:", response)
-
                 bot_response = ''
-                metrics = {}
                 event_stream = response['completion']
 
                 for event in event_stream:
@@ -145,22 +151,41 @@ def lambda_handler(event, context):
                         data = event['chunk']['bytes']
                         bot_response = data.decode('utf8')
                         print(f"Processing chunk: {bot_response}")  # Debug print
-                        # if enable_trace:
-                        #     print(data)
-                            # print(f"Final answer ->\n{data.decode('utf8')}")
-                        
-                        # Decode and preserve formatting
-                        decoded_response = data.decode('utf8')
                         
                     elif 'trace' in event:
-                        if enable_trace:
-                            logger.info(json.dumps(event['trace'], indent=2))
+                        if trace:
+                            trace.add(event['trace'])
                     else:
                         raise Exception("unexpected event.", event)
+                if trace:
+                    trace.publish(agentAliasId)
+                return bot_response
+
+            try:
+                metrics = {'session': session.describe()}
+                if end_session:
+                    bot_response = admission.call(agentAliasId, invoke_chat)
+                    sessions.end(args["userID"])
+                else:
+                    # Scoped to the session and keyed on its turn: the same message can mean something else in
+                    # another conversation or later in this one. Input repeating the last recorded turn's is
+                    # keyed on that turn, so a resubmission within the TTL is served from cache
+                    chat_input = {"message": message_content, "sessionState": session_state}
+                    bot_response, metrics['cached'] = response_cache.get_or_invoke(
+                        cache_key(agentId, agentAliasId, "chat",
+                                  {**chat_input, "turn": session.cache_turn(chat_input)},
+                                  scope=session.session_id),
+                        "chat", lambda: admission.call(agentAliasId, invoke_chat), bypass=bool(args.get("bypass_cache"))
+                    )
+                    if not metrics['cached']:
+                        sessions.record_turn(args["userID"], session, args["message"], bot_response, args.get("documents"))
                 print(f"Final accumulated response:\n{bot_response}")  # Debug print
-                formatted_bot_response = process_bot_response(decoded_response)
+                formatted_bot_response = process_bot_response(bot_response)
                 print(f"Formatted bot response:\n{formatted_bot_response}")  # Debug print
 
+            except AgentUnavailable as e:
+                logger.warning(f"Agent call refused: {e}")
+                return failure_response(f"The assistant is busy, please try again shortly ({e})")
             except ClientError as e:
                 print(f"Error invoking agent: {e}")
                 raise
@@ -218,43 +243,55 @@ def lambda_handler(event, context):
                 }
 
                 # Format the input as expected by the agent
-                message_content = create_safe_message(input_data)
-                message_content += "Generate production-ready CSV file with vendor mapping and enriched supplier information for SAP data input: "
-                
-                enable_trace = False
-                session_id = f"csv-generation-{datetime.now().strftime('%Y%m%d%H%M%S')}-{str(uuid.uuid4())[:8]}"
-                
-                response = bedrock_agent_runtime.invoke_agent(
-                    agentId=agentId,
-                    agentAliasId=agentAliasId,
-                    sessionId=session_id,
-                    enableTrace=enable_trace,
-                    inputText=message_content
+                message_content = encode_block(normalize_input(input_data))
+                message_content += "\nGenerate production-ready CSV file with vendor mapping and enriched supplier information for SAP data input: "
+                report_prompt("generate_csv", message_content)
+
+                def invoke_csv():
+                    enable_trace = should_trace(args.get("trace"))
+                    trace = AgentTrace("generate_csv") if enable_trace else None
+                    session_id = f"csv-generation-{datetime.now().strftime('%Y%m%d%H%M%S')}-{str(uuid.uuid4())[:8]}"
+
+                    response = bedrock_agent_runtime.invoke_agent(
+                        agentId=agentId,
+                        agentAliasId=agentAliasId,
+                        sessionId=session_id,
+                        enableTrace=enable_trace,
+                        inputText=message_content
+                    )
+
+                    generated_csv = ''
+                    event_stream = response['completion']
+
+                    for event in event_stream:
+                        if 'chunk' in event:
+                            data = event['chunk']['bytes']
+                            chunk_text = data.decode('utf8')
+                            generated_csv += chunk_text  # Accumulate chunks
+                            print(f"Processing CSV chunk: {chunk_text}")
+
+                        elif 'trace' in event:
+                            if trace:
+                                trace.add(event['trace'])
+                        else:
+                            raise Exception("unexpected event.", event)
+                    if trace:
+                        trace.publish(agentAliasId)
+                    return generated_csv
+
+                # Each CSV request runs in a fresh session, so the answer depends only on the input
+                generated_csv, cached = response_cache.get_or_invoke(
+                    cache_key(agentId, agentAliasId, "generate_csv", message_content),
+                    "generate_csv", lambda: admission.call(agentAliasId, invoke_csv), bypass=bool(args.get("bypass_cache"))
                 )
 
-                if enable_trace:
-                    print("Agent response:", response)
-
-                generated_csv = ''
-                event_stream = response['completion']
-
-                for event in event_stream:
-                    if 'chunk' in event:
-                        data = event['chunk']['bytes']
-                        chunk_text = data.decode('utf8')
-                        generated_csv += chunk_text  # Accumulate chunks
-                        print(f"Processing CSV chunk: {chunk_text}")
-                        
-                    elif 'trace' in event:
-                        if enable_trace:
-                            logger.info(json.dumps(event['trace'], indent=2))
-                    else:
-                        raise Exception("unexpected event.", event)
-
-                print(f"Final CSV response:\n{generated_csv}")
+                print(f"Final CSV response (cached={cached}):\n{generated_csv}")
                 
                 return success_response(generated_csv)
 
+            except AgentUnavailable as e:
+                logger.warning(f"Agent call refused: {e}")
+                return failure_response(f"The assistant is busy, please try again shortly ({e})")
             except ClientError as e:
                 logger.error(f"Error calling Bedrock Agent: {e}")
                 return failure_response(f"Error generating CSV: {str(e)}")
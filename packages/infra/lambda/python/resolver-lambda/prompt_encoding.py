@@ -0,0 +1,97 @@
+import os
+import re
+import json
+
+from aws_lambda_powertools.logging import Logger
+from aws_lambda_powertools.metrics import EphemeralMetrics, MetricUnit
+
+logger = Logger(child=True)
+
+METRICS_NAMESPACE = os.environ.get('POWERTOOLS_METRICS_NAMESPACE', 'InvoiceAssistant')
+
+# Rough BPE behaviour: about four letters or three digits per token, punctuation one each
+_TOKEN_PIECES = re.compile(r"[A-Za-z]+|\d+|[^\sA-Za-z\d]")
+# Values printed bare in key/value blocks; anything else is written as a JSON string
+_BARE_VALUE = re.compile(r"[^\n\r<>]*")
+
+
+def prune_empty(value):
+    """
+    Drop None, empty strings and empty containers recursively; 0 and False are kept
+    """
+    if isinstance(value, dict):
+        pruned = {key: prune_empty(item) for key, item in value.items()}
+        return {key: item for key, item in pruned.items() if item not in (None, '', [], {})}
+    if isinstance(value, (list, tuple)):
+        pruned = [prune_empty(item) for item in value]
+        return [item for item in pruned if item not in (None, '', [], {})]
+    if isinstance(value, str):
+        return value.strip()
+    return value
+
+
+def minified_json(value):
+    """
+    Compact JSON; '<' is written as \\u003c so no value can open or close a delimiter tag
+    """
+    return json.dumps(value, ensure_ascii=False, separators=(',', ':'), default=str).replace('<', '\\u003c')
+
+
+def _scalar(value):
+    if isinstance(value, str) and value == value.strip() and _BARE_VALUE.fullmatch(value):
+        return value
+    return minified_json(value)
+
+
+def encode_block(data, tag='input', style='kv'):
+    """
+    Wrap data in <tag> delimiters. 'kv' writes one "key: value" line per field with
+    nested values as minified JSON; 'json' writes the whole object minified.
+    Empty fields are dropped either way.
+    """
+    data = prune_empty(data)
+    if style == 'json' or not isinstance(data, dict):
+        body = minified_json(data)
+    else:
+        body = '\n'.join(
+            f"{key}: {minified_json(value) if isinstance(value, (dict, list)) else _scalar(value)}"
+            for key, value in data.items()
+        )
+    return f"<{tag}>\n{body}\n</{tag}>"
+
+
+def document_list(documents):
+    """
+    One line naming the attached documents
+    """
+    titles = [doc['title'] for doc in documents or [] if doc.get('title')]
+    return f"\nAttached documents: {', '.join(titles)}" if titles else ''
+
+
+def estimate_tokens(text):
+    """
+    Model-agnostic token estimate, close enough to track prompt size over time
+    """
+    tokens = 0
+    for piece in _TOKEN_PIECES.findall(text or ''):
+        if piece[0].isalpha():
+            tokens += (len(piece) + 3) // 4
+        elif piece[0].isdigit():
+            tokens += (len(piece) + 2) // 3
+        else:
+            tokens += 1
+    return tokens
+
+
+def report_prompt(operation, text):
+    """
+    Record the size of one agent prompt; returns the token estimate
+    """
+    tokens = estimate_tokens(text)
+    metrics = EphemeralMetrics(namespace=METRICS_NAMESPACE)
+    metrics.add_dimension(name='Operation', value=operation)
+    metrics.add_metric(name='PromptTokensEstimate', unit=MetricUnit.Count, value=tokens)
+    metrics.add_metric(name='PromptCharacters', unit=MetricUnit.Count, value=len(text))
+    metrics.flush_metrics()
+    logger.debug(f"{operation} prompt: {len(text)} chars, ~{tokens} tokens")
+    return tokens
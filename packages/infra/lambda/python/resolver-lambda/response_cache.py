@@ -0,0 +1,163 @@
+import os
+import re
+import json
+import time
+import hashlib
+from collections import OrderedDict
+
+import boto3
+from botocore.exceptions import ClientError
+from aws_lambda_powertools.logging import Logger
+
+logger = Logger(child=True)
+
+# Shared store across Lambda instances; without it each warm instance keeps its own cache
+CACHE_TABLE_NAME = os.environ.get('RESPONSE_CACHE_TABLE', '')
+MAX_MEMORY_ENTRIES = int(os.environ.get('RESPONSE_CACHE_MAX_ENTRIES', '512'))
+# CSV generation is stateless per request; chat answers depend on session history, so they
+# are only reused briefly (double submits, re-clicks) and only within the same session
+TTL_SECONDS = {
+    'generate_csv': int(os.environ.get('CSV_RESPONSE_CACHE_TTL_SECONDS', str(24 * 3600))),
+    'chat': int(os.environ.get('CHAT_RESPONSE_CACHE_TTL_SECONDS', '120')),
+}
+# DynamoDB items are capped at 400 KB; larger responses are kept in memory only
+MAX_SHARED_ITEM_BYTES = 350 * 1024
+
+_WHITESPACE = re.compile(r'\s+')
+
+
+def normalize_input(value):
+    """
+    Canonical form of the agent input: trimmed strings with collapsed whitespace, recursively
+    """
+    if isinstance(value, str):
+        return _WHITESPACE.sub(' ', value).strip()
+    if isinstance(value, dict):
+        return {str(k): normalize_input(v) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [normalize_input(v) for v in value]
+    return value
+
+
+def cache_key(agent_id, agent_alias_id, operation, agent_input, scope=''):
+    """
+    Stable hash of everything that determines the agent's answer
+    """
+    canonical = json.dumps({
+        'agent': agent_id,
+        'alias': agent_alias_id,
+        'operation': operation,
+        'scope': scope,
+        'input': normalize_input(agent_input),
+    }, sort_keys=True, separators=(',', ':'), ensure_ascii=False, default=str)
+    return hashlib.sha256(canonical.encode('utf-8')).hexdigest()
+
+
+class MemoryStore:
+    """
+    Per-instance LRU with expiry; also the local stand-in when no table is configured
+    """
+
+    def __init__(self, max_entries=MAX_MEMORY_ENTRIES):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+
+    def get(self, key):
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        if entry['expires_at'] <= time.time():
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        return entry
+
+    def put(self, key, entry):
+        self._entries[key] = entry
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+
+class DynamoDBStore:
+    """
+    Shared store on a DynamoDB table keyed by cache_key, with TTL on expires_at.
+    Failures are logged and treated as misses so the cache never fails a request.
+    """
+
+    def __init__(self, table_name):
+        self.table = boto3.resource('dynamodb').Table(table_name)
+
+    def get(self, key):
+        try:
+            item = self.table.get_item(Key={'cache_key': key}).get('Item')
+        except ClientError as e:
+            logger.warning(f"Response cache read failed: {str(e)}")
+            return None
+        # DynamoDB deletes expired items lazily, so expiry is checked here as well
+        if not item or int(item['expires_at']) <= time.time():
+            return None
+        return {'response': item['response'], 'expires_at': int(item['expires_at']), 'created_at': item['created_at']}
+
+    def put(self, key, entry):
+        if len(entry['response'].encode('utf-8')) > MAX_SHARED_ITEM_BYTES:
+            return
+        try:
+            self.table.put_item(Item={'cache_key': key, **entry, 'expires_at': int(entry['expires_at'])})
+        except ClientError as e:
+            logger.warning(f"Response cache write failed: {str(e)}")
+
+
+class ResponseCache:
+    """
+    Agent responses keyed by cache_key: an in-memory tier in front of an optional shared store
+    """
+
+    def __init__(self, shared=None, local=None, ttl_seconds=None):
+        self.local = local or MemoryStore()
+        self.shared = shared
+        self.ttl_seconds = ttl_seconds or TTL_SECONDS
+        self.stats = {'hits': 0, 'misses': 0, 'bypassed': 0}
+
+    def enabled(self, operation):
+        return self.ttl_seconds.get(operation, 0) > 0
+
+    def get(self, key):
+        entry = self.local.get(key)
+        if entry is None and self.shared is not None:
+            entry = self.shared.get(key)
+            if entry is not None:
+                self.local.put(key, entry)
+        self.stats['hits' if entry else 'misses'] += 1
+        return entry['response'] if entry else None
+
+    def put(self, key, operation, response):
+        if not response or not self.enabled(operation):
+            return
+        now = time.time()
+        entry = {'response': response, 'created_at': int(now), 'expires_at': int(now + self.ttl_seconds[operation])}
+        self.local.put(key, entry)
+        if self.shared is not None:
+            self.shared.put(key, entry)
+
+    def get_or_invoke(self, key, operation, invoke, bypass=False):
+        """
+        Return (response, cached). bypass skips the lookup but still refreshes the entry.
+        """
+        if not self.enabled(operation):
+            return invoke(), False
+        if bypass:
+            self.stats['bypassed'] += 1
+        else:
+            start = time.perf_counter()
+            response = self.get(key)
+            if response is not None:
+                logger.info(f"Response cache hit for {operation} in {round((time.perf_counter() - start) * 1000, 2)} ms")
+                return response, True
+        response = invoke()
+        self.put(key, operation, response)
+        return response, False
+
+
+def create_response_cache():
+    return ResponseCache(shared=DynamoDBStore(CACHE_TABLE_NAME) if CACHE_TABLE_NAME else None)
@@ -0,0 +1,48 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'resolver-lambda'))
+
+from chat_sessions import SessionManager
+from response_cache import ResponseCache, MemoryStore, cache_key
+
+
+def send(sessions, cache, answers, user_id, message, documents=None):
+    """
+    The chat path of the resolver: key on the session's turn, invoke on a miss, record non-cached turns
+    """
+    session = sessions.begin(user_id)
+    chat_input = {'message': message, 'documents': documents}
+    key = cache_key('agent', 'alias', 'chat', {**chat_input, 'turn': session.cache_turn(chat_input)},
+                    scope=session.session_id)
+    response, cached = cache.get_or_invoke(key, 'chat', lambda: answers.pop(0))
+    if not cached:
+        sessions.record_turn(user_id, session, message, response)
+    return response, cached
+
+
+def test_resubmitted_message_is_served_from_cache():
+    sessions, cache = SessionManager(), ResponseCache(local=MemoryStore())
+    answers = ['first answer', 'second answer']
+
+    assert send(sessions, cache, answers, 'user1', 'total for Acme?') == ('first answer', False)
+    assert send(sessions, cache, answers, 'user1', 'total for Acme?') == ('first answer', True)
+    assert sessions.begin('user1').state['turns'] == 1
+
+
+def test_repeated_message_after_another_turn_is_not_cached():
+    sessions, cache = SessionManager(), ResponseCache(local=MemoryStore())
+    answers = ['a1', 'a2', 'a3']
+
+    send(sessions, cache, answers, 'user1', 'yes')
+    send(sessions, cache, answers, 'user1', 'and the tax?')
+    assert send(sessions, cache, answers, 'user1', 'yes') == ('a3', False)
+
+
+def test_resubmission_after_a_changed_repeat_is_served_from_cache():
+    sessions, cache = SessionManager(), ResponseCache(local=MemoryStore())
+    answers = ['a1', 'a2', 'a3']
+
+    send(sessions, cache, answers, 'user1', 'yes')
+    assert send(sessions, cache, answers, 'user1', 'yes', ['inv.pdf']) == ('a2', False)
+    assert send(sessions, cache, answers, 'user1', 'yes', ['inv.pdf']) == ('a2', True)
@@ -1,13 +1,15 @@
 import { Stack, StackProps, Aspects, Duration, aws_events_targets as targets, aws_events as events, 
-    aws_s3_deployment as s3deploy } from "aws-cdk-lib";
+    aws_s3_deployment as s3deploy, aws_sqs as sqs, aws_lambda_event_sources as eventsources } from "aws-cdk-lib";
 import { Bucket } from "aws-cdk-lib/aws-s3";
 import { Construct } from "constructs";
 import { DataAutomationProject } from "../constructs/bda-construct";
 import { AwsSolutionsChecks } from 'cdk-nag';
 import * as lambda from 'aws-cdk-lib/aws-lambda';
+import * as lambda_python from '@aws-cdk/aws-lambda-python-alpha';
 import * as iam from 'aws-cdk-lib/aws-iam';
-import * as fs from 'fs';
+import * as path from 'path';
 import * as BDAConfig from '../config/BDAConfig';
+import { commonModulesLayer } from '../constructs/cdk-helpers';
 
 interface BDAStackProps extends StackProps {
     fileBucket: Bucket;
@@ -28,11 +30,7 @@ export class BDAStack extends Stack {
             projectName: `InvoiceApp`,
             standardOutputConfiguration: BDAConfig.standardOutputConfiguration,
             customOutputConfiguration: {
-                'blueprints': [
-                    {
-                        'blueprintArn': BDAConfig.sampleBlueprints["Invoice"]
-                    }
-                ]
+                'blueprints': BDAConfig.projectBlueprints.map(blueprintArn => ({ 'blueprintArn': blueprintArn }))
             },
         });
 
@@ -48,17 +46,63 @@ export class BDAStack extends Stack {
             targetBucketKey: this.fileBucket.encryptionKey!.keyArn
         });
       
-        const rule = new events.Rule(this, 'DocumentsRule', {
-            eventPattern: {
-                source: ['aws.s3'],
-                detailType: ['Object Created'],
-                detail: {
-                    bucket: { name: [this.fileBucket.bucketName] },
-                    object: { key: [{ prefix: 'datasets' }] },
+        // Uploads are buffered in one queue per priority class (urgent/ and bulk/ folders of
+        // datasets/documents/, standard otherwise) so urgent uploads never wait behind a bulk
+        // backlog; each invocation schedules its batch fairly across tenants. A rule cannot
+        // combine a prefix with exclusions, so the standard queue receives every upload and
+        // the function drops those that belong to another queue.
+        const uploadDeadLetterQueue = new sqs.Queue(this, 'DocumentUploadDLQ', {
+            encryption: sqs.QueueEncryption.SQS_MANAGED,
+            enforceSSL: true,
+            retentionPeriod: Duration.days(14),
+        });
+        const priorityKeyPatterns = {
+            urgent: [{ wildcard: 'datasets/documents/urgent/*' }, { wildcard: 'datasets/documents/*/urgent/*' }],
+            standard: [{ prefix: 'datasets' }],
+            bulk: [{ wildcard: 'datasets/documents/bulk/*' }, { wildcard: 'datasets/documents/*/bulk/*' }],
+        };
+        const batchingWindows = { urgent: 0, standard: 20, bulk: 60 };
+        const uploadQueues: { [priority: string]: string } = {};
+        const rules: events.Rule[] = [];
+        (['urgent', 'standard', 'bulk'] as const).forEach(priority => {
+            const title = priority.charAt(0).toUpperCase() + priority.slice(1);
+            const rule = new events.Rule(this, priority === 'standard' ? 'DocumentsRule' : `${title}DocumentsRule`, {
+                eventPattern: {
+                    source: ['aws.s3'],
+                    detailType: ['Object Created'],
+                    detail: {
+                        bucket: { name: [this.fileBucket.bucketName] },
+                        object: { key: priorityKeyPatterns[priority] },
+                    },
                 },
-            },
+            });
+            const uploadQueue = new sqs.Queue(this, priority === 'standard' ? 'DocumentUploadQueue' : `${title}DocumentUploadQueue`, {
+                encryption: sqs.QueueEncryption.SQS_MANAGED,
+                enforceSSL: true,
+                // Six times the function timeout, as AWS advises for SQS event sources, so a
+                // batch still being processed is not delivered again
+                visibilityTimeout: Duration.minutes(90),
+                deadLetterQueue: { queue: uploadDeadLetterQueue, maxReceiveCount: 3 },
+            });
+            rule.addTarget(new targets.SqsQueue(uploadQueue));
+            rules.push(rule);
+            uploadQueues[priority] = uploadQueue.queueArn;
+            invokeDataAutomationLambdaFunction.addEventSource(new eventsources.SqsEventSource(uploadQueue, {
+                batchSize: 10,
+                maxBatchingWindow: Duration.seconds(batchingWindows[priority]),
+                maxConcurrency: BDAConfig.bdaSchedulerConfig.maxConcurrentBatches[priority],
+                reportBatchItemFailures: true,
+            }));
+        });
+        invokeDataAutomationLambdaFunction.addEnvironment('UPLOAD_QUEUES', this.toJsonString(uploadQueues));
+
+        // Finishes BDA jobs orphaned by timeouts or crashes from their job ledger entries
+        new events.Rule(this, 'LedgerSweepRule', {
+            schedule: events.Schedule.rate(Duration.minutes(BDAConfig.bdaSchedulerConfig.ledgerSweepMinutes)),
+            targets: [new targets.LambdaFunction(invokeDataAutomationLambdaFunction, {
+                event: events.RuleTargetInput.fromObject({ sweep: true }),
+            })],
         });
-        rule.addTarget(new targets.LambdaFunction(invokeDataAutomationLambdaFunction));
         
         const documentsDeployment = new s3deploy.BucketDeployment(this, `DeployDocuments`, {
             sources: [s3deploy.Source.asset('./lambda/python/bda-load-lambda/documents.zip')],
@@ -84,10 +128,10 @@ export class BDAStack extends Stack {
             destinationKeyPrefix: 'bda-result',
         });
         
-        documentsDeployment.node.addDependency(rule, invokeDataAutomationLambdaFunction);
-        applicationsDeployment.node.addDependency(rule, invokeDataAutomationLambdaFunction);
-        bdaResultRawDeployment.node.addDependency(rule, invokeDataAutomationLambdaFunction);
-        bdaResultDeployment.node.addDependency(rule, invokeDataAutomationLambdaFunction);
+        documentsDeployment.node.addDependency(...rules, invokeDataAutomationLambdaFunction);
+        applicationsDeployment.node.addDependency(...rules, invokeDataAutomationLambdaFunction);
+        bdaResultRawDeployment.node.addDependency(...rules, invokeDataAutomationLambdaFunction);
+        bdaResultDeployment.node.addDependency(...rules, invokeDataAutomationLambdaFunction);
     }
   
     private createInvokeDataAutomationFunction(params: {
@@ -113,18 +157,30 @@ export class BDAStack extends Stack {
             compatibleRuntimes: [lambda.Runtime.PYTHON_3_12],
         });
     
-        const lendingDocumentAutomationLambdaFunction = new lambda.Function(
+        // Bundled from the directory (not inline) so helper modules and requirements.txt ship with it
+        const lendingDocumentAutomationLambdaFunction = new lambda_python.PythonFunction(
           this,
           'invoke_data_automation',
           {
             runtime: lambda.Runtime.PYTHON_3_12,
-            handler: 'index.lambda_handler',
-            code: new lambda.InlineCode(fs.readFileSync('lambda/python/bda-load-lambda/index_bda_call.py', { encoding: 'utf-8' })),
-            timeout: Duration.seconds(300),
-            layers: [layer_boto3],
+            entry: path.join(__dirname, '../lambda/python/bda-load-lambda'),
+            index: 'index_bda_call.py',
+            handler: 'lambda_handler',
+            bundling: {
+              assetExcludes: ['*.zip'],
+            },
+            timeout: Duration.minutes(15),
+            memorySize: 1024,
+            layers: [layer_boto3, commonModulesLayer(this, 'CommonModulesLayer')],
             environment: {
               TARGET_BUCKET_NAME: params.targetBucketName,
               ACCOUNT_ID: this.account,
+              BDA_MAX_IN_FLIGHT: String(BDAConfig.bdaSchedulerConfig.maxInFlightPerBatch),
+              BDA_ROUTES: JSON.stringify(BDAConfig.bdaRoutingConfig.routes),
+              DOCUMENT_BLUEPRINTS: JSON.stringify(BDAConfig.documentBlueprints),
+              PROJECT_BLUEPRINTS: JSON.stringify(BDAConfig.projectBlueprints),
+              VENDOR_TEMPLATES: BDAConfig.vendorTemplateConfig.enabled ? 'on' : 'off',
+              FAST_PATH_MIN_CONFIDENCE: String(BDAConfig.vendorTemplateConfig.minConfidence),
               ...(params.dataProjectArn && {
                 DATA_PROJECT_ARN: params.dataProjectArn,
               }),
@@ -154,6 +210,7 @@ export class BDAStack extends Stack {
                 actions: [
                   's3:GetObject',
                   's3:PutObject',
+                  's3:DeleteObject',
                   's3:ListBucket'
                 ],
                 resources: [
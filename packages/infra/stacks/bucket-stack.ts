@@ -1,4 +1,4 @@
-import { Stack, RemovalPolicy, CfnOutput, StackProps, aws_s3_deployment as s3deploy } from "aws-cdk-lib";
+import { Stack, RemovalPolicy, CfnOutput, StackProps, Duration, aws_s3_deployment as s3deploy } from "aws-cdk-lib";
 import { Construct } from "constructs";
 import {
     BlockPublicAccess,
@@ -31,6 +31,8 @@ export class BucketStack extends Stack {
             serverAccessLogsBucket: props.projectAccessLogsBucket,
             serverAccessLogsPrefix: "data-bucket",
             enforceSSL: true,
+            // Full action-group responses spilled when they exceed the agent's response budget
+            lifecycleRules: [{ prefix: "agent-responses/", expiration: Duration.days(7) }],
             cors: [
                 {
                     allowedMethods: [HttpMethods.GET, HttpMethods.POST, HttpMethods.PUT, HttpMethods.HEAD, HttpMethods.DELETE],
@@ -1,4 +1,4 @@
-import { Stack, Duration, aws_wafv2, CfnOutput, StackProps } from "aws-cdk-lib";
+import { Stack, Duration, aws_wafv2, CfnOutput, StackProps, RemovalPolicy } from "aws-cdk-lib";
 import { lambdaArchitecture, lambdaRuntime } from "../config/AppConfig";
 import { IUserPool } from "aws-cdk-lib/aws-cognito";
 import { Construct } from "constructs";
@@ -9,6 +9,7 @@ import { Role, ServicePrincipal, PolicyStatement } from "aws-cdk-lib/aws-iam";
 import { NagSuppressions } from "cdk-nag";
 import * as path from "path";
 import { SecurityGroup, SubnetType, Vpc } from "aws-cdk-lib/aws-ec2";
+import { AttributeType, BillingMode, Table, TableEncryption } from "aws-cdk-lib/aws-dynamodb";
 
 
 interface GraphQlApiStackProps extends StackProps {
@@ -46,6 +47,35 @@ export class GraphQlApiStack extends Stack {
             // }
         });
 
+        // Agent responses shared across resolver instances; expired items are removed by DynamoDB TTL
+        const responseCacheTable = new Table(this, "ResponseCacheTable", {
+            partitionKey: { name: "cache_key", type: AttributeType.STRING },
+            billingMode: BillingMode.PAY_PER_REQUEST,
+            encryption: TableEncryption.AWS_MANAGED,
+            pointInTimeRecovery: true,
+            timeToLiveAttribute: "expires_at",
+            removalPolicy: RemovalPolicy.DESTROY,
+        });
+
+        // Per-user chat session state: the agent session in use and the summary of earlier ones
+        const chatSessionTable = new Table(this, "ChatSessionTable", {
+            partitionKey: { name: "user_id", type: AttributeType.STRING },
+            billingMode: BillingMode.PAY_PER_REQUEST,
+            encryption: TableEncryption.AWS_MANAGED,
+            pointInTimeRecovery: true,
+            timeToLiveAttribute: "expires_at",
+            removalPolicy: RemovalPolicy.DESTROY,
+        });
+
+        // Agent admission state (rate windows, concurrency leases, circuit breaker) shared by all resolver instances
+        const agentAdmissionTable = new Table(this, "AgentAdmissionTable", {
+            partitionKey: { name: "limit_key", type: AttributeType.STRING },
+            billingMode: BillingMode.PAY_PER_REQUEST,
+            encryption: TableEncryption.AWS_MANAGED,
+            timeToLiveAttribute: "expires_at",
+            removalPolicy: RemovalPolicy.DESTROY,
+        });
+
         this.resolverLambda = new PythonFunction(this, `resolver-function`, {
             functionName: `resolver-function`,
             entry: path.join(__dirname, "..", "lambda", "python", "resolver-lambda"),
@@ -58,7 +88,10 @@ export class GraphQlApiStack extends Stack {
             timeout: Duration.minutes(15), // increased timeout to test Bedrock batch inference
             environment: {
                 "AGENT_ID": props.bedrockAgentId,
-                "AGENT_ALIAS_ID": props.bedrockAgentAliasId
+                "AGENT_ALIAS_ID": props.bedrockAgentAliasId,
+                "RESPONSE_CACHE_TABLE": responseCacheTable.tableName,
+                "CHAT_SESSION_TABLE": chatSessionTable.tableName,
+                "AGENT_ADMISSION_TABLE": agentAdmissionTable.tableName
             },
             vpc: props.vpc,
             vpcSubnets: {
@@ -67,6 +100,10 @@ export class GraphQlApiStack extends Stack {
             securityGroups: [props.defaultSecurityGroup],
         })
 
+        responseCacheTable.grantReadWriteData(this.resolverLambda);
+        chatSessionTable.grantReadWriteData(this.resolverLambda);
+        agentAdmissionTable.grantReadWriteData(this.resolverLambda);
+
         // add bedrock invoke permissions to resolver lambda 
         this.resolverLambda.addToRolePolicy(new PolicyStatement({
             actions: ["bedrock:InvokeModel", "bedrock:InvokeModelWithResponseStream", "bedrock:InvokeAgent"],
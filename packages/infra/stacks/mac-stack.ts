@@ -1,14 +1,16 @@
-import { Stack, StackProps, aws_bedrock as _bedrock } from 'aws-cdk-lib';
+import { Stack, StackProps, aws_bedrock as _bedrock, aws_events as events, aws_events_targets as targets } from 'aws-cdk-lib';
 import { Construct } from 'constructs';
 import * as lambda from 'aws-cdk-lib/aws-lambda';
 import * as lambda_python from '@aws-cdk/aws-lambda-python-alpha';
 import * as iam from 'aws-cdk-lib/aws-iam';
+import * as dynamodb from 'aws-cdk-lib/aws-dynamodb';
 import * as path from 'path';
 import * as cdk from 'aws-cdk-lib';
 import { bedrock } from '@cdklabs/generative-ai-cdk-constructs';
 import { AgentActionGroup } from '@cdklabs/generative-ai-cdk-constructs/lib/cdk-lib/bedrock';
 import * as MACConfig from '../config/MACConfig';
 import { lambdaArchitecture, lambdaRuntime } from "../config/AppConfig";
+import { commonModulesLayer } from "../constructs/cdk-helpers";
 
 
 export class MacStack extends Stack {
@@ -87,6 +89,18 @@ export class MacStack extends Stack {
             }
         });
 
+        // Recorded invoices, keyed on invoice_id so replayed writes are idempotent
+        const invoiceTable = new dynamodb.Table(this, 'InvoiceTable', {
+            partitionKey: { name: 'invoice_id', type: dynamodb.AttributeType.STRING },
+            billingMode: dynamodb.BillingMode.PAY_PER_REQUEST,
+            encryption: dynamodb.TableEncryption.AWS_MANAGED,
+            pointInTimeRecovery: true,
+            removalPolicy: cdk.RemovalPolicy.DESTROY,
+        });
+
+        // key_layout, result_stream, metrics and invoice_fields, shared with the BDA load function
+        const commonModules = commonModulesLayer(this, 'CommonModulesLayer');
+
         /* INVOICE APP ASSISTANT AGENT + action group */
         const InvoiceProcessingActionGroup_lambda = new lambda_python.PythonFunction(this, 'InvoiceProcessingActionGroup_lambda', {
             runtime: lambdaRuntime,
@@ -94,12 +108,15 @@ export class MacStack extends Stack {
             handler: 'lambda_handler',
             index: 'invoice_processing_function.py',
             entry: path.join(__dirname, '../lambda/python/bedrock-action-group-lambda'),
+            layers: [commonModules],
             timeout: cdk.Duration.minutes(5),
             memorySize: 1024,
             environment: {
-                "ACCOUNT_ID": Stack.of(this).account
+                "ACCOUNT_ID": Stack.of(this).account,
+                "INVOICE_TABLE_NAME": invoiceTable.tableName
             },
         });
+        invoiceTable.grantReadWriteData(InvoiceProcessingActionGroup_lambda);
 
         InvoiceProcessingActionGroup_lambda.addToRolePolicy(new iam.PolicyStatement({
             actions: [
@@ -112,6 +129,84 @@ export class MacStack extends Stack {
             resources: ["*"],
         }));
 
+        // Rolls bda-result/*.json into partitioned Parquet under bda-analytics/ for reporting;
+        // shares the action group's code so field normalization stays identical
+        const ResultsCompaction_lambda = new lambda_python.PythonFunction(this, 'ResultsCompaction_lambda', {
+            runtime: lambdaRuntime,
+            architecture: lambdaArchitecture,
+            handler: 'lambda_handler',
+            index: 'results_compaction.py',
+            entry: path.join(__dirname, '../lambda/python/bedrock-action-group-lambda'),
+            layers: [commonModules],
+            timeout: cdk.Duration.minutes(15),
+            memorySize: 2048,
+            // A single writer keeps the compaction manifest and partition rewrites consistent
+            reservedConcurrentExecutions: 1,
+            environment: {
+                "ACCOUNT_ID": Stack.of(this).account,
+            },
+        });
+
+        ResultsCompaction_lambda.addToRolePolicy(new iam.PolicyStatement({
+            actions: [
+                "s3:GetObject",
+                "s3:PutObject",
+                "s3:DeleteObject",
+                "s3:ListBucket",
+                "kms:Decrypt",
+                "kms:Encrypt",
+                "kms:GenerateDataKey*"
+            ],
+            resources: ["*"],
+        }));
+
+        new events.Rule(this, 'ResultsCompactionSchedule', {
+            schedule: events.Schedule.rate(cdk.Duration.minutes(MACConfig.analyticsConfig.compactionIntervalMinutes)),
+            targets: [new targets.LambdaFunction(ResultsCompaction_lambda)],
+        });
+
+        // Publishes supplier master uploads to the vendor index: SupplierList.csv as a full
+        // rebuild, supplier-changes/*.csv as delta segments that warm lambdas pick up by ETag
+        const SupplierIngest_lambda = new lambda_python.PythonFunction(this, 'SupplierIngest_lambda', {
+            runtime: lambdaRuntime,
+            architecture: lambdaArchitecture,
+            handler: 'lambda_handler',
+            index: 'supplier_ingest.py',
+            entry: path.join(__dirname, '../lambda/python/bedrock-action-group-lambda'),
+            layers: [commonModules],
+            timeout: cdk.Duration.minutes(15),
+            memorySize: 2048,
+            // Change files are applied one at a time, in arrival order
+            reservedConcurrentExecutions: 1,
+            environment: {
+                "ACCOUNT_ID": Stack.of(this).account,
+            },
+        });
+
+        SupplierIngest_lambda.addToRolePolicy(new iam.PolicyStatement({
+            actions: [
+                "s3:GetObject",
+                "s3:PutObject",
+                "s3:ListBucket",
+                "kms:Decrypt",
+                "kms:Encrypt",
+                "kms:GenerateDataKey*"
+            ],
+            resources: ["*"],
+        }));
+
+        new events.Rule(this, 'SupplierMasterRule', {
+            eventPattern: {
+                source: ['aws.s3'],
+                detailType: ['Object Created'],
+                detail: {
+                    bucket: { name: [`data-bucket-${Stack.of(this).account}-${Stack.of(this).region}`] },
+                    object: { key: [{ prefix: 'SupplierList.csv' }, { prefix: 'supplier-changes/' }] },
+                },
+            },
+            targets: [new targets.LambdaFunction(SupplierIngest_lambda, { retryAttempts: 4 })],
+        });
+
         const InvoiceProcessingActionGroup = new AgentActionGroup({
             name: `invoice_processing_action_group`,
             description: 'Handle invoice processing, document verification, and data extraction.',
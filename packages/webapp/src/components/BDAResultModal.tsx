@@ -170,7 +170,9 @@ export const BDAResultModal = ({ visible, onDismiss, bdaResult, fileName }: BDAR
                 <Alert type="info">
                     <Box>
                         <strong>Document:</strong> {String(fileName)}<br/>
-                        <strong>Processing Status:</strong> <StatusIndicator type="success">Completed</StatusIndicator><br/>
+                        <strong>Processing Status:</strong> {bdaResult.status === 'SKIPPED'
+                            ? <StatusIndicator type="warning">Skipped: {String(bdaResult.reason || 'not a supported document')}</StatusIndicator>
+                            : <StatusIndicator type="success">Completed</StatusIndicator>}<br/>
                         <strong>Document Type:</strong> {String(bdaResult.document_class?.type || 'Unknown')}<br/>
                         <strong>Confidence:</strong> {bdaResult.matched_blueprint?.confidence ? `${(bdaResult.matched_blueprint.confidence * 100).toFixed(1)}%` : 'N/A'}
                     </Box>
@@ -4,6 +4,9 @@ import { QUERY_KEYS } from "../utils/types";
 import { supplierMatcher, MatchResult } from "../services/supplierMatching";
 
 export interface BDAResult {
+    // Set to SKIPPED, with the reason, for uploads the pre-classifier did not send to BDA
+    status?: string;
+    reason?: string;
     matched_blueprint?: {
         arn?: string;
         name?: string;
@@ -20,7 +20,7 @@ import { useBDAResults, findBDAResultForFile, BDAResult } from '../hooks/useBDAR
 interface ProcessedFile {
     fileName: string;
     uploadTime: Date;
-    status: 'uploaded' | 'processing' | 'completed' | 'error';
+    status: 'uploaded' | 'processing' | 'completed' | 'skipped' | 'error';
     bdaResult?: BDAResult;
     errorMessage?: string;
 }
@@ -113,6 +113,14 @@ export const FileProcessor = () => {
                         const bdaResult = findBDAResultForFile(file.fileName, bdaResults);
                         console.log('🚀 ~ FileProcessor ~ bdaResult for', file.fileName, ':', bdaResult);
                         
+                        if (bdaResult?.status === 'SKIPPED') {
+                            return {
+                                ...file,
+                                status: 'skipped' as const,
+                                bdaResult,
+                                errorMessage: bdaResult.reason
+                            };
+                        }
                         if (bdaResult) {
                             return {
                                 ...file,
@@ -136,6 +144,8 @@ export const FileProcessor = () => {
                 return <StatusIndicator type="in-progress">Processing</StatusIndicator>;
             case 'completed':
                 return <StatusIndicator type="success">Completed</StatusIndicator>;
+            case 'skipped':
+                return <StatusIndicator type="warning">Skipped</StatusIndicator>;
             case 'error':
                 return <StatusIndicator type="error">Error</StatusIndicator>;
             default:
@@ -196,6 +206,11 @@ export const FileProcessor = () => {
                                         <Box color="text-body-secondary" fontSize="body-s">
                                             Uploaded: {file.uploadTime ? file.uploadTime.toLocaleString() : 'Unknown time'}
                                         </Box>
+                                        {file.status === 'skipped' && (
+                                            <Box color="text-status-warning" fontSize="body-s">
+                                                Not processed: {file.errorMessage || 'not a supported document'}
+                                            </Box>
+                                        )}
                                     </div>
                                     <div>
                                         {getStatusIndicator(file.status)}